@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'main.middleware.StaticFilesMiddleware',
+    'main.instrumentation.PerformanceMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -70,17 +73,46 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
+# Асинхронные представления каталога (main/async_views.py); config/asgi.py
+# включает их по умолчанию, под WSGI работают синхронные
+ASYNC_VIEWS = os.environ.get('ECOHOME_ASYNC_VIEWS') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# SQLite в рабочем режиме (main/db.py): постоянные соединения, запись через
+# BEGIN IMMEDIATE - в очередь по timeout, а не "database is locked". Чтение
+# каталога идёт через отдельное соединение только для чтения
+# (main.db.CatalogReadRouter). PRAGMA рабочего профиля (WAL,
+# synchronous=NORMAL, mmap) - только при ECOHOME_SQLITE_TUNING=1: WAL
+# остаётся в файле базы, а в разработке и тестах нужен режим по умолчанию.
+SQLITE_TUNING = os.environ.get('ECOHOME_SQLITE_TUNING') == '1'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 5,
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    'catalog_read': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{BASE_DIR / 'db.sqlite3'}?mode=ro",
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'timeout': 5},
+        # В тестах - то же соединение, что и default
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['main.db.CatalogReadRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -117,6 +149,19 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# collectstatic кладёт файлы с хэшем в имени и сжатые .gz/.br копии;
+# в режиме разработки статика отдаётся как есть
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+                   else 'main.storage.CompressedManifestStaticFilesStorage',
+    },
+}
 
 
 AUTH_USER_MODEL = 'main.CustomUser'
@@ -124,7 +169,60 @@ AUTH_USER_MODEL = 'main.CustomUser'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Потоки фоновой генерации уменьшенных копий изображений
+IMAGE_WORKERS = 2
+
 
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Сессии читаются через кэш, в БД пишутся только при изменении данных.
+# Кэш при этом должен быть общим для процессов (см. CACHES ниже): с
+# LocMemCache main.sessions читает сессии прямо из БД, иначе выход в одном
+# процессе не сбросил бы сессию в кэше остальных.
+# Истёкшие сессии чистит manage.py cleanup_sessions (или clearsessions).
+SESSION_ENGINE = 'main.sessions'
 SESSION_COOKIE_AGE = 1209600
 
+
+
+# Кэш: дерево категорий, фасеты, страницы каталога.
+# Для нескольких процессов на одной машине подойдёт файловый бэкенд:
+# 'django.core.cache.backends.filebased.FileBasedCache', LOCATION = BASE_DIR / 'cache'
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ecohome',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+
+# Письма (подтверждение заказа, приветствие) отправляют воркеры очереди
+# задач: manage.py run_workers. Локально письма печатаются в консоль воркера.
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'EcoHome <noreply@ecohome.local>'
+
+# Замеры запросов (main.instrumentation): заголовок Server-Timing,
+# лог медленных SQL и перцентили по маршрутам в perf_routes.log.
+# Замеряется доля запросов PERF_SAMPLE_RATE (1 - все, 0 - ни одного).
+PERF_SAMPLE_RATE = float(os.environ.get('ECOHOME_PERF_SAMPLE_RATE', '0.1'))
+PERF_SLOW_QUERY_MS = 100
+PERF_FLUSH_INTERVAL = 60
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+        'perf_routes': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.environ.get('ECOHOME_PERF_LOG', BASE_DIR / 'perf_routes.log'),
+            'maxBytes': 5 * 1024 * 1024,
+            'backupCount': 5,
+            'encoding': 'utf-8',
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'main.performance': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+        'main.performance.routes': {'handlers': ['perf_routes'], 'level': 'INFO', 'propagate': False},
+    },
+}
@@ -1,6 +1,17 @@
-from django.contrib import admin
+import csv
+
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, Category, Product, Order, OrderItem, Review 
+from django.core.paginator import Paginator
+from django.db import OperationalError, connection, transaction
+from django.db.models import Count, Q
+from django.http import StreamingHttpResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from . import page_cache, ratings, rollups, search, tasks
+from .models import CustomUser, Category, Product, Order, OrderItem, Review, Task
 
 # Кастомный администратор для пользователей
 class CustomUserAdmin(UserAdmin):
@@ -10,10 +21,234 @@ class CustomUserAdmin(UserAdmin):
         ('Дополнительная информация', {'fields': ('role', 'phone', 'address')}),
     )
 
+# Оценка числа строк вместо COUNT(*) для больших таблиц без фильтров
+ESTIMATE_THRESHOLD = 10000
+# Первичные ключи - 64-битные: большее число база не примет
+MAX_ID = 2 ** 63 - 1
+
+def _search_id(search_term):
+    """id из строки поиска или None. isdigit() пропустил бы '²' и числа больше 64 бит."""
+    if search_term.isdecimal() and int(search_term) <= MAX_ID:
+        return int(search_term)
+    return None
+
+def _estimated_rows(model):
+    if connection.vendor != 'sqlite':
+        return None
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        try:
+            # Статистика ANALYZE: первое число stat - число строк таблицы
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+            row = cursor.fetchone()
+        except OperationalError:
+            row = None
+        if row:
+            return int(row[0].split()[0])
+        # Без ANALYZE - максимальный id (берётся из индекса первичного ключа)
+        cursor.execute(f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}')
+        return cursor.fetchone()[0] or 0
+
+class EstimatedCountPaginator(Paginator):
+    """Для списка без фильтров и поиска берёт оценку числа строк, а не COUNT(*)."""
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = _estimated_rows(self.object_list.model)
+            if estimate is not None and estimate >= ESTIMATE_THRESHOLD:
+                return estimate
+        return super().count
+
+class ScalableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Не считать всю таблицу ради "N из M" при фильтрации
+    show_full_result_count = False
+    list_per_page = 50
+
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ['name', 'parent', 'slug']
+    list_select_related = ['parent']
+    search_fields = ['name']
+    prepopulated_fields = {'slug': ['name']}
+
+class ProductAdmin(ScalableAdmin):
+    list_display = ['name', 'sku', 'category', 'price', 'stock_quantity', 'is_active', 'updated_at']
+    list_filter = ['is_active', 'category']
+    list_select_related = ['category']
+    # Поиск идёт по индексу FTS5 (см. get_search_results)
+    search_fields = ['name']
+    search_help_text = 'Название, описание или материал; артикул или id - точное совпадение'
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        pk = _search_id(search_term)
+        if pk is not None:
+            return queryset.filter(Q(pk=pk) | Q(sku=search_term)), False
+        ids, _ = search.search(search_term, limit=1000)
+        return queryset.filter(Q(pk__in=ids) | Q(sku=search_term)), False
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    fields = ['product', 'quantity', 'unit_price']
+    autocomplete_fields = ['product']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+
+    def has_change_permission(self, request, obj=None):
+        # Позиции оформленного заказа не правим: от них считаются итоги продаж.
+        # Только для чтения - и без отдельного запроса товара на каждую строку
+        return False
+
+def _status_action(status, label):
+    def action(modeladmin, request, queryset):
+        with transaction.atomic():
+            # Отмена и возврат из отмены меняют итоги продаж - пересчитываем
+            # их пакетно, сам статус меняется одним UPDATE
+            if rollups.is_counted(status):
+                moved = queryset.filter(status__in=rollups.EXCLUDED_STATUSES)
+                sign = 1
+            else:
+                moved = queryset.exclude(status__in=rollups.EXCLUDED_STATUSES)
+                sign = -1
+            moved = list(moved.values_list('pk', 'created_at'))
+            # Заказы, ещё ждущие в очереди, воркер учтёт уже с новым статусом
+            queued = rollups.queued(pk for pk, _ in moved)
+            rollups.apply_orders([(pk, created_at) for pk, created_at in moved if pk not in queued], sign)
+            updated = queryset.update(status=status)
+        modeladmin.message_user(request, f'Статус «{label}» установлен заказам: {updated}', messages.SUCCESS)
+    action.__name__ = f'set_status_{status}'
+    action.short_description = f'Статус: {label}'
+    return action
+
+class _Echo:
+    def write(self, value):
+        return value
+
+ORDER_EXPORT_FIELDS = (
+    ('id', '№'),
+    ('created_at', 'Дата'),
+    ('status', 'Статус'),
+    ('user__username', 'Пользователь'),
+    ('guest_name', 'Имя гостя'),
+    ('guest_email', 'Email гостя'),
+    ('phone', 'Телефон'),
+    ('address', 'Адрес'),
+    ('total_amount', 'Сумма'),
+)
+
+class OrderAdmin(ScalableAdmin):
+    list_display = ['id', 'created_at', 'status', 'user', 'guest_email', 'item_count', 'total_amount']
+    list_filter = ['status', 'created_at']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+    inlines = [OrderItemInline]
+    search_fields = ['id']
+    search_help_text = 'Номер заказа, email гостя или имя пользователя (точное совпадение)'
+    actions = [_status_action(status, label) for status, label in Order.STATUS_CHOICES]
+    change_list_template = 'admin/main/order/change_list.html'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(item_count=Count('items'))
+
+    @admin.display(description='Позиций', ordering='item_count')
+    def item_count(self, obj):
+        return obj.item_count
+
+    def get_search_results(self, request, queryset, search_term):
+        # Только точные совпадения по индексированным полям
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        pk = _search_id(search_term)
+        if pk is not None:
+            return queryset.filter(pk=pk), False
+        if '@' in search_term:
+            return queryset.filter(guest_email=search_term), False
+        return queryset.filter(user__username=search_term), False
+
+    def get_urls(self):
+        return [
+            path('export/', self.admin_site.admin_view(self.export_csv), name='main_order_export'),
+        ] + super().get_urls()
+
+    def export_csv(self, request):
+        """Потоковая выгрузка заказов с фильтрами и поиском текущего списка."""
+        changelist = self.get_changelist_instance(request)
+        orders = changelist.queryset.order_by('pk')
+        fields = [name for name, _ in ORDER_EXPORT_FIELDS]
+        writer = csv.writer(_Echo())
+
+        def rows():
+            # BOM - чтобы Excel открыл файл в UTF-8
+            yield '\ufeff' + writer.writerow([title for _, title in ORDER_EXPORT_FIELDS])
+            for row in orders.values_list(*fields).iterator(chunk_size=2000):
+                yield writer.writerow(row)
+
+        response = StreamingHttpResponse(rows(), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="orders.csv"'
+        return response
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        query = request.GET.urlencode()
+        extra_context['export_url'] = reverse('admin:main_order_export') + ('?' + query if query else '')
+        return super().changelist_view(request, extra_context)
+
+class OrderItemAdmin(ScalableAdmin):
+    list_display = ['order', 'product', 'quantity', 'unit_price']
+    list_select_related = ['order', 'product']
+    raw_id_fields = ['order', 'product']
+
+class ReviewAdmin(ScalableAdmin):
+    list_display = ['product', 'user', 'rating', 'is_approved', 'created_at']
+    list_filter = ['is_approved', 'rating']
+    list_select_related = ['product', 'user']
+    raw_id_fields = ['user']
+    autocomplete_fields = ['product']
+    actions = ['approve', 'unapprove']
+
+    def _set_approved(self, request, queryset, value):
+        with transaction.atomic():
+            product_ids = set(queryset.exclude(is_approved=value).values_list('product_id', flat=True))
+            updated = queryset.update(is_approved=value, updated_at=timezone.now())
+            # UPDATE не вызывает сигналы - пересчитываем рейтинг затронутых товаров
+            ratings.recount(product_ids)
+        page_cache.invalidate()
+        return updated
+
+    @admin.action(description='Одобрить выбранные отзывы')
+    def approve(self, request, queryset):
+        updated = self._set_approved(request, queryset, True)
+        self.message_user(request, f'Одобрено отзывов: {updated}', messages.SUCCESS)
+
+    @admin.action(description='Снять одобрение')
+    def unapprove(self, request, queryset):
+        updated = self._set_approved(request, queryset, False)
+        self.message_user(request, f'Снято одобрение: {updated}', messages.SUCCESS)
+
+class TaskAdmin(ScalableAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'run_after', 'locked_by', 'created_at']
+    list_filter = ['status', 'name']
+    readonly_fields = ['name', 'payload', 'status', 'attempts', 'run_after', 'locked_by', 'locked_until',
+                       'last_error', 'created_at']
+    actions = ['requeue']
+
+    @admin.action(description='Вернуть в очередь')
+    def requeue(self, request, queryset):
+        updated = tasks.requeue(queryset)
+        self.message_user(request, f'Возвращено в очередь: {updated}', messages.SUCCESS)
+
 # Регистрация моделей
 admin.site.register(CustomUser, CustomUserAdmin)
-admin.site.register(Category)
-admin.site.register(Product)
-admin.site.register(Order)
-admin.site.register(OrderItem)
-admin.site.register(Review)
+admin.site.register(Category, CategoryAdmin)
+admin.site.register(Product, ProductAdmin)
+admin.site.register(Order, OrderAdmin)
+admin.site.register(OrderItem, OrderItemAdmin)
+admin.site.register(Review, ReviewAdmin)
+admin.site.register(Task, TaskAdmin)
@@ -0,0 +1,130 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import render
+
+from . import category_tree, facets, feed, http_cache, page_cache, ranking, recommendations
+from .models import Product, Review
+from .pagination import DEFAULT_SORT, SORT_ORDERS, akeyset_paginate
+from .views import BESTSELLERS_COUNT, CATALOG_PAGE_SIZE, REVIEWS_PAGE_SIZE, SORT_LABELS, _catalog_url, _facet_links
+
+# Асинхронные версии представлений, которые только читают каталог.
+# Подключаются в urls.py при ASYNC_VIEWS = True (так по умолчанию под
+# config/asgi.py). Запросы идут через async ORM (aget, async for),
+# независимые запросы одной страницы запускаются через asyncio.gather.
+# Ключи кэша и шаблоны - те же, что у синхронных версий в views.py.
+
+get_tree = sync_to_async(category_tree.get_tree)
+get_facet_counts = sync_to_async(facets.get_counts)
+get_recommendations = sync_to_async(recommendations.for_product)
+get_bestsellers = sync_to_async(ranking.top)
+
+
+async def _render(request, template_name, context):
+    # Шаблоны и контекст-процессоры читают request.user синхронно -
+    # загружаем пользователя (и сессию) заранее
+    request.user = await request.auser()
+    return render(request, template_name, context)
+
+
+async def home(request):
+    return await _render(request, 'home.html', {'products': await get_bestsellers()})
+
+
+@http_cache.conditional(http_cache.catalog_stamp)
+async def catalog(request):
+    category_id = request.GET.get('category')
+    sort = request.GET.get('sort', DEFAULT_SORT)
+    if sort not in SORT_ORDERS:
+        sort = DEFAULT_SORT
+    filters = facets.parse_filters(request.GET)
+
+    tree = await get_tree()
+    category = tree.get(category_id)
+    if category_id:
+        products = Product.objects.filter(category_id__in=tree.descendant_ids(category_id), is_active=True)
+    else:
+        products = Product.objects.filter(is_active=True)
+    products = facets.apply_filters(products, filters)
+
+    field, descending = SORT_ORDERS[sort]
+    cursor = request.GET.get('after')
+
+    async def build():
+        return await akeyset_paginate(products, field, descending, cursor=cursor, per_page=CATALOG_PAGE_SIZE)
+
+    # Страница товаров и счётчики фасетов друг от друга не зависят
+    page, counts = await asyncio.gather(
+        page_cache.aget_or_build(
+            page_cache.make_key('catalog', category_id, sort, filters['price'], filters['material'],
+                                filters['in_stock'], cursor),
+            build,
+        ),
+        get_facet_counts(category_id),
+    )
+
+    return await _render(request, 'catalog.html', {
+        'products': page,
+        'page': page,
+        'sort': sort,
+        'sort_links': [
+            {'label': SORT_LABELS[key], 'url': _catalog_url(request, sort=key), 'active': key == sort}
+            for key in SORT_ORDERS
+        ],
+        'first_page_url': _catalog_url(request),
+        'next_page_url': _catalog_url(request, after=page.next_cursor) if page.has_next else None,
+        'filters': filters,
+        'facets': _facet_links(request, filters, counts),
+        'categories': tree.ordered(),
+        'bestsellers': await get_bestsellers(category['id'], BESTSELLERS_COUNT) if category and not cursor else [],
+    })
+
+
+@http_cache.conditional(http_cache.product_stamp)
+async def product_detail(request, product_id):
+    cursor = request.GET.get('reviews_after')
+
+    async def get_product():
+        try:
+            return await Product.objects.select_related('category').aget(id=product_id)
+        except Product.DoesNotExist:
+            raise Http404('Товар не найден')
+
+    async def build():
+        # Отзывы и рекомендации фильтруем по product_id, поэтому ждать товар не нужно
+        return await asyncio.gather(
+            get_product(),
+            akeyset_paginate(
+                Review.objects.filter(product_id=product_id, is_approved=True).select_related('user'),
+                'created_at', True, cursor=cursor, per_page=REVIEWS_PAGE_SIZE,
+            ),
+            get_recommendations(product_id),
+        )
+
+    product, reviews, related = await page_cache.aget_or_build(
+        page_cache.make_key('product', product_id, cursor), build)
+    product.stock_quantity, product.reserved = await sync_to_async(http_cache.product_stock)(
+        request, product.pk) or (0, 0)
+    return await _render(request, 'product.html', {
+        'product': product,
+        'reviews': reviews,
+        'related_products': related,
+    })
+
+
+async def api_products(request):
+    output = request.GET.get('format', 'ndjson')
+    if output not in ('ndjson', 'json'):
+        return JsonResponse({'error': 'format: ndjson или json'}, status=400)
+    try:
+        fields = feed.parse_fields(request.GET.get('fields'))
+        products = await sync_to_async(feed.build_queryset)(request.GET)
+    except feed.FeedError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    if output == 'json':
+        return StreamingHttpResponse(feed.astream_json(products, fields),
+                                     content_type='application/json; charset=utf-8')
+    return StreamingHttpResponse(feed.astream_ndjson(products, fields),
+                                 content_type='application/x-ndjson; charset=utf-8')
@@ -0,0 +1,358 @@
+import asyncio
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from django.db import connections
+from django.urls import reverse
+
+# Нагрузочный прогон внутри процесса: запросы подаются прямо в WSGI- или
+# ASGI-обработчик Django, без сетевого сервера. Меряется стек Django
+# (middleware, представления, ORM, шаблоны) в двух режимах развёртывания;
+# накладные расходы конкретного сервера (gunicorn, uvicorn) сюда не входят.
+
+
+def percentile(values, pct):
+    """Перцентиль по ближайшему рангу; values должны быть отсортированы."""
+    if not values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize(latencies, elapsed, errors=0):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def _split(path):
+    path, _, query = path.partition('?')
+    return path, query
+
+
+def run_wsgi(handler, paths, total, concurrency):
+    """total запросов по кругу из paths в concurrency потоков."""
+    counter = iter(range(total))
+    lock = threading.Lock()
+    latencies, errors = [], []
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            path, query = _split(paths[i % len(paths)])
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+                'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SCRIPT_NAME': '',
+                'HTTP_HOST': 'localhost', 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+                'wsgi.errors': None, 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+            }
+            status = []
+            started = time.perf_counter()
+            body = handler(environ, lambda s, headers, exc_info=None: status.append(s))
+            for _ in body:
+                pass
+            if hasattr(body, 'close'):
+                body.close()
+            latencies.append(time.perf_counter() - started)
+            if not status[0].startswith('200'):
+                errors.append(status[0])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    return summarize(latencies, time.perf_counter() - started, len(errors))
+
+
+def run_asgi(handler, paths, total, concurrency):
+    """total запросов по кругу из paths в concurrency корутинах одного цикла событий."""
+    latencies, errors = [], []
+
+    async def one(path):
+        path, query = _split(path)
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+            'query_string': query.encode(), 'root_path': '',
+            'headers': [(b'host', b'localhost')],
+            'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+        }
+        status = []
+        messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+        never = asyncio.Event()
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # Django слушает разрыв соединения, пока работает представление
+            await never.wait()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        started = time.perf_counter()
+        await handler(scope, receive, send)
+        latencies.append(time.perf_counter() - started)
+        if status[0] != 200:
+            errors.append(status[0])
+
+    async def main():
+        counter = iter(range(total))
+
+        async def worker():
+            for i in counter:
+                await one(paths[i % len(paths)])
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    started = time.perf_counter()
+    asyncio.run(main())
+    return summarize(latencies, time.perf_counter() - started, len(errors))
+
+
+# Прогон всех маршрутов main/urls.py тестовым клиентом: задержки и
+# число SQL-запросов по каждому маршруту. Общий для регрессионных
+# тестов (main/tests.py) и команды bench_routes.
+
+# Верхняя граница числа запросов при холодном кэше (замерено на seed_data,
+# с запасом на худший случай: checkout и remove - с непустой корзиной).
+# Маршрут без бюджета - ошибка теста: новый URL должен сразу получить
+# свою границу, а лишний запрос в существующем маршруте - повод разобраться.
+QUERY_BUDGETS = {
+    'home': 1,
+    'catalog': 5,
+    'product_detail': 4,
+    'search': 2,
+    'register': 0,
+    'login': 0,
+    'logout': 4,
+    'cart': 5,
+    'api_products': 2,
+    'api_cart': 5,
+    'api_cart_add': 17,
+    'api_cart_update': 12,
+    'api_cart_remove': 12,
+    'api_cart_sync': 14,
+    'profile': 4,
+    'about': 0,
+    'contacts': 0,
+    'checkout': 20,
+    'admin_panel': 4,
+}
+
+BENCH_USERS = {'customer': 'bench-customer', 'staff': 'bench-staff'}
+
+
+def _json(data):
+    return {'data': json.dumps(data), 'content_type': 'application/json'}
+
+
+def route_cases(product_id, category_id):
+    """name -> (метод, пользователь, функция номера итерации -> (путь, параметры запроса))."""
+    product = reverse('product_detail', args=[product_id])
+    return {
+        'home': ('get', None, lambda i: ('/', {})),
+        'catalog': ('get', None, lambda i: ('/catalog/', {'data': {'category': category_id, 'sort': 'price'}})),
+        'product_detail': ('get', None, lambda i: (product, {})),
+        'search': ('get', None, lambda i: ('/search/', {'data': {'q': 'бамбуковая щетка'}})),
+        'register': ('get', None, lambda i: ('/register/', {})),
+        'login': ('get', None, lambda i: ('/login/', {})),
+        'logout': ('get', 'customer', lambda i: ('/logout/', {})),
+        'cart': ('get', 'customer', lambda i: ('/cart/', {})),
+        'api_products': ('get', None, lambda i: ('/api/products/', {'data': {'category': category_id}})),
+        'api_cart': ('get', 'customer', lambda i: ('/api/cart/', {})),
+        'api_cart_add': ('post', 'customer', lambda i: (
+            '/api/cart/add/', _json({'product_id': product_id, 'quantity': 1}))),
+        'api_cart_update': ('post', 'customer', lambda i: (
+            '/api/cart/update/', _json({'product_id': product_id, 'quantity': 2}))),
+        'api_cart_remove': ('post', 'customer', lambda i: (
+            '/api/cart/remove/', _json({'product_id': product_id}))),
+        'api_cart_sync': ('post', 'customer', lambda i: (
+            '/api/cart/sync/', _json({'items': [{'product_id': product_id, 'quantity': 3}]}))),
+        'profile': ('get', 'customer', lambda i: ('/profile/', {})),
+        'about': ('get', None, lambda i: ('/about/', {})),
+        'contacts': ('get', None, lambda i: ('/contacts/', {})),
+        'checkout': ('post', 'customer', lambda i: ('/checkout/', {'data': {
+            'address': 'Ульяновск', 'checkout_key': f'bench-{time.time_ns()}-{i}',
+            'cart_data': json.dumps([{'id': product_id, 'quantity': 1}]),
+        }})),
+        'admin_panel': ('get', 'staff', lambda i: ('/dashboard/', {})),
+    }
+
+
+def bench_users():
+    from .models import CustomUser
+
+    users = {}
+    for role, username in BENCH_USERS.items():
+        user, _ = CustomUser.objects.get_or_create(
+            username=username, defaults={'email': f'{username}@example.com', 'is_staff': role == 'staff'})
+        users[role] = user
+    return users
+
+
+def sample_ids():
+    """Товар с одобренными отзывами и корневая категория для адресов маршрутов.
+
+    Товар берём с запасом на складе: checkout и корзина резервируют и списывают его.
+    """
+    from .models import Category, Product
+
+    product_id = (Product.objects.filter(is_active=True, stock_quantity__gte=50).order_by('-rating_count', 'pk')
+                  .values_list('pk', flat=True).first())
+    category_id = (Category.objects.filter(parent__isnull=True).order_by('pk')
+                   .values_list('pk', flat=True).first())
+    return product_id, category_id
+
+
+def measure_route(client, case, i):
+    """Один запрос: (секунды, число SQL-запросов, код ответа)."""
+    method, _, build = case
+    path, kwargs = build(i)
+    queries = []
+
+    def count(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    with ExitStack() as stack:
+        # Чтение каталога может идти через отдельное соединение (main.db)
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(count))
+        started = time.perf_counter()
+        response = getattr(client, method)(path, **kwargs)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = time.perf_counter() - started
+    return elapsed, len(queries), response.status_code
+
+
+def run_routes(cases, users, iterations, cold=False):
+    """Гоняет каждый маршрут iterations раз; возвращает {name: сводка + max_queries}."""
+    from django.core.cache import cache
+    from django.test import Client
+
+    results = {}
+    for name, case in cases.items():
+        role = case[1]
+        client = Client(HTTP_HOST='localhost')
+        latencies, query_counts, errors = [], [], 0
+        started = time.perf_counter()
+        for i in range(iterations):
+            if role:
+                # logout разлогинивает - входим заново перед каждым запросом
+                client.force_login(users[role])
+            if cold:
+                cache.clear()
+            elapsed, queries, status = measure_route(client, case, i)
+            latencies.append(elapsed)
+            query_counts.append(queries)
+            errors += status >= 400
+        results[name] = dict(summarize(latencies, time.perf_counter() - started, errors),
+                             max_queries=max(query_counts))
+    return results
+
+
+def compare(previous, current, threshold=0.2):
+    """Строки сравнения двух прогонов: (маршрут, p95 было, p95 стало, изменение, запросы было/стало, регрессия)."""
+    rows = []
+    for name, now in current.items():
+        before = previous.get(name)
+        if before is None:
+            rows.append((name, None, now['p95_ms'], None, None, now['max_queries'], False))
+            continue
+        change = (now['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0.0
+        regression = change > threshold or now['max_queries'] > before['max_queries']
+        rows.append((name, before['p95_ms'], now['p95_ms'], change,
+                     before['max_queries'], now['max_queries'], regression))
+    return rows
+
+
+# "Распродажа": buyers покупателей в concurrency потоков одновременно
+# кладут товар в корзину и оформляют заказ, а на складе меньше, чем
+# желающих. Проверяется, что продано ровно столько, сколько было, и
+# резерв после всех покупок нулевой. Нужна файловая база (у каждого
+# потока своё соединение) - запускать на копии, не на рабочей базе.
+
+FLASH_SALE_PREFIX = 'bench-flash'
+
+
+def run_flash_sale(buyers=200, stock=20, quantity=1, concurrency=16):
+    """Возвращает сводку задержек покупок и счётчики sold/rejected/errors/stock_left/reserved_left."""
+    from django.db import close_old_connections
+
+    from . import cart as cart_service, checkout as checkout_service
+    from .models import Cart, Category, Order, Product
+
+    category, _ = Category.objects.get_or_create(slug=FLASH_SALE_PREFIX, defaults={'name': 'Распродажа'})
+    product = Product.objects.create(
+        name='Последние единицы', description='Нагрузочный тест', price=100, category=category,
+        stock_quantity=stock, sku=f'{FLASH_SALE_PREFIX}-{time.time_ns()}',
+    )
+    carts = Cart.objects.bulk_create([Cart(session_key=f'{FLASH_SALE_PREFIX}-{i}') for i in range(buyers)])
+    counter = iter(range(buyers))
+    lock = threading.Lock()
+    latencies, outcomes = [], {'sold': 0, 'rejected': 0, 'errors': 0}
+
+    def buy(i):
+        cart = carts[i]
+        try:
+            cart_service.add(cart, product.pk, quantity)
+            checkout_service.place_order(
+                checkout_service.cart_lines(cart), email=f'buyer{i}@example.com', address='Ульяновск',
+                idempotency_key=f'{FLASH_SALE_PREFIX}-{product.pk}-{i}', cart=cart)
+            return 'sold'
+        except (cart_service.CartError, checkout_service.CheckoutError):
+            return 'rejected'
+
+    def worker():
+        try:
+            while True:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    return
+                started = time.perf_counter()
+                try:
+                    outcome = buy(i)
+                except Exception:
+                    outcome = 'errors'
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    outcomes[outcome] += 1
+        finally:
+            close_old_connections()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - started
+
+    product.refresh_from_db()
+    result = dict(summarize(latencies, elapsed, outcomes['errors']), **outcomes)
+    result['stock_left'] = product.stock_quantity
+    result['reserved_left'] = product.reserved
+    result['ordered_units'] = sum(
+        Order.objects.filter(items__product=product).values_list('items__quantity', flat=True))
+    # Заказы удаляем через ORM - сигналы вычтут их из витрины продаж
+    for order in Order.objects.filter(items__product=product).distinct():
+        order.delete()
+    Cart.objects.filter(pk__in=[cart.pk for cart in carts]).delete()
+    product.delete()
+    return result
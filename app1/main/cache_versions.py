@@ -0,0 +1,30 @@
+import time
+
+from django.core.cache import cache
+
+# Счётчики версий в общем кэше Django. Ключи закэшированных данных включают
+# номер версии, поэтому инвалидация - это просто увеличение счётчика:
+# старые записи перестают читаться и со временем вытесняются.
+
+
+def _key(name):
+    return f'version:{name}'
+
+
+def get_version(name):
+    version = cache.get(_key(name))
+    if version is None:
+        # Ключ мог быть вытеснен: начинаем с метки времени, чтобы не совпасть
+        # с версией, которую уже видел какой-нибудь процесс
+        cache.add(_key(name), time.time_ns(), None)
+        version = cache.get(_key(name))
+    return version
+
+
+def bump(name):
+    try:
+        return cache.incr(_key(name))
+    except ValueError:
+        version = time.time_ns()
+        cache.set(_key(name), version, None)
+        return version
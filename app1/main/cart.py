@@ -0,0 +1,240 @@
+import re
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+
+from . import reservations
+from .models import Cart, CartItem, Product
+
+# Серверная корзина: у пользователя - по user, у гостя - по session_key.
+# id гостевой корзины дополнительно кладём в сессию: при входе Django
+# меняет ключ сессии, а корзину нужно найти и слить с корзиной пользователя.
+# Каждое изменение количества переставляет резерв товара (reservations.hold)
+# в той же транзакции: не хватило товара - корзина не меняется.
+
+SESSION_CART_ID = 'guest_cart_id'
+MAX_QUANTITY = 99
+# Первичные ключи - 64-битные: большее число база не примет (OverflowError)
+MAX_ID = 2 ** 63 - 1
+
+LINE_TOTAL = ExpressionWrapper(F('quantity') * F('product__price'),
+                               output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+class CartError(Exception):
+    pass
+
+
+def _money(value):
+    # SQLite теряет масштаб DecimalField при умножении - приводим к копейкам
+    return Decimal(value or 0).quantize(Decimal('0.01'))
+
+
+def get_cart(request, create=False):
+    if request.user.is_authenticated:
+        cart = Cart.objects.filter(user=request.user).order_by('id').first()
+        if cart is None and create:
+            cart = Cart.objects.create(user=request.user)
+        return cart
+
+    session_key = request.session.session_key
+    cart = None
+    if session_key:
+        cart = Cart.objects.filter(session_key=session_key, user__isnull=True).order_by('id').first()
+    if cart is None and create:
+        if not session_key:
+            request.session.save()
+        cart = Cart.objects.create(session_key=request.session.session_key)
+        request.session[SESSION_CART_ID] = cart.id
+    return cart
+
+
+INTEGER_RE = re.compile(r'\s*[+-]?\d+\s*')
+
+
+def parse_int(value):
+    """Целое из JSON или формы: int или строка из цифр, иначе ValueError.
+
+    int() принял бы и 1.5, и true, а на 1e400 упал бы с OverflowError.
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and INTEGER_RE.fullmatch(value):
+        return int(value)
+    raise ValueError(f'Ожидается целое число: {value!r}')
+
+
+def _clean_product_id(product_id):
+    try:
+        product_id = parse_int(product_id)
+    except ValueError:
+        raise CartError('Некорректный товар')
+    if not 0 < product_id <= MAX_ID:
+        raise CartError('Некорректный товар')
+    return product_id
+
+
+def _clean_quantity(quantity):
+    try:
+        quantity = parse_int(quantity)
+    except ValueError:
+        raise CartError('Некорректное количество')
+    return max(0, min(quantity, MAX_QUANTITY))
+
+
+def _active_product_ids(product_ids):
+    return set(Product.objects.filter(pk__in=product_ids, is_active=True).values_list('pk', flat=True))
+
+
+def add(cart, product_id, quantity=1):
+    product_id = _clean_product_id(product_id)
+    quantity = _clean_quantity(quantity)
+    if quantity == 0:
+        # Пустую строку корзины не заводим; убрать товар - remove/set_quantity
+        raise CartError('Некорректное количество')
+    if not _active_product_ids([product_id]):
+        raise CartError('Товар не найден')
+    with transaction.atomic():
+        item, created = CartItem.objects.select_for_update().get_or_create(
+            cart=cart, product_id=product_id, defaults={'quantity': quantity})
+        if not created:
+            item.quantity = min(item.quantity + quantity, MAX_QUANTITY)
+            item.save(update_fields=['quantity'])
+        _hold(cart, {product_id: item.quantity})
+
+
+def _hold(cart, quantities):
+    try:
+        reservations.hold(cart, quantities)
+    except reservations.ReservationError as e:
+        raise CartError(str(e))
+
+
+def set_quantity(cart, product_id, quantity):
+    product_id = _clean_product_id(product_id)
+    quantity = _clean_quantity(quantity)
+    if quantity == 0:
+        remove(cart, product_id)
+        return
+    with transaction.atomic():
+        updated = CartItem.objects.filter(cart=cart, product_id=product_id).update(quantity=quantity)
+        if updated:
+            _hold(cart, {product_id: quantity})
+    if not updated:
+        add(cart, product_id, quantity)
+
+
+def remove(cart, product_id):
+    product_id = _clean_product_id(product_id)
+    with transaction.atomic():
+        CartItem.objects.filter(cart=cart, product_id=product_id).delete()
+        reservations.hold(cart, {product_id: 0})
+
+
+def sync(cart, items, replace=False):
+    """Пакетная запись корзины: items - пары (product_id, quantity).
+
+    replace=True - корзина становится ровно такой, как передано;
+    иначе переданные количества перезаписывают существующие строки.
+    Любое число позиций - за фиксированное число запросов.
+    """
+    wanted = {}
+    for product_id, quantity in items:
+        wanted[_clean_product_id(product_id)] = _clean_quantity(quantity)
+    valid = _active_product_ids([pk for pk, qty in wanted.items() if qty > 0])
+
+    with transaction.atomic():
+        existing = {item.product_id: item for item in CartItem.objects.filter(cart=cart)}
+        to_update, to_create = [], []
+        for product_id, quantity in wanted.items():
+            if product_id not in valid:
+                continue
+            item = existing.get(product_id)
+            if item is None:
+                to_create.append(CartItem(cart=cart, product_id=product_id, quantity=quantity))
+            elif item.quantity != quantity:
+                item.quantity = quantity
+                to_update.append(item)
+        if replace:
+            stale = [pk for pk in existing if pk not in valid]
+        else:
+            stale = [pk for pk, qty in wanted.items() if qty == 0 and pk in existing]
+        if stale:
+            CartItem.objects.filter(cart=cart, product_id__in=stale).delete()
+        CartItem.objects.bulk_update(to_update, ['quantity'])
+        CartItem.objects.bulk_create(to_create)
+        held = {pk: qty for pk, qty in wanted.items() if pk in valid}
+        held.update((pk, 0) for pk in stale)
+        _hold(cart, held)
+
+
+def merge(source, target):
+    """Переносит позиции гостевой корзины source в target и удаляет source."""
+    with transaction.atomic():
+        target_items = {item.product_id: item for item in CartItem.objects.filter(cart=target)}
+        # Совпадающие товары - складываем количества, остальные - переносим одним UPDATE
+        to_update = []
+        for item in CartItem.objects.filter(cart=source, product_id__in=target_items):
+            existing = target_items[item.product_id]
+            existing.quantity = min(existing.quantity + item.quantity, MAX_QUANTITY)
+            to_update.append(existing)
+        CartItem.objects.bulk_update(to_update, ['quantity'])
+        CartItem.objects.filter(cart=source).exclude(product_id__in=target_items).update(cart=target)
+        reservations.transfer(source, target)
+        source.delete()
+
+
+def attach_guest_cart(request, user):
+    """Вызывается при входе: гостевая корзина становится (или вливается в) корзиной пользователя."""
+    cart_id = request.session.pop(SESSION_CART_ID, None)
+    if cart_id is None:
+        return
+    guest = Cart.objects.filter(pk=cart_id, user__isnull=True).first()
+    if guest is None:
+        return
+    user_cart = Cart.objects.filter(user=user).order_by('id').first()
+    if user_cart is None:
+        guest.user = user
+        guest.session_key = None
+        guest.save(update_fields=['user', 'session_key'])
+    else:
+        merge(guest, user_cart)
+
+
+def get_items(cart):
+    if cart is None:
+        return []
+    items = list(cart.items.select_related('product').annotate(line_total=LINE_TOTAL).order_by('id'))
+    for item in items:
+        item.line_total = _money(item.line_total)
+    return items
+
+
+def get_totals(cart):
+    """Итоги корзины одним агрегирующим запросом."""
+    if cart is None:
+        return {'total_price': _money(0), 'total_quantity': 0}
+    totals = cart.items.aggregate(total_price=Sum(LINE_TOTAL), total_quantity=Sum('quantity'))
+    return {
+        'total_price': _money(totals['total_price']),
+        'total_quantity': totals['total_quantity'] or 0,
+    }
+
+
+def serialize(cart):
+    totals = get_totals(cart)
+    return {
+        'items': [
+            {
+                'product_id': item.product_id,
+                'name': item.product.name,
+                'price': str(item.product.price),
+                'quantity': item.quantity,
+                'line_total': str(item.line_total),
+            }
+            for item in get_items(cart)
+        ],
+        'total_price': str(totals['total_price']),
+        'total_quantity': totals['total_quantity'],
+    }
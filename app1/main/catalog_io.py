@@ -0,0 +1,224 @@
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+
+from . import facets, page_cache, search
+from .models import Category, Product
+
+# Массовый импорт и экспорт каталога (CSV или JSON Lines).
+# Файл читается потоково, строки пишутся пачками: одна пачка - одна
+# транзакция с одним upsert по артикулу (sku). Сигналы Product при этом
+# не срабатывают, поэтому поисковый индекс обновляется здесь же пачкой,
+# а фасеты затронутых категорий и кэш страниц - один раз в конце.
+
+FIELDS = ('sku', 'name', 'description', 'price', 'category', 'material', 'stock_quantity', 'is_active')
+REQUIRED = ('sku', 'name', 'price', 'category')
+# Поля, которые перезаписывает повторный импорт того же артикула
+UPDATE_FIELDS = ('name', 'description', 'price', 'category', 'material', 'stock_quantity',
+                 'is_active', 'updated_at')
+BATCH_SIZE = 1000
+FORMATS = ('csv', 'jsonl')
+
+TRUE_VALUES = {'1', 'true', 'yes', 'да'}
+FALSE_VALUES = {'0', 'false', 'no', 'нет', ''}
+# PositiveIntegerField: больше не поместится в столбец на PostgreSQL/MySQL
+MAX_STOCK = 2 ** 31 - 1
+
+
+class RowError(Exception):
+    pass
+
+
+def detect_format(filename, explicit=None):
+    if explicit:
+        return explicit
+    return 'jsonl' if filename.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(stream, fmt):
+    """Построчно читает файл и отдаёт словари.
+
+    Нечитаемая строка JSON Lines приходит как {'_raw': строка, '_error': причина}.
+    """
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = {'_raw': line, '_error': 'Некорректный JSON'}
+        if not isinstance(row, dict):
+            row = {'_raw': line, '_error': 'Ожидается JSON-объект'}
+        yield row
+
+
+class CategoryCache:
+    """slug -> id всех категорий: один запрос на весь импорт."""
+
+    def __init__(self):
+        self.ids = dict(Category.objects.values_list('slug', 'id'))
+
+    def get(self, slug):
+        try:
+            return self.ids[slug]
+        except KeyError:
+            raise RowError(f'Неизвестная категория: {slug}')
+
+
+def _text(row, field, max_length=None):
+    value = row.get(field)
+    value = '' if value is None else str(value).strip()
+    if max_length and len(value) > max_length:
+        raise RowError(f'{field}: длиннее {max_length} символов')
+    return value
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    value = '' if value is None else str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise RowError(f'is_active: непонятное значение {value}')
+
+
+def clean_row(row, categories):
+    """Проверяет строку и возвращает несохранённый Product; иначе RowError."""
+    if '_error' in row:
+        raise RowError(row['_error'])
+    for field in REQUIRED:
+        if row.get(field) in (None, ''):
+            raise RowError(f'{field}: обязательное поле')
+    try:
+        price = Decimal(str(row['price']).replace(',', '.')).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise RowError('price: ожидается число')
+    if not price.is_finite() or price < 0 or price >= Decimal('1e8'):
+        raise RowError('price: вне допустимого диапазона')
+    # Через Decimal: int() обрезал бы 2.7 до 2, а на 1e400 из JSON упал бы с OverflowError
+    try:
+        stock = Decimal(str(row.get('stock_quantity') or 0))
+    except InvalidOperation:
+        raise RowError('stock_quantity: ожидается целое число')
+    if not stock.is_finite() or stock != stock.to_integral_value():
+        raise RowError('stock_quantity: ожидается целое число')
+    if not 0 <= stock <= MAX_STOCK:
+        raise RowError('stock_quantity: вне допустимого диапазона')
+    stock = int(stock)
+    return Product(
+        sku=_text(row, 'sku', 64),
+        name=_text(row, 'name', 200),
+        description=_text(row, 'description'),
+        price=price,
+        category_id=categories.get(_text(row, 'category')),
+        material=_text(row, 'material', 100),
+        stock_quantity=stock,
+        is_active=_bool(row.get('is_active', True)),
+    )
+
+
+def _write_batch(products):
+    """Upsert пачки по sku; возвращает (создано, обновлено, затронутые категории)."""
+    # Повторы артикула внутри пачки - побеждает последняя строка
+    products = list({product.sku: product for product in products}.values())
+    skus = [product.sku for product in products]
+    with transaction.atomic():
+        existing = {sku: (pk, category_id) for pk, sku, category_id in
+                    Product.objects.filter(sku__in=skus).values_list('pk', 'sku', 'category_id')}
+        if connection.features.supports_update_conflicts_with_target:
+            Product.objects.bulk_create(products, update_conflicts=True, unique_fields=['sku'],
+                                        update_fields=UPDATE_FIELDS)
+        else:
+            to_update = []
+            for product in products:
+                if product.sku in existing:
+                    product.pk = existing[product.sku][0]
+                    to_update.append(product)
+            Product.objects.bulk_create([p for p in products if p.sku not in existing])
+            Product.objects.bulk_update(to_update, UPDATE_FIELDS)
+        # upsert на SQLite не возвращает id - дочитываем их одним запросом
+        ids = dict(Product.objects.filter(sku__in=skus).values_list('sku', 'pk'))
+        for product in products:
+            product.pk = ids[product.sku]
+        search.index_products(products)
+    categories = {product.category_id for product in products}
+    categories.update(category_id for _, category_id in existing.values())
+    return len(products) - len(existing), len(existing), categories
+
+
+def import_rows(rows, batch_size=BATCH_SIZE, reject=None, progress=None):
+    """Импортирует строки пачками. reject(row, error) получает невалидные строки.
+
+    Возвращает словарь со счётчиками created/updated/rejected/rows/seconds.
+    """
+    started = time.monotonic()
+    categories = CategoryCache()
+    stats = {'rows': 0, 'created': 0, 'updated': 0, 'rejected': 0}
+    touched = set()
+    batch = []
+
+    def flush():
+        created, updated, batch_categories = _write_batch(batch)
+        stats['created'] += created
+        stats['updated'] += updated
+        touched.update(batch_categories)
+        batch.clear()
+        if progress:
+            progress(stats, time.monotonic() - started)
+
+    for row in rows:
+        stats['rows'] += 1
+        try:
+            batch.append(clean_row(row, categories))
+        except RowError as e:
+            stats['rejected'] += 1
+            if reject:
+                reject(row, str(e))
+            continue
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    for category_id in touched:
+        facets.recount_category(category_id)
+    facets.invalidate()
+    page_cache.invalidate()
+    stats['seconds'] = time.monotonic() - started
+    return stats
+
+
+def export_rows(queryset, chunk_size=BATCH_SIZE):
+    """Строки каталога в формате импорта; категория - по slug."""
+    columns = [field if field != 'category' else 'category__slug' for field in FIELDS]
+    for values in queryset.order_by('pk').values_list(*columns).iterator(chunk_size=chunk_size):
+        row = dict(zip(FIELDS, values))
+        row['sku'] = row['sku'] or ''
+        row['price'] = str(row['price'])
+        yield row
+
+
+class RowWriter:
+    """Пишет строки в CSV или JSON Lines."""
+
+    def __init__(self, stream, fmt, fields):
+        self.fmt = fmt
+        self.stream = stream
+        if fmt == 'csv':
+            self.writer = csv.DictWriter(stream, fieldnames=fields, extrasaction='ignore')
+            self.writer.writeheader()
+
+    def write(self, row):
+        if self.fmt == 'csv':
+            self.writer.writerow(row)
+        else:
+            self.stream.write(json.dumps(row, ensure_ascii=False) + '\n')
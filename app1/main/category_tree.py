@@ -0,0 +1,72 @@
+import threading
+
+from . import cache_versions
+from .models import Category
+
+# Дерево категорий держим в памяти процесса. Чтобы другие процессы (воркеры)
+# тоже узнали об изменениях, номер версии дерева лежит в общем кэше Django:
+# сверка версии - одно обращение к кэшу, без запросов к БД.
+
+VERSION = 'category_tree'
+
+_lock = threading.Lock()
+_state = {'version': None, 'tree': None}
+
+
+class CategoryTree:
+    def __init__(self, rows):
+        # rows: (id, name, slug, parent_id, path, depth), отсортированы по path
+        self.nodes = [
+            {'id': pk, 'name': name, 'slug': slug, 'parent_id': parent_id,
+             'path': path, 'depth': depth}
+            for pk, name, slug, parent_id, path, depth in rows
+        ]
+        self.by_id = {node['id']: node for node in self.nodes}
+        self._children = {}
+        for node in self.nodes:
+            self._children.setdefault(node['parent_id'], []).append(node)
+
+    def get(self, category_id):
+        try:
+            return self.by_id.get(int(category_id))
+        except (TypeError, ValueError):
+            return None
+
+    def descendant_ids(self, category_id):
+        """id категории и всех её потомков (пустой список для несуществующей)."""
+        node = self.get(category_id)
+        if node is None:
+            return []
+        prefix = node['path']
+        return [n['id'] for n in self.nodes if n['path'].startswith(prefix)]
+
+    def ordered(self):
+        """Узлы в порядке обхода в глубину, соседи - по имени (для сайдбара)."""
+        result = []
+
+        def walk(parent_id):
+            for node in sorted(self._children.get(parent_id, []), key=lambda n: n['name']):
+                result.append(node)
+                walk(node['id'])
+
+        walk(None)
+        return result
+
+
+def get_tree():
+    version = cache_versions.get_version(VERSION)
+    tree = _state['tree']
+    if tree is not None and _state['version'] == version:
+        return tree
+    with _lock:
+        if _state['tree'] is None or _state['version'] != version:
+            rows = Category.objects.order_by('path').values_list(
+                'id', 'name', 'slug', 'parent_id', 'path', 'depth')
+            _state['tree'] = CategoryTree(rows)
+            _state['version'] = version
+        return _state['tree']
+
+
+def invalidate():
+    _state['tree'] = None
+    cache_versions.bump(VERSION)
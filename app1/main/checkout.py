@@ -0,0 +1,99 @@
+import json
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+
+from . import cart as cart_service, reservations, tasks
+from .models import CartItem, Order, OrderItem, Product
+
+# Оформление заказа. Число запросов не зависит от числа позиций:
+# цены всех товаров читаются одним запросом, строки заказа пишутся
+# одним bulk_create, склад списывается одним условным UPDATE
+# (reservations.convert), всё - в одной транзакции. Списание идёт мимо
+# Product.save, поэтому фасет "в наличии" для категорий купленных товаров
+# пересчитает воркер очереди задач.
+
+
+class CheckoutError(Exception):
+    pass
+
+
+def parse_cart_data(raw):
+    """Разбирает cart_data из формы: [{"id": 1, "quantity": 2}, ...] -> [(id, qty)]."""
+    try:
+        items = json.loads(raw)
+        lines = [(cart_service.parse_int(item['id']), cart_service.parse_int(item['quantity']))
+                 for item in items]
+    except (ValueError, TypeError, KeyError):
+        raise CheckoutError('Некорректные данные корзины')
+    # Проверяем до запросов: id за пределами 64 бит база не примет
+    for product_id, quantity in lines:
+        if not 0 < product_id <= cart_service.MAX_ID or not 0 <= quantity <= cart_service.MAX_QUANTITY:
+            raise CheckoutError('Некорректные данные корзины')
+    return lines
+
+
+def cart_lines(cart):
+    if cart is None:
+        return []
+    return list(CartItem.objects.filter(cart=cart).values_list('product_id', 'quantity'))
+
+
+def place_order(lines, *, user=None, name='', email='', address='', phone='',
+                idempotency_key=None, cart=None):
+    """Создаёт Order и все OrderItem; возвращает (order, created).
+
+    lines - пары (product_id, quantity). Повторная отправка с тем же
+    idempotency_key возвращает уже созданный заказ.
+    """
+    if idempotency_key:
+        existing = Order.objects.filter(idempotency_key=idempotency_key).first()
+        if existing is not None:
+            return existing, False
+
+    quantities = {}
+    for product_id, quantity in lines:
+        if quantity > 0:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+    if not quantities:
+        raise CheckoutError('Корзина пуста')
+
+    # Цены - только из базы, одним запросом
+    prices = dict(
+        Product.objects.filter(pk__in=quantities, is_active=True).values_list('pk', 'price')
+    )
+    missing = set(quantities) - set(prices)
+    if missing:
+        raise CheckoutError('Некоторые товары больше не продаются')
+
+    total = sum((prices[pk] * qty for pk, qty in quantities.items()), Decimal('0'))
+    try:
+        with transaction.atomic():
+            order = Order.objects.create(
+                user=user,
+                guest_name=name if user is None else '',
+                guest_email=email if user is None else '',
+                address=address,
+                phone=phone,
+                total_amount=total,
+                idempotency_key=idempotency_key or None,
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_id=pk, quantity=qty, unit_price=prices[pk])
+                for pk, qty in quantities.items()
+            ])
+            reservations.convert(cart, quantities)
+            # Письмо отправит воркер; задача коммитится вместе с заказом
+            tasks.enqueue('order_confirmation', order_id=order.pk)
+            if cart is not None:
+                CartItem.objects.filter(cart=cart).delete()
+    except reservations.ReservationError as e:
+        raise CheckoutError(str(e))
+    except IntegrityError:
+        # Параллельная отправка с тем же ключом успела раньше
+        if idempotency_key:
+            existing = Order.objects.filter(idempotency_key=idempotency_key).first()
+            if existing is not None:
+                return existing, False
+        raise
+    return order, True
@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Рабочий профиль SQLite: WAL (читатели не ждут писателя), настроенные
+# PRAGMA на каждом новом соединении (при settings.SQLITE_TUNING) и
+# отдельное соединение только для чтения каталога. Писатель у SQLite всё равно один - запись идёт только
+# через основное соединение, а BEGIN IMMEDIATE (transaction_mode в
+# settings.DATABASES) и busy_timeout ставят её в очередь вместо ошибки
+# "database is locked".
+
+READ_ALIAS = 'catalog_read'
+# Чтение этих моделей уходит в READ_ALIAS
+CATALOG_MODELS = {'product', 'category', 'review'}
+
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    # С WAL NORMAL не теряет целостность, fsync - только на checkpoint
+    ('synchronous', 'NORMAL'),
+    # Отрицательное значение - размер кэша страниц в КиБ (64 МиБ)
+    ('cache_size', -65536),
+    ('mmap_size', 256 * 1024 * 1024),
+    ('busy_timeout', 5000),
+    ('temp_store', 'MEMORY'),
+)
+
+
+def configure_sqlite(connection):
+    """PRAGMA для нового соединения SQLite (вызывается по сигналу connection_created)."""
+    if connection.vendor != 'sqlite':
+        return
+    read_only = connection.alias == READ_ALIAS
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', PRAGMAS) if getattr(settings, 'SQLITE_TUNING', False) else ()
+    with connection.cursor() as cursor:
+        for name, value in pragmas:
+            # Режим журнала хранится в самом файле базы - его включает
+            # основное соединение, соединению только для чтения он недоступен
+            if read_only and name == 'journal_mode':
+                continue
+            cursor.execute(f'PRAGMA {name} = {value}')
+        if read_only:
+            cursor.execute('PRAGMA query_only = ON')
+
+
+class CatalogReadRouter:
+    """Чтение каталога - из READ_ALIAS, вся запись - в основную базу.
+
+    Внутри транзакции основной базы читаем тоже из неё: иначе транзакция
+    не увидит собственных изменений, а select_for_update уйдёт не туда.
+    """
+
+    def _read_alias(self):
+        if READ_ALIAS not in settings.DATABASES or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return READ_ALIAS
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'main' and model._meta.model_name in CATALOG_MODELS:
+            return self._read_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Оба псевдонима - один и тот же файл базы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,163 @@
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from . import cache_versions, category_tree
+from .models import Category, FacetCount, Product
+
+# Фасетные счётчики каталога. Для каждой категории в FacetCount хранится
+# число её собственных активных товаров по значениям фасетов; счётчики
+# ветки дерева складываются из строк категорий ветки и кэшируются.
+# При сохранении товара пересчитывается только его категория.
+# "В наличии" - доступный остаток stock_quantity > reserved; склад и
+# резервы меняются мимо save (reservations: резерв корзины, его снятие,
+# продажа), поэтому категории этих товаров пересчитывает воркер очереди
+# задач (задача TASK).
+
+VERSION = 'facets'
+CACHE_TIMEOUT = 60 * 60
+TASK = 'facets.recount_products'
+
+# Ценовые диапазоны: ключ, подпись, нижняя граница (включительно), верхняя (не включительно)
+PRICE_BUCKETS = [
+    ('0-500', 'до 500 ₽', None, Decimal('500')),
+    ('500-1000', '500 – 1000 ₽', Decimal('500'), Decimal('1000')),
+    ('1000-3000', '1000 – 3000 ₽', Decimal('1000'), Decimal('3000')),
+    ('3000-', 'от 3000 ₽', Decimal('3000'), None),
+]
+
+
+IN_STOCK = Q(stock_quantity__gt=F('reserved'))
+
+
+def _price_q(low, high):
+    q = Q()
+    if low is not None:
+        q &= Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+def parse_price_range(raw):
+    """Разбирает диапазон вида "500-1000", "3000-" или "-500"."""
+    if not raw or '-' not in raw:
+        return None
+    low, _, high = raw.partition('-')
+    try:
+        low = Decimal(low) if low else None
+        high = Decimal(high) if high else None
+    except InvalidOperation:
+        return None
+    if low is None and high is None:
+        return None
+    # NaN и Infinity - тоже Decimal, но фильтровать по ним база не умеет
+    if any(bound is not None and not bound.is_finite() for bound in (low, high)):
+        return None
+    return low, high
+
+
+def parse_filters(params):
+    return {
+        'price': params.get('price') if parse_price_range(params.get('price')) else None,
+        'material': params.get('material') or None,
+        'in_stock': params.get('in_stock') == '1',
+    }
+
+
+def apply_filters(queryset, filters):
+    price = parse_price_range(filters['price'])
+    if price:
+        queryset = queryset.filter(_price_q(*price))
+    if filters['material']:
+        queryset = queryset.filter(material=filters['material'])
+    if filters['in_stock']:
+        queryset = queryset.filter(IN_STOCK)
+    return queryset
+
+
+def recount_category(category_id):
+    """Пересчитывает счётчики одной категории (без потомков)."""
+    active = Product.objects.filter(category_id=category_id, is_active=True)
+    rows = [
+        FacetCount(category_id=category_id, facet='material', value=material, count=n)
+        for material, n in active.exclude(material='').order_by()
+                                 .values_list('material').annotate(n=Count('id'))
+    ]
+    totals = active.aggregate(
+        stock=Count('id', filter=IN_STOCK),
+        **{f'price_{i}': Count('id', filter=_price_q(low, high))
+           for i, (_, _, low, high) in enumerate(PRICE_BUCKETS)},
+    )
+    if totals['stock']:
+        rows.append(FacetCount(category_id=category_id, facet='stock', value='1', count=totals['stock']))
+    for i, (key, _, _, _) in enumerate(PRICE_BUCKETS):
+        if totals[f'price_{i}']:
+            rows.append(FacetCount(category_id=category_id, facet='price', value=key, count=totals[f'price_{i}']))
+
+    with transaction.atomic():
+        FacetCount.objects.filter(category_id=category_id).delete()
+        FacetCount.objects.bulk_create(rows)
+
+
+def recount_products(product_ids):
+    """Пересчитывает категории товаров product_ids (например, после продажи)."""
+    category_ids = set(Product.objects.filter(pk__in=list(product_ids)).values_list('category_id', flat=True))
+    for category_id in category_ids:
+        recount_category(category_id)
+    if category_ids:
+        invalidate()
+
+
+def recount_all():
+    for category_id in Category.objects.values_list('id', flat=True):
+        recount_category(category_id)
+    invalidate()
+
+
+def invalidate():
+    cache_versions.bump(VERSION)
+
+
+def get_counts(category_id=None):
+    """Счётчики фасетов для ветки категории (или всего каталога).
+
+    Возвращает {'material': [(значение, n), ...], 'price': {ключ: n}, 'stock': n}.
+    При промахе кэша - один запрос к FacetCount.
+    """
+    tree = category_tree.get_tree()
+    if category_id:
+        node = tree.get(category_id)
+        if node is None:
+            return {'material': [], 'price': {}, 'stock': 0}
+        category_id = node['id']
+    key = 'facets:{}:{}:{}'.format(
+        cache_versions.get_version(VERSION),
+        cache_versions.get_version(category_tree.VERSION),
+        category_id or 'all',
+    )
+    counts = cache.get(key)
+    if counts is not None:
+        return counts
+
+    rows = FacetCount.objects.all()
+    if category_id:
+        rows = rows.filter(category_id__in=tree.descendant_ids(category_id))
+    materials, prices, stock = {}, {}, 0
+    for facet, value, n in rows.values_list('facet', 'value', 'count'):
+        if facet == 'material':
+            materials[value] = materials.get(value, 0) + n
+        elif facet == 'price':
+            prices[value] = prices.get(value, 0) + n
+        elif facet == 'stock':
+            stock += n
+
+    counts = {
+        'material': sorted(materials.items(), key=lambda item: (-item[1], item[0])),
+        'price': prices,
+        'stock': stock,
+    }
+    cache.set(key, counts, CACHE_TIMEOUT)
+    return counts
@@ -0,0 +1,179 @@
+from datetime import datetime, time, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import category_tree
+from .models import Product
+
+# Фид товаров для партнёров. Строки читаются серверным курсором
+# (.iterator) пачками и сразу отдаются клиенту, поэтому память не растёт
+# с размером каталога. Порядок - по id: чтобы продолжить оборванную
+# выгрузку, достаточно передать after=<последний полученный id>.
+
+FEED_FIELDS = (
+    'id', 'name', 'description', 'price', 'category_id', 'material', 'stock_quantity',
+    'image', 'rating_avg', 'rating_count', 'created_at', 'updated_at',
+)
+DEFAULT_FIELDS = ('id', 'name', 'price', 'image')
+CHUNK_SIZE = 2000
+# Сколько строк склеивать в один кусок ответа
+ROWS_PER_WRITE = 200
+# Первичные ключи - 64-битные: большее число база не примет
+MAX_ID = 2 ** 63 - 1
+
+
+class FeedError(Exception):
+    pass
+
+
+def parse_fields(raw):
+    if not raw:
+        return DEFAULT_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(',') if f.strip()))
+    if not fields:
+        raise FeedError('fields: не указано ни одного поля')
+    unknown = set(fields) - set(FEED_FIELDS)
+    if unknown:
+        raise FeedError('Неизвестные поля: ' + ', '.join(sorted(unknown)))
+    return fields
+
+
+def parse_since(raw):
+    if not raw:
+        return None
+    # Правильный по форме, но несуществующий момент (2024-13-45, +99:00) - ValueError
+    try:
+        value = parse_datetime(raw)
+        date = parse_date(raw) if value is None else None
+    except ValueError:
+        value = date = None
+    if value is None:
+        if date is None:
+            raise FeedError('updated_since: ожидается дата или дата-время ISO 8601')
+        value = datetime.combine(date, time.min)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.get_default_timezone())
+    # В UTC переводим здесь: у краёв диапазона (9999-12-31T23:59-12:00)
+    # перевод переполняется, и в фиде это случилось бы посреди ответа
+    try:
+        return value.astimezone(dt_timezone.utc)
+    except OverflowError:
+        raise FeedError('updated_since: дата вне допустимого диапазона')
+
+
+def _parse_id(raw, name):
+    try:
+        value = int(raw)
+    except ValueError:
+        value = -1
+    if not 0 <= value <= MAX_ID:
+        raise FeedError(f'{name}: ожидается id')
+    return value
+
+
+def build_queryset(params):
+    products = Product.objects.filter(is_active=True)
+    if params.get('category'):
+        category_id = _parse_id(params['category'], 'category')
+        products = products.filter(category_id__in=category_tree.get_tree().descendant_ids(category_id))
+    since = parse_since(params.get('updated_since'))
+    if since is not None:
+        products = products.filter(updated_at__gte=since)
+    if params.get('after'):
+        products = products.filter(pk__gt=_parse_id(params['after'], 'after'))
+    return products.order_by('id')
+
+
+def _to_dict(row, fields):
+    row = dict(zip(fields, row))
+    if 'image' in row:
+        row['image'] = settings.MEDIA_URL + row['image'] if row['image'] else None
+    return row
+
+
+def _rows(queryset, fields, chunk_size):
+    for row in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+        yield _to_dict(row, fields)
+
+
+def _batched(lines):
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= ROWS_PER_WRITE:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_ndjson(queryset, fields, chunk_size=CHUNK_SIZE):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    return _batched(encoder.encode(row) + '\n' for row in _rows(queryset, fields, chunk_size))
+
+
+def stream_json(queryset, fields, chunk_size=CHUNK_SIZE):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+    def lines():
+        yield '['
+        for i, row in enumerate(_rows(queryset, fields, chunk_size)):
+            yield (',' if i else '') + encoder.encode(row)
+        yield ']'
+
+    return _batched(lines())
+
+
+# Асинхронные варианты для ASGI: строки читаются через async ORM,
+# куски ответа склеиваются так же, как в синхронных.
+
+async def _abatched(lines):
+    buffer = []
+    async for line in lines:
+        buffer.append(line)
+        if len(buffer) >= ROWS_PER_WRITE:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+async def _arows(queryset, fields, chunk_size):
+    # aiterator() для values_list в асинхронном контексте не работает,
+    # поэтому читаем пачками по id (queryset уже упорядочен по id)
+    last_id = None
+    while True:
+        batch = queryset if last_id is None else queryset.filter(pk__gt=last_id)
+        rows = [row async for row in batch.values_list('id', *fields)[:chunk_size]]
+        for row in rows:
+            yield _to_dict(row[1:], fields)
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1][0]
+
+
+def astream_ndjson(queryset, fields, chunk_size=CHUNK_SIZE):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+    async def lines():
+        async for row in _arows(queryset, fields, chunk_size):
+            yield encoder.encode(row) + '\n'
+
+    return _abatched(lines())
+
+
+def astream_json(queryset, fields, chunk_size=CHUNK_SIZE):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+    async def lines():
+        yield '['
+        first = True
+        async for row in _arows(queryset, fields, chunk_size):
+            yield ('' if first else ',') + encoder.encode(row)
+            first = False
+        yield ']'
+
+    return _abatched(lines())
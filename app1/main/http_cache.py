@@ -0,0 +1,149 @@
+import hashlib
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Now
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from .models import Category, Product, Review
+
+# Условные GET (ETag / Last-Modified) для каталога и страницы товара.
+# Валидатор - максимальные updated_at данных страницы: MAX по индексу,
+# без чтения самих товаров. Удаление строки updated_at оставшихся не
+# меняет, поэтому сигналы удаления товаров и категорий вызывают
+# touch_catalog(): сдвигают updated_at категории в базе (версия в кэше не
+# подошла бы - LocMemCache у каждого процесса свой). Удаление одобренного
+# отзыва и так меняет updated_at товара (ratings.apply_delta). Если ничего
+# не менялось, condition() отвечает 304 до вызова представления - ни
+# запросов страницы, ни рендера шаблона.
+#
+# Шапка страницы зависит от пользователя, поэтому в ETag входит id
+# пользователя, а в ответе - Vary: Cookie. Анонимные страницы без cookie и
+# CSRF-токена можно держать в локальном обратном прокси PROXY_MAX_AGE
+# секунд (s-maxage), браузер же каждый раз переспрашивает (max-age=0) и
+# получает 304.
+#
+# Блоки, которые пересчитываются по расписанию (хиты продаж,
+# рекомендации), валидатор не меняют - они обновятся в браузере вместе со
+# следующим изменением каталога.
+
+PROXY_MAX_AGE = 60
+
+
+def _user(request):
+    # Без AuthenticationMiddleware (RequestFactory в тестах) - как аноним
+    user = getattr(request, 'user', None)
+    return user if user is not None and user.is_authenticated else None
+
+
+def _user_key(request):
+    user = _user(request)
+    return f'user{user.pk}' if user else 'anon'
+
+
+def _validators(request, parts, last_modified):
+    raw = ':'.join(str(part) for part in (_user_key(request), *parts))
+    return f'"{hashlib.md5(raw.encode()).hexdigest()}"', last_modified
+
+
+def catalog_stamp(request):
+    """(ETag, Last-Modified) каталога: последние изменения товаров и категорий одним запросом."""
+    # Обе части - ORDER BY updated_at DESC LIMIT 1 по индексу
+    latest_product = Product.objects.order_by('-updated_at').values('updated_at')[:1]
+    row = Category.objects.annotate(products_updated=Subquery(latest_product)).order_by(
+        '-updated_at').values_list('updated_at', 'products_updated').first() or (None, None)
+    return _validators(request, row, max(filter(None, row), default=None))
+
+
+def touch_catalog(category_id=None):
+    """После удаления сдвигает валидатор каталога: updated_at категории category_id, а нет её - любой."""
+    if not Category.objects.filter(pk=category_id).update(updated_at=Now()):
+        Category.objects.filter(pk__in=Category.objects.order_by('pk').values('pk')[:1]).update(updated_at=Now())
+
+
+def product_stamp(request, product_id):
+    """(ETag, Last-Modified) страницы товара одним запросом; (None, None) - товара нет."""
+    latest_review = Review.objects.filter(product=OuterRef('pk')).order_by('-updated_at').values('updated_at')[:1]
+    row = Product.objects.filter(pk=product_id).annotate(
+        category_updated=F('category__updated_at'), reviews_updated=Subquery(latest_review),
+    ).values_list('updated_at', 'category_updated', 'reviews_updated', 'stock_quantity', 'reserved').first()
+    if row is None:
+        return None, None
+    # Резервы меняют "в наличии", не трогая updated_at - добавляем их в ETag,
+    # а сами остатки отдаём представлению (см. product_stock)
+    request._http_stock = row[3:]
+    return _validators(request, row, max(filter(None, row[:3])))
+
+
+def product_stock(request, product_id):
+    """(stock_quantity, reserved) товара, прочитанные вместе с валидатором страницы.
+
+    Товар на странице берётся из кэша страниц, а резервы и продажи меняют
+    остатки UPDATE-ом мимо save (кэш не сбрасывается) - поэтому "в наличии"
+    и кнопка корзины строятся по этим свежим значениям. Без валидатора -
+    отдельный запрос.
+    """
+    stock = getattr(request, '_http_stock', None)
+    if stock is None:
+        stock = Product.objects.filter(pk=product_id).values_list('stock_quantity', 'reserved').first()
+    return stock
+
+
+def _stamp(request, stamp, args, kwargs):
+    if not hasattr(request, '_http_stamp'):
+        request._http_stamp = stamp(request, *args, **kwargs)
+    return request._http_stamp
+
+
+def _shareable(request, response):
+    """Можно ли отдать ответ всем из общего прокси.
+
+    Нельзя, если ответ ставит cookie (сессия, csrftoken) или в странице
+    есть {% csrf_token %} (get_token взводит CSRF_COOKIE_NEEDS_UPDATE, а
+    сама cookie добавится позже, в CsrfViewMiddleware).
+    """
+    if response.cookies or request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+        return False
+    session = getattr(request, 'session', None)
+    return not (session is not None and session.modified)
+
+
+def _cache_headers(request, response):
+    if response.status_code not in (200, 304):
+        return response
+    if _user(request) or not _shareable(request, response):
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=0, s_maxage=PROXY_MAX_AGE)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def conditional(stamp):
+    """Условный GET через django.views.decorators.http.condition; stamp(request, ...) -> (ETag, Last-Modified).
+
+    condition() считает валидаторы синхронно, поэтому для async-представлений
+    они вычисляются заранее через sync_to_async.
+    """
+    def etag(request, *args, **kwargs):
+        return _stamp(request, stamp, args, kwargs)[0]
+
+    def last_modified(request, *args, **kwargs):
+        return _stamp(request, stamp, args, kwargs)[1]
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def inner(request, *args, **kwargs):
+                await sync_to_async(_stamp)(request, stamp, args, kwargs)
+                return _cache_headers(request, await conditional_view(request, *args, **kwargs))
+        else:
+            @wraps(view)
+            def inner(request, *args, **kwargs):
+                return _cache_headers(request, conditional_view(request, *args, **kwargs))
+        return inner
+    return decorator
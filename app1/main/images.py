@@ -0,0 +1,100 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from . import page_cache
+
+logger = logging.getLogger(__name__)
+
+# Производные изображений товаров: уменьшенные копии под карточку и
+# страницу товара, в 1x и 2x (retina), в JPEG и WebP. Создаются в фоне
+# пулом потоков после загрузки и лежат в MEDIA_ROOT/derivatives/.
+
+# Размер: (ширина, высота, обрезать до точного размера)
+SIZES = {
+    'card': (300, 200, True),
+    'detail': (600, 600, False),
+}
+SCALES = (1, 2)
+FORMATS = {'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+           'webp': ('WEBP', {'quality': 80, 'method': 4})}
+DERIVATIVES_DIR = 'derivatives'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_WORKERS', 2),
+                thread_name_prefix='image-derivatives',
+            )
+        return _executor
+
+
+def derivative_name(image_name, size, scale, ext):
+    base = os.path.splitext(image_name)[0]
+    return f'{DERIVATIVES_DIR}/{size}/{base}@{scale}x.{ext}'
+
+
+def derivative_path(image_name, size, scale, ext):
+    return os.path.join(settings.MEDIA_ROOT, derivative_name(image_name, size, scale, ext))
+
+
+def derivative_url(image_name, size, scale, ext):
+    return settings.MEDIA_URL + derivative_name(image_name, size, scale, ext)
+
+
+def has_derivatives(image_name, size):
+    return os.path.exists(derivative_path(image_name, size, SCALES[-1], 'webp'))
+
+
+def generate(image_name):
+    """Создаёт все производные для файла из MEDIA_ROOT; возвращает число файлов."""
+    source = os.path.join(settings.MEDIA_ROOT, image_name)
+    created = 0
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'L'):
+            original = original.convert('RGB')
+        for size, (width, height, crop) in SIZES.items():
+            for scale in SCALES:
+                target = (width * scale, height * scale)
+                if crop:
+                    resized = ImageOps.fit(original, target, Image.Resampling.LANCZOS)
+                else:
+                    resized = original.copy()
+                    resized.thumbnail(target, Image.Resampling.LANCZOS)
+                for ext, (fmt, options) in FORMATS.items():
+                    path = derivative_path(image_name, size, scale, ext)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    # Пишем во временный файл и переименовываем: читатель
+                    # никогда не увидит недописанный файл
+                    tmp_path = f'{path}.{threading.get_ident()}.tmp'
+                    resized.save(tmp_path, fmt, **options)
+                    os.replace(tmp_path, path)
+                    created += 1
+    return created
+
+
+def _generate_logged(image_name):
+    try:
+        created = generate(image_name)
+    except Exception:
+        logger.exception('Не удалось создать производные для %s', image_name)
+        raise
+    # Закэшированные карточки ещё ссылаются на оригинал
+    page_cache.invalidate()
+    return created
+
+
+def schedule(image_name):
+    """Ставит генерацию производных в фоновый пул."""
+    return _get_executor().submit(_generate_logged, image_name)
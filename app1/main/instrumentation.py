@@ -0,0 +1,182 @@
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends import django as django_backend
+
+from .benchmark import percentile
+
+# Замеры по каждому запросу: число SQL-запросов и время в БД (через
+# connection.execute_wrapper), время рендера шаблонов и представления.
+# Итог уходит в заголовок Server-Timing, медленные запросы - в лог
+# main.performance вместе с именем маршрута, а перцентили по маршрутам
+# раз в PERF_FLUSH_INTERVAL секунд - в лог main.performance.routes
+# (в settings.LOGGING это файл с ротацией).
+#
+# Замеряется только доля запросов PERF_SAMPLE_RATE, остальные проходят
+# без обёрток вовсе. Ответы со streaming_content дочитываются уже после
+# middleware - их запросы к БД во время отдачи тела не учитываются.
+
+SAMPLE_RATE = 0.1
+SLOW_QUERY_MS = 100
+FLUSH_INTERVAL = 60
+# Сколько замеров маршрута хранить между сбросами (выборка-резервуар)
+MAX_SAMPLES = 1000
+SQL_LOG_LENGTH = 500
+
+logger = logging.getLogger('main.performance')
+routes_logger = logging.getLogger('main.performance.routes')
+
+_current = ContextVar('request_stats', default=None)
+_template_timer_installed = False
+
+
+class RequestStats:
+    """Счётчики одного запроса; сам объект - обёртка для execute_wrapper."""
+
+    def __init__(self, slow_query_ms):
+        self.slow_query = slow_query_ms / 1000
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.template = 0.0
+        self.template_depth = 0
+        self.view = 0.0
+        self.view_started = None
+        self.route = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db += elapsed
+            if elapsed >= self.slow_query:
+                logger.warning('Медленный SQL %.1f мс, маршрут %s: %s',
+                               elapsed * 1000, self.route or '-', sql[:SQL_LOG_LENGTH])
+
+    def server_timing(self, total):
+        return ', '.join((
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template * 1000:.1f}',
+            f'view;dur={self.view * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ))
+
+
+def _install_template_timer():
+    """Оборачивает рендер шаблонов Django: время идёт в RequestStats текущего запроса."""
+    global _template_timer_installed
+    if _template_timer_installed:
+        return
+    original = django_backend.Template.render
+
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return original(self, context, request)
+        # render_to_string внутри шаблона не считаем дважды
+        stats.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            stats.template_depth -= 1
+            if not stats.template_depth:
+                stats.template += time.perf_counter() - started
+
+    django_backend.Template.render = render
+    _template_timer_installed = True
+
+
+class RouteAggregates:
+    """Замеры по маршрутам; раз в interval секунд пишет p50/p95/p99 и обнуляется."""
+
+    def __init__(self, interval=FLUSH_INTERVAL, max_samples=MAX_SAMPLES):
+        self.interval = interval
+        self.max_samples = max_samples
+        self.lock = threading.Lock()
+        self.flushed = time.monotonic()
+        self.samples = defaultdict(list)
+        self.seen = defaultdict(int)
+
+    def add(self, route, total, stats):
+        sample = (total, stats.db, stats.queries)
+        with self.lock:
+            self.seen[route] += 1
+            samples = self.samples[route]
+            if len(samples) < self.max_samples:
+                samples.append(sample)
+            else:
+                i = random.randrange(self.seen[route])
+                if i < self.max_samples:
+                    samples[i] = sample
+            due = time.monotonic() - self.flushed >= self.interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            samples, seen = self.samples, self.seen
+            self.samples, self.seen = defaultdict(list), defaultdict(int)
+            self.flushed = time.monotonic()
+        for route in sorted(samples):
+            totals = sorted(sample[0] for sample in samples[route])
+            db = sorted(sample[1] for sample in samples[route])
+            routes_logger.info(json.dumps({
+                'time': round(time.time()),
+                'route': route,
+                'requests': seen[route],
+                'p50_ms': round(percentile(totals, 50) * 1000, 2),
+                'p95_ms': round(percentile(totals, 95) * 1000, 2),
+                'p99_ms': round(percentile(totals, 99) * 1000, 2),
+                'db_p95_ms': round(percentile(db, 95) * 1000, 2),
+                'queries_max': max(sample[2] for sample in samples[route]),
+            }, ensure_ascii=False))
+
+
+class PerformanceMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PERF_SAMPLE_RATE', SAMPLE_RATE)
+        self.slow_query_ms = getattr(settings, 'PERF_SLOW_QUERY_MS', SLOW_QUERY_MS)
+        self.routes = RouteAggregates(getattr(settings, 'PERF_FLUSH_INTERVAL', FLUSH_INTERVAL))
+        _install_template_timer()
+
+    def __call__(self, request):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        stats = RequestStats(self.slow_query_ms)
+        token = _current.set(stats)
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        now = time.perf_counter()
+        if stats.view_started is not None:
+            stats.view = now - stats.view_started
+        total = now - stats.started
+        response['Server-Timing'] = stats.server_timing(total)
+        if stats.route:
+            self.routes.add(stats.route, total, stats)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = _current.get()
+        if stats is not None:
+            stats.route = request.resolver_match.view_name
+            stats.view_started = time.perf_counter()
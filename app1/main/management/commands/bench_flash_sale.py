@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Много покупателей одновременно покупают последние единицы товара: '
+            'пропускная способность и проверка, что не продано больше, чем было')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=200)
+        parser.add_argument('--stock', type=int, default=20)
+        parser.add_argument('--quantity', type=int, default=1, help='Единиц в одной покупке')
+        parser.add_argument('--concurrency', type=int, default=16)
+
+    def handle(self, *args, **options):
+        result = benchmark.run_flash_sale(
+            options['buyers'], options['stock'], options['quantity'], options['concurrency'])
+        self.stdout.write(
+            f'покупателей {result["requests"]}, {result["rps"]} покупок/с, '
+            f'p50 {result["p50_ms"]} мс, p95 {result["p95_ms"]} мс, p99 {result["p99_ms"]} мс'
+        )
+        self.stdout.write(
+            f'продано {result["sold"]}, отказано {result["rejected"]}, ошибок {result["errors"]}; '
+            f'в заказах {result["ordered_units"]} шт., осталось на складе {result["stock_left"]}, '
+            f'в резерве {result["reserved_left"]}'
+        )
+        expected = min(options['stock'] // options['quantity'], options['buyers'])
+        if (result['sold'] != expected or result['errors'] or result['reserved_left']
+                or result['ordered_units'] + result['stock_left'] != options['stock']):
+            raise CommandError('Нарушена корректность: продано не столько, сколько было на складе')
+        self.stdout.write(self.style.SUCCESS('Перепродажи нет'))
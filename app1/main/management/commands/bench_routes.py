@@ -0,0 +1,86 @@
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from main import benchmark
+from main.models import Order, Product, Review
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет все маршруты сайта: p50/p95/p99 и число SQL-запросов; '
+            'сохраняет JSON и сравнивает с прошлым прогоном')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--route', action='append', dest='routes', help='Только эти маршруты')
+        parser.add_argument('--cold', action='store_true', help='Очищать кэш перед каждым запросом')
+        parser.add_argument('--output', help='Сохранить результаты в JSON-файл')
+        parser.add_argument('--compare', help='JSON прошлого прогона для сравнения')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Допустимый рост p95 (доля), по умолчанию 0.2')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        product_id, category_id = benchmark.sample_ids()
+        if product_id is None:
+            raise CommandError('В базе нет товаров - сначала manage.py seed_data')
+        cases = benchmark.route_cases(product_id, category_id)
+        if options['routes']:
+            unknown = set(options['routes']) - set(cases)
+            if unknown:
+                raise CommandError('Неизвестные маршруты: ' + ', '.join(sorted(unknown)))
+            cases = {name: cases[name] for name in options['routes']}
+
+        results = benchmark.run_routes(cases, benchmark.bench_users(), options['iterations'], options['cold'])
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'iterations': options['iterations'],
+                'cold': options['cold'],
+                'products': Product.objects.count(),
+                'reviews': Review.objects.count(),
+                'orders': Order.objects.count(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'routes': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+
+        self.stdout.write(f'{"маршрут":<16} {"p50, мс":>9} {"p95, мс":>9} {"p99, мс":>9} '
+                          f'{"запросов":>9} {"ошибок":>7}')
+        for name, row in results.items():
+            self.stdout.write(f'{name:<16} {row["p50_ms"]:>9} {row["p95_ms"]:>9} {row["p99_ms"]:>9} '
+                              f'{row["max_queries"]:>9} {row["errors"]:>7}')
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = json.load(f)['routes']
+            regressions = self._compare(previous, results, options['threshold'])
+            if regressions and options['fail_on_regression']:
+                # CommandError из manage.py - код выхода 1, из call_command - исключение
+                raise CommandError('Регрессии производительности: ' + ', '.join(regressions))
+
+    def _compare(self, previous, results, threshold):
+        self.stdout.write('')
+        self.stdout.write(f'{"маршрут":<16} {"p95 было":>9} {"p95 стало":>9} {"изм.":>7} {"запросы":>9}')
+        regressions = []
+        for name, before, now, change, q_before, q_now, regression in benchmark.compare(previous, results, threshold):
+            if before is None:
+                self.stdout.write(f'{name:<16} {"-":>9} {now:>9} {"new":>7} {q_now:>9}')
+                continue
+            line = f'{name:<16} {before:>9} {now:>9} {change:>+7.0%} {f"{q_before}->{q_now}":>9}'
+            if regression:
+                regressions.append(name)
+                line = self.style.ERROR(line + '  регрессия')
+            self.stdout.write(line)
+        if regressions:
+            self.stdout.write(self.style.ERROR('Регрессии: ' + ', '.join(regressions)))
+        else:
+            self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+        return regressions
@@ -0,0 +1,94 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main import benchmark
+from main.models import Product
+
+DEFAULT_PATHS = ('/', '/catalog/', '/catalog/?sort=price', '/api/products/?fields=id,name,price')
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность и p99 страниц каталога '
+            'под WSGI (синхронные представления) и ASGI (асинхронные)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=('both', 'wsgi', 'asgi'), default='both')
+        parser.add_argument('--concurrency', default='1,8,32',
+                            help='Уровни параллельности через запятую')
+        parser.add_argument('--requests', type=int, default=400,
+                            help='Запросов на каждый уровень')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Адрес для прогона (можно несколько); по умолчанию - главная, '
+                                 'каталог, карточка товара и фид')
+        parser.add_argument('--output', help='Сохранить результаты в JSON-файл')
+        parser.add_argument('--json', action='store_true', help='Вывести результаты JSON в stdout')
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError('--concurrency: ожидаются числа через запятую')
+
+        if options['mode'] == 'both':
+            # Набор представлений выбирается в urls.py при импорте, поэтому
+            # каждый режим меряем в отдельном процессе
+            results = {mode: self._run_child(mode, options) for mode in ('wsgi', 'asgi')}
+        else:
+            results = {options['mode']: self._run(options['mode'], levels, options)}
+
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+            return
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+        self._report(results)
+
+    def _paths(self, options):
+        if options['paths']:
+            return options['paths']
+        paths = list(DEFAULT_PATHS)
+        product_id = Product.objects.filter(is_active=True).values_list('pk', flat=True).first()
+        if product_id is not None:
+            paths.append(f'/product/{product_id}/')
+        return paths
+
+    def _run(self, mode, levels, options):
+        expected = mode == 'asgi'
+        if settings.ASYNC_VIEWS != expected:
+            raise CommandError(f'Для режима {mode} нужен ECOHOME_ASYNC_VIEWS={int(expected)}')
+        paths = self._paths(options)
+        if mode == 'asgi':
+            from django.core.handlers.asgi import ASGIHandler
+            handler, run = ASGIHandler(), benchmark.run_asgi
+        else:
+            from django.core.handlers.wsgi import WSGIHandler
+            handler, run = WSGIHandler(), benchmark.run_wsgi
+
+        # Прогрев: кэш страниц и дерево категорий
+        run(handler, paths, len(paths) * 2, 1)
+        return {str(level): run(handler, paths, options['requests'], level) for level in levels}
+
+    def _run_child(self, mode, options):
+        env = dict(os.environ, ECOHOME_ASYNC_VIEWS='1' if mode == 'asgi' else '0')
+        command = [sys.executable, sys.argv[0], 'bench_views', '--mode', mode, '--json',
+                   '--concurrency', options['concurrency'], '--requests', str(options['requests'])]
+        for path in options['paths'] or ():
+            command += ['--path', path]
+        completed = subprocess.run(command, env=env, capture_output=True, text=True)
+        if completed.returncode:
+            raise CommandError(f'{mode}: {completed.stderr.strip()}')
+        return json.loads(completed.stdout)[mode]
+
+    def _report(self, results):
+        self.stdout.write(f'{"режим":<6} {"парал.":>6} {"запр/с":>9} {"p50, мс":>9} '
+                          f'{"p99, мс":>9} {"ошибок":>7}')
+        for mode, levels in results.items():
+            for level, row in levels.items():
+                self.stdout.write(f'{mode:<6} {level:>6} {row["rps"]:>9} {row["p50_ms"]:>9} '
+                                  f'{row["p99_ms"]:>9} {row["errors"]:>7}')
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import recommendations
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает блок «С этим товаром покупают» по новым заказам '
+            '(запускать по расписанию; --full - с нуля, например раз в сутки)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Пересчитать по всем заказам (учесть отмены и удаления)')
+        parser.add_argument('--top-k', type=int, default=recommendations.TOP_K)
+        parser.add_argument('--batch-size', type=int, default=recommendations.BATCH_SIZE,
+                            help='Сколько id заказов обрабатывать одним запросом')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        start, end = recommendations.refresh(
+            full=options['full'],
+            top_k=options['top_k'],
+            batch_size=options['batch_size'],
+            progress=lambda n: self.stdout.write(f'  учтены заказы до №{n}...'),
+        )
+        elapsed = time.monotonic() - started
+        if end == start:
+            self.stdout.write(self.style.SUCCESS('Новых заказов нет'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Рекомендации обновлены: заказы №{start + 1}-{end} за {elapsed:.1f} с'
+        ))
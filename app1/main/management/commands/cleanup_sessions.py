@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import sessions
+
+
+class Command(BaseCommand):
+    help = 'Удаляет истёкшие сессии и брошенные гостевые корзины пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=sessions.BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Пауза между пачками, с: даёт пройти записям сайта')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total_sessions, total_carts = sessions.SessionStore.clear_expired(
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            progress=lambda s, c: self.stdout.write(f'  удалено сессий {s}, корзин {c}...'),
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено сессий: {total_sessions}, гостевых корзин: {total_carts} за {elapsed:.1f} с'
+        ))
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main import catalog_io, category_tree
+from main.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка товаров в CSV или JSON Lines (формат import_products)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл выгрузки; "-" - stdout')
+        parser.add_argument('--format', choices=catalog_io.FORMATS,
+                            help='По умолчанию - по расширению файла')
+        parser.add_argument('--category', help='slug категории (вместе с подкатегориями)')
+        parser.add_argument('--active-only', action='store_true')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = catalog_io.detect_format(path, options['format'])
+        products = Product.objects.all()
+        if options['category']:
+            category_id = Category.objects.filter(slug=options['category']).values_list('id', flat=True).first()
+            if category_id is None:
+                raise CommandError(f'Категория не найдена: {options["category"]}')
+            products = products.filter(category_id__in=category_tree.get_tree().descendant_ids(category_id))
+        if options['active_only']:
+            products = products.filter(is_active=True)
+
+        started = time.monotonic()
+        total = 0
+        target = self.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+        try:
+            writer = catalog_io.RowWriter(target, fmt, catalog_io.FIELDS)
+            for row in catalog_io.export_rows(products):
+                writer.write(row)
+                total += 1
+        finally:
+            if target is not self.stdout:
+                target.close()
+        if path != '-':
+            elapsed = time.monotonic() - started
+            rate = total / elapsed if elapsed else 0
+            self.stdout.write(self.style.SUCCESS(
+                f'Выгружено товаров: {total} за {elapsed:.1f} с ({rate:.0f} строк/с)'
+            ))
@@ -0,0 +1,34 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from main import images, page_cache
+from main.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии и WebP-варианты изображений товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--force', action='store_true',
+                            help='Пересоздать и уже существующие производные')
+
+    def handle(self, *args, **options):
+        names = set(Product.objects.exclude(image='').values_list('image', flat=True).iterator())
+        if not options['force']:
+            names = {name for name in names
+                     if not all(images.has_derivatives(name, size) for size in images.SIZES)}
+
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {pool.submit(images.generate, name): name for name in names}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'{futures[future]}: {e}')
+        page_cache.invalidate()
+        self.stdout.write(self.style.SUCCESS(f'Обработано изображений: {done}, ошибок: {failed}'))
@@ -0,0 +1,63 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main import catalog_io
+
+
+class Command(BaseCommand):
+    help = 'Массовый импорт товаров из CSV или JSON Lines (upsert по артикулу sku)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл импорта; "-" - stdin')
+        parser.add_argument('--format', choices=catalog_io.FORMATS,
+                            help='По умолчанию - по расширению файла')
+        parser.add_argument('--batch-size', type=int, default=catalog_io.BATCH_SIZE)
+        parser.add_argument('--rejects', help='Куда писать отклонённые строки '
+                                              '(по умолчанию <файл>.rejects.<формат>)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = catalog_io.detect_format(path, options['format'])
+        rejects_path = options['rejects'] or (
+            f'{path}.rejects.{fmt}' if path != '-' else f'rejects.{fmt}')
+
+        try:
+            source = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8-sig')
+        except OSError as e:
+            raise CommandError(str(e))
+
+        # Файл отказов создаём только при первой плохой строке
+        state = {'writer': None, 'file': None}
+
+        def reject(row, error):
+            if state['writer'] is None:
+                state['file'] = open(rejects_path, 'w', newline='', encoding='utf-8')
+                state['writer'] = catalog_io.RowWriter(state['file'], fmt, catalog_io.FIELDS + ('error',))
+            state['writer'].write(dict(row, error=error))
+
+        def progress(stats, elapsed):
+            rate = stats['rows'] / elapsed if elapsed else 0
+            self.stdout.write(f'  строк {stats["rows"]}, создано {stats["created"]}, '
+                              f'обновлено {stats["updated"]}, отклонено {stats["rejected"]} '
+                              f'({rate:.0f} строк/с)')
+
+        try:
+            with source:
+                stats = catalog_io.import_rows(
+                    catalog_io.read_rows(source, fmt),
+                    batch_size=options['batch_size'],
+                    reject=reject,
+                    progress=progress,
+                )
+        finally:
+            if state['file'] is not None:
+                state['file'].close()
+
+        rate = stats['rows'] / stats['seconds'] if stats['seconds'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Импорт завершён: создано {stats["created"]}, обновлено {stats["updated"]}, '
+            f'отклонено {stats["rejected"]} за {stats["seconds"]:.1f} с ({rate:.0f} строк/с)'
+        ))
+        if stats['rejected']:
+            self.stdout.write(f'Отклонённые строки: {rejects_path}')
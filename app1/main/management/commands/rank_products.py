@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import ranking
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает хиты продаж для главной и категорий (запускать по расписанию, '
+            'например раз в 10 минут; --rebuild-counters - раз в сутки)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-n', type=int, default=ranking.TOP_N)
+        parser.add_argument('--rebuild-counters', action='store_true',
+                            help='Сначала пересчитать счётчики продаж по всем заказам (учесть отмены и удаления)')
+        parser.add_argument('--batch-size', type=int, default=ranking.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['rebuild_counters']:
+            products = ranking.rebuild_counters(
+                batch_size=options['batch_size'],
+                progress=lambda n: self.stdout.write(f'  учтено позиций заказов {n}...'),
+            )
+            self.stdout.write(f'Счётчики продаж пересчитаны: товаров {products}')
+        lists = ranking.rank(top_n=options['top_n'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Хиты продаж обновлены: списков {lists} за {elapsed:.1f} с'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from main import facets
+from main.models import Category
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает фасетные счётчики каталога для всех категорий'
+
+    def handle(self, *args, **options):
+        facets.recount_all()
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики пересчитаны для {Category.objects.count()} категорий'
+        ))
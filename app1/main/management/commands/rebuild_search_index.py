@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import search
+from main.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Полностью перестраивает полнотекстовый индекс товаров (FTS5)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=search.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            self.stderr.write('Полнотекстовый поиск работает только на SQLite')
+            return
+
+        started = time.monotonic()
+        total = search.rebuild(
+            Product.objects.all(),
+            batch_size=options['batch_size'],
+            progress=lambda n: self.stdout.write(f'  проиндексировано {n}...'),
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Индекс перестроен: {total} товаров за {elapsed:.1f} с'
+        ))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import reservations
+
+
+class Command(BaseCommand):
+    help = 'Снимает просроченные резервы товара пачками (запускать по расписанию, например раз в минуту)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=reservations.BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Пауза между пачками, с: даёт пройти записям сайта')
+        parser.add_argument('--recount', action='store_true',
+                            help='Затем пересчитать Product.reserved по строкам резервов')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        released = reservations.release_expired(
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            progress=lambda n: self.stdout.write(f'  снято резервов {n}...'),
+        )
+        if options['recount']:
+            reservations.recount()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Снято просроченных резервов: {released} за {elapsed:.1f} с'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from main import ratings
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованный рейтинг товаров по одобренным отзывам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fixed = ratings.recount(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Исправлено товаров: {fixed}'))
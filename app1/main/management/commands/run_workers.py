@@ -0,0 +1,72 @@
+import multiprocessing
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import tasks
+
+
+def _worker(number, batch_size, poll, stop):
+    # Дочерний процесс: при старте через spawn Django ещё не настроен
+    import django
+    django.setup()
+    from django.db import connections
+    from main import tasks
+
+    # Остановку ведёт родитель через stop, Ctrl+C в группе процессов игнорируем
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        tasks.work(f'{tasks.worker_name()}#{number}', batch_size=batch_size, poll=poll, stop=stop)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Запускает пул процессов, выполняющих задачи из очереди (письма, обновление витрины продаж)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2)
+        parser.add_argument('--batch-size', type=int, default=tasks.BATCH_SIZE,
+                            help='Сколько задач процесс забирает за раз')
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help='Пауза при пустой очереди, с')
+        parser.add_argument('--once', action='store_true',
+                            help='Выполнить готовые задачи в этом процессе и выйти')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['once']:
+            done, failed = tasks.work(
+                batch_size=options['batch_size'], once=True,
+                progress=lambda done, failed: self.stdout.write(f'  выполнено {done}, с ошибкой {failed}...'),
+            )
+            elapsed = time.monotonic() - started
+            self.stdout.write(self.style.SUCCESS(
+                f'Выполнено задач: {done}, с ошибкой: {failed} за {elapsed:.1f} с'))
+            return
+
+        from django.db import connections
+        # Соединения родителя не должны достаться дочерним процессам
+        connections.close_all()
+        stop = multiprocessing.Event()
+        processes = [
+            multiprocessing.Process(target=_worker, args=(n, options['batch_size'], options['poll'], stop))
+            for n in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f'Запущено процессов: {len(processes)}, остановка - Ctrl+C')
+
+        # Обработчик сигнала только ставит флаг: stop.set() прямо в нём
+        # может заблокироваться на замке, который держит stop.wait()
+        signals = []
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda signum, frame: signals.append(signum))
+        while not signals and any(process.is_alive() for process in processes):
+            time.sleep(0.5)
+        stop.set()
+        for process in processes:
+            process.join()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Воркеры остановлены через {elapsed:.1f} с'))
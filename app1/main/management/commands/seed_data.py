@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main import seed
+from main.models import Category
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими данными заданного масштаба (воспроизводимо по --seed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(seed.SCALES), default='small')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='seed',
+                            help='Префикс slug, артикулов и логинов (для повторного запуска)')
+        for name in ('products', 'users', 'reviews', 'orders'):
+            parser.add_argument(f'--{name}', type=int, help=f'Переопределить число: {name}')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if Category.objects.filter(slug__startswith=f'{prefix}-').exists():
+            raise CommandError(f'Данные с префиксом "{prefix}" уже есть - задайте другой --prefix')
+
+        started = time.monotonic()
+        config = seed.generate(
+            scale=options['scale'],
+            seed=options['seed'],
+            prefix=prefix,
+            progress=lambda kind, n: self.stdout.write(f'  {kind}: {n}...'),
+            **{name: options[name] for name in ('products', 'users', 'reviews', 'orders')},
+        )
+        elapsed = time.monotonic() - started
+        summary = ', '.join(f'{key}={value}' for key, value in config.items())
+        self.stdout.write(self.style.SUCCESS(f'Данные созданы за {elapsed:.1f} с: {summary}'))
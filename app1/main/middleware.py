@@ -0,0 +1,95 @@
+import mimetypes
+import os
+import posixpath
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe
+
+# Раздача собранной статики (STATIC_ROOT) самим приложением, без CDN.
+# Выбирает заранее сжатый вариант (.br/.gz) по Accept-Encoding, а файлам
+# с хэшем в имени ставит "вечный" immutable Cache-Control.
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+SHORT = 'public, max-age=300'
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def accepted_encodings(header):
+    """Кодировки из Accept-Encoding с q > 0; '*' - любые, кроме явно запрещённых (q=0)."""
+    allowed, refused = set(), set()
+    for part in header.split(','):
+        coding, *params = [item.strip() for item in part.split(';')]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        (allowed if q > 0 else refused).add(coding.lower())
+    if '*' in allowed:
+        allowed |= {name for name, _ in ENCODINGS} - refused
+    return allowed - refused
+
+
+class StaticFilesMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.root = os.path.realpath(settings.STATIC_ROOT) if settings.STATIC_ROOT else None
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        self._hashed = None
+
+    def __call__(self, request):
+        if self.root and request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix):
+            response = self.serve(request, request.path[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    @property
+    def hashed_names(self):
+        # Имена файлов с хэшем берём из манифеста collectstatic
+        if self._hashed is None:
+            from django.contrib.staticfiles.storage import staticfiles_storage
+            manifest = getattr(staticfiles_storage, 'hashed_files', None) or {}
+            self._hashed = set(manifest.values())
+        return self._hashed
+
+    def resolve(self, name):
+        name = posixpath.normpath(unquote(name)).lstrip('/')
+        path = os.path.realpath(os.path.join(self.root, name))
+        if not path.startswith(self.root + os.sep) or not os.path.isfile(path):
+            return None, None
+        return name, path
+
+    def serve(self, request, name):
+        name, path = self.resolve(name)
+        if path is None:
+            return None
+
+        stat = os.stat(path)
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        if if_modified_since and int(stat.st_mtime) <= if_modified_since:
+            response = HttpResponseNotModified()
+        else:
+            accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            content_type, _ = mimetypes.guess_type(path)
+            encoding, served_path = None, path
+            for candidate, suffix in ENCODINGS:
+                if candidate in accepted and os.path.isfile(path + suffix):
+                    encoding, served_path = candidate, path + suffix
+                    break
+            response = FileResponse(open(served_path, 'rb'),
+                                    content_type=content_type or 'application/octet-stream')
+            if encoding:
+                response['Content-Encoding'] = encoding
+            del response['Content-Disposition']
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Vary'] = 'Accept-Encoding'
+        response['Cache-Control'] = IMMUTABLE if name in self.hashed_names else SHORT
+        return response
@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-18 07:42
+
+from django.db import migrations, models
+
+
+def fill_paths(apps, schema_editor):
+    Category = apps.get_model('main', 'Category')
+    parents = dict(Category.objects.values_list('id', 'parent_id'))
+
+    def build(pk, seen=()):
+        parent_id = parents.get(pk)
+        if parent_id is None or parent_id in seen:
+            return f'/{pk}/'
+        return f'{build(parent_id, seen + (pk,))}{pk}/'
+
+    categories = list(Category.objects.all())
+    for category in categories:
+        category.path = build(category.pk)
+        category.depth = category.path.count('/') - 2
+    Category.objects.bulk_update(categories, ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_product_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Глубина'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255, verbose_name='Путь в дереве'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 6.0 on 2026-10-18 08:10
+
+from django.db import migrations
+
+# Стеммер - чистый Python без моделей, его можно звать из миграции
+from main.stemmer import tokenize
+
+BATCH_SIZE = 1000
+INSERT_SQL = 'INSERT INTO main_product_search (rowid, name, description, material) VALUES (%s, %s, %s, %s)'
+
+
+def create_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS main_product_search USING fts5("
+        "name, description, material, tokenize='unicode61 remove_diacritics 2')"
+    )
+    # Уже существующие товары - в индекс, как делает search.rebuild
+    Product = apps.get_model('main', 'Product')
+    products = Product.objects.filter(is_active=True).order_by('pk').values_list(
+        'pk', 'name', 'description', 'material')
+    rows = (
+        (pk, *(' '.join(tokenize(text)) for text in (name, description, material)))
+        for pk, name, description, material in products.iterator(chunk_size=BATCH_SIZE)
+    )
+    with schema_editor.connection.cursor() as cursor:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                cursor.executemany(INSERT_SQL, batch)
+                batch = []
+        if batch:
+            cursor.executemany(INSERT_SQL, batch)
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS main_product_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_category_materialized_path'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 6.0 on 2026-10-18 07:45
+
+import django.db.models.deletion
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+# Границы ценовых фасетов на момент миграции (см. facets.PRICE_BUCKETS)
+PRICE_BUCKETS = [
+    ('0-500', None, Decimal('500')),
+    ('500-1000', Decimal('500'), Decimal('1000')),
+    ('1000-3000', Decimal('1000'), Decimal('3000')),
+    ('3000-', Decimal('3000'), None),
+]
+
+
+def fill_counts(apps, schema_editor):
+    Product = apps.get_model('main', 'Product')
+    FacetCount = apps.get_model('main', 'FacetCount')
+    active = Product.objects.filter(is_active=True).order_by()
+    rows = [
+        FacetCount(category_id=category_id, facet='material', value=material, count=n)
+        for category_id, material, n in active.exclude(material='')
+        .values_list('category_id', 'material').annotate(n=Count('id'))
+    ]
+    buckets = {}
+    for key, low, high in PRICE_BUCKETS:
+        q = Q()
+        if low is not None:
+            q &= Q(price__gte=low)
+        if high is not None:
+            q &= Q(price__lt=high)
+        buckets[key] = q
+    totals = active.values('category_id').annotate(
+        stock=Count('id', filter=Q(stock_quantity__gt=0)),
+        **{f'price_{i}': Count('id', filter=buckets[key]) for i, (key, _, _) in enumerate(PRICE_BUCKETS)},
+    )
+    for row in totals:
+        if row['stock']:
+            rows.append(FacetCount(category_id=row['category_id'], facet='stock', value='1', count=row['stock']))
+        for i, (key, _, _) in enumerate(PRICE_BUCKETS):
+            if row[f'price_{i}']:
+                rows.append(FacetCount(category_id=row['category_id'], facet='price', value=key,
+                                       count=row[f'price_{i}']))
+    FacetCount.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('material', 'Материал'), ('price', 'Цена'), ('stock', 'Наличие')], max_length=20, verbose_name='Фасет')),
+                ('value', models.CharField(max_length=100, verbose_name='Значение')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_counts', to='main.category')),
+            ],
+            options={
+                'verbose_name': 'Счётчик фасета',
+                'verbose_name_plural': 'Счётчики фасетов',
+                'constraints': [models.UniqueConstraint(fields=('category', 'facet', 'value'), name='facetcount_unique')],
+            },
+        ),
+        migrations.RunPython(fill_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 6.0 on 2026-10-18 07:49
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_ratings(apps, schema_editor):
+    # Как ratings.recount: учитываются только одобренные отзывы
+    Product = apps.get_model('main', 'Product')
+    Review = apps.get_model('main', 'Review')
+    stats = Review.objects.filter(is_approved=True).order_by().values('product_id').annotate(
+        n=Count('id'), total=Sum('rating'))
+    products = []
+    for row in stats:
+        products.append(Product(
+            pk=row['product_id'], rating_count=row['n'], rating_sum=row['total'],
+            rating_avg=(Decimal(row['total']) / row['n']).quantize(Decimal('0.01')),
+        ))
+    Product.objects.bulk_update(products, ['rating_count', 'rating_sum', 'rating_avg'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=3, verbose_name='Средняя оценка'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число оценок'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', 'is_approved', 'created_at'], name='review_product_approved'),
+        ),
+        migrations.RunPython(fill_ratings, migrations.RunPython.noop),
+    ]
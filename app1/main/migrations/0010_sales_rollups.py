@@ -0,0 +1,44 @@
+# Generated by Django 6.0 on 2026-10-18 07:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True, verbose_name='День')),
+                ('orders', models.IntegerField(default=0, verbose_name='Заказов')),
+                ('units', models.IntegerField(default=0, verbose_name='Единиц товара')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+            ],
+            options={
+                'verbose_name': 'Продажи за день',
+                'verbose_name_plural': 'Продажи по дням',
+            },
+        ),
+        migrations.CreateModel(
+            name='CategoryDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('orders', models.IntegerField(default=0, verbose_name='Заказов')),
+                ('units', models.IntegerField(default=0, verbose_name='Единиц товара')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='main.category')),
+            ],
+            options={
+                'verbose_name': 'Продажи категории за день',
+                'verbose_name_plural': 'Продажи по категориям',
+                'constraints': [models.UniqueConstraint(fields=('day', 'category'), name='categorydailysales_unique')],
+            },
+        ),
+    ]
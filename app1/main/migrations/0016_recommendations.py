@@ -0,0 +1,56 @@
+# Generated by Django 6.0 on 2026-10-18 08:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_task_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_order_id', models.IntegerField(verbose_name='Последний учтённый заказ')),
+                ('full', models.BooleanField(default=False, verbose_name='Полный пересчёт')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата')),
+            ],
+            options={
+                'verbose_name': 'Пересчёт рекомендаций',
+                'verbose_name_plural': 'Пересчёты рекомендаций',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductPair',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orders', models.IntegerField(default=0, verbose_name='Заказов вместе')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.product')),
+            ],
+            options={
+                'verbose_name': 'Пара товаров',
+                'verbose_name_plural': 'Пары товаров',
+                'constraints': [models.UniqueConstraint(fields=('product', 'other'), name='productpair_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Recommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Место')),
+                ('score', models.IntegerField(verbose_name='Заказов вместе')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='main.product')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.product')),
+            ],
+            options={
+                'verbose_name': 'Рекомендация',
+                'verbose_name_plural': 'Рекомендации',
+                'constraints': [models.UniqueConstraint(fields=('product', 'rank'), name='recommendation_product_rank')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 6.0 on 2026-10-18 08:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSales',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sales', serialize=False, to='main.product')),
+                ('score', models.FloatField(db_index=True, default=0, verbose_name='Вес продаж')),
+            ],
+            options={
+                'verbose_name': 'Продажи товара',
+                'verbose_name_plural': 'Продажи товаров',
+            },
+        ),
+        migrations.CreateModel(
+            name='Bestseller',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Место')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.category')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.product')),
+            ],
+            options={
+                'verbose_name': 'Хит продаж',
+                'verbose_name_plural': 'Хиты продаж',
+                'indexes': [models.Index(fields=['category', 'rank'], name='bestseller_category_rank')],
+            },
+        ),
+    ]
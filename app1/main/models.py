@@ -1,5 +1,9 @@
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
+from django.utils import timezone
 
 # Кастомная модель пользователя
 class CustomUser(AbstractUser):
@@ -20,6 +24,12 @@ class Category(models.Model):
     name = models.CharField("Название", max_length=100)
     slug = models.SlugField("URL", max_length=100, unique=True)
     parent = models.ForeignKey('self', on_delete=models.SET_NULL, verbose_name="Родительская категория", null=True, blank=True)
+    # Материализованный путь вида "/1/5/12/": потомки категории - это все
+    # категории, чей путь начинается с её пути
+    path = models.CharField("Путь в дереве", max_length=255, db_index=True, editable=False, default='')
+    depth = models.PositiveSmallIntegerField("Глубина", default=0, editable=False)
+    # Валидатор условных GET каталога (main/http_cache.py)
+    updated_at = models.DateTimeField("Дата изменения", auto_now=True, db_index=True)
     
     class Meta:
         verbose_name = "Категория"
@@ -27,25 +37,120 @@ class Category(models.Model):
     
     def __str__(self):
         return self.name
+    
+    def clean(self):
+        if self.pk and self.parent_id and self.path and self.parent.path.startswith(self.path):
+            raise ValidationError({'parent': 'Нельзя переместить категорию внутрь её же подкатегории'})
+    
+    def save(self, *args, **kwargs):
+        old_path = self.path
+        parent_path = '/'
+        if self.parent_id:
+            parent_path = Category.objects.values_list('path', flat=True).get(pk=self.parent_id)
+            if old_path and parent_path.startswith(old_path):
+                raise ValueError('Нельзя переместить категорию внутрь её же подкатегории')
+        super().save(*args, **kwargs)
+        
+        new_path = f'{parent_path}{self.pk}/'
+        if new_path == old_path:
+            return
+        
+        new_depth = new_path.count('/') - 2
+        Category.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+        if old_path:
+            # Перенос поддерева: переписываем префикс пути у всех потомков одним UPDATE
+            Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+                depth=F('depth') + (new_depth - self.depth),
+            )
+        self.path, self.depth = new_path, new_depth
+        # post_save уже сработал до записи пути - сбрасываем кэш дерева ещё раз
+        from .category_tree import invalidate
+        invalidate()
+    
+    def get_descendants(self, include_self=True):
+        qs = Category.objects.filter(path__startswith=self.path)
+        if not include_self:
+            qs = qs.exclude(pk=self.pk)
+        return qs
+    
+    @classmethod
+    def rebuild_paths(cls):
+        """Пересчитывает пути всего дерева (после удаления категорий и т.п.)."""
+        parents = dict(cls.objects.values_list('id', 'parent_id'))
+        
+        def build(pk, seen=()):
+            parent_id = parents.get(pk)
+            if parent_id is None or parent_id in seen:
+                return f'/{pk}/'
+            return f'{build(parent_id, seen + (pk,))}{pk}/'
+        
+        changed = []
+        for category in cls.objects.only('id', 'path', 'depth'):
+            path = build(category.pk)
+            if path != category.path:
+                category.path, category.depth = path, path.count('/') - 2
+                changed.append(category)
+        cls.objects.bulk_update(changed, ['path', 'depth'], batch_size=500)
+        return len(changed)
 
 class Product(models.Model):
+    # Артикул поставщика - ключ для массового импорта (import_products)
+    sku = models.CharField("Артикул", max_length=64, unique=True, null=True, blank=True)
     name = models.CharField("Название", max_length=200)
     description = models.TextField("Описание")
     price = models.DecimalField("Цена", max_digits=10, decimal_places=2)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, verbose_name="Категория")
     image = models.ImageField("Изображение", upload_to='products/', blank=True)
     stock_quantity = models.IntegerField("Количество на складе", default=0)
+    # Сумма активных резервов корзин (см. reservations.py); доступно = склад - резерв
+    reserved = models.PositiveIntegerField("В резерве", default=0, editable=False)
     material = models.CharField("Материал", max_length=100, blank=True)
     is_active = models.BooleanField("Активен", default=True)
     created_at = models.DateTimeField("Дата создания", auto_now_add=True)
+    updated_at = models.DateTimeField("Дата изменения", auto_now=True, db_index=True)
+    # Денормализованный рейтинг по одобренным отзывам (см. ratings.py)
+    rating_count = models.PositiveIntegerField("Число оценок", default=0, editable=False)
+    rating_sum = models.PositiveIntegerField("Сумма оценок", default=0, editable=False)
+    rating_avg = models.DecimalField("Средняя оценка", max_digits=3, decimal_places=2, default=0, editable=False)
     
     class Meta:
         verbose_name = "Товар"
         verbose_name_plural = "Товары"
+        indexes = [
+            # Каталог: фильтр по категории + сортировка по новизне
+            models.Index(fields=['is_active', 'category', 'created_at'], name='product_active_cat_created'),
+            # Каталог: сортировка по цене
+            models.Index(fields=['is_active', 'price'], name='product_active_price'),
+        ]
     
     def __str__(self):
         return self.name
 
+    @property
+    def available(self):
+        return max(self.stock_quantity - self.reserved, 0)
+
+class FacetCount(models.Model):
+    """Предрасчитанное число активных товаров категории (без потомков) по значению фасета."""
+    FACET_CHOICES = [
+        ('material', 'Материал'),
+        ('price', 'Цена'),
+        ('stock', 'Наличие'),
+    ]
+    
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='facet_counts')
+    facet = models.CharField("Фасет", max_length=20, choices=FACET_CHOICES)
+    value = models.CharField("Значение", max_length=100)
+    count = models.PositiveIntegerField("Количество", default=0)
+    
+    class Meta:
+        verbose_name = "Счётчик фасета"
+        verbose_name_plural = "Счётчики фасетов"
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'facet', 'value'], name='facetcount_unique'),
+        ]
+
 class Cart(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, null=True, blank=True)
     session_key = models.CharField(max_length=40, null=True, blank=True)  # для гостей
@@ -54,6 +159,9 @@ class Cart(models.Model):
     class Meta:
         verbose_name = "Корзина"
         verbose_name_plural = "Корзины"
+        indexes = [
+            models.Index(fields=['session_key'], name='cart_session_key'),
+        ]
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
@@ -63,10 +171,27 @@ class CartItem(models.Model):
     class Meta:
         verbose_name = "Товар в корзине"
         verbose_name_plural = "Товары в корзине"
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='cartitem_unique_product'),
+        ]
     
     def get_total_price(self):
         return self.product.price * self.quantity
 
+class StockHold(models.Model):
+    """Резерв товара корзиной до expires_at; просроченные снимает release_expired_holds."""
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='holds')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField("Количество")
+    expires_at = models.DateTimeField("Действует до", db_index=True)
+    
+    class Meta:
+        verbose_name = "Резерв товара"
+        verbose_name_plural = "Резервы товаров"
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='stockhold_unique_product'),
+        ]
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Ожидает'),
@@ -84,10 +209,20 @@ class Order(models.Model):
     address = models.TextField("Адрес доставки")
     phone = models.CharField("Телефон", max_length=20)
     created_at = models.DateTimeField("Дата создания", auto_now_add=True)
+    # Ключ повторной отправки формы: второй POST вернёт уже созданный заказ
+    idempotency_key = models.CharField("Ключ идемпотентности", max_length=64, unique=True, null=True, blank=True, editable=False)
     
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
+        indexes = [
+            # Админка: фильтр по статусу + сортировка по дате
+            models.Index(fields=['status', 'created_at'], name='order_status_created'),
+            # Админка: поиск заказа гостя по email
+            models.Index(fields=['guest_email'], name='order_guest_email'),
+            # История заказов в личном кабинете: заказы пользователя по дате
+            models.Index(fields=['user', 'created_at'], name='order_user_created'),
+        ]
     
     def __str__(self):
         return f"Заказ #{self.id} - {self.get_status_display()}"
@@ -102,6 +237,93 @@ class OrderItem(models.Model):
         verbose_name = "Товар в заказе"
         verbose_name_plural = "Товары в заказе"
 
+class DailySales(models.Model):
+    """Итоги продаж за день (без отменённых заказов); ведётся инкрементально, см. main/rollups.py."""
+    day = models.DateField("День", unique=True)
+    orders = models.IntegerField("Заказов", default=0)
+    units = models.IntegerField("Единиц товара", default=0)
+    revenue = models.DecimalField("Выручка", max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        verbose_name = "Продажи за день"
+        verbose_name_plural = "Продажи по дням"
+
+class CategoryDailySales(models.Model):
+    """Итоги продаж категории за день: orders - число заказов с товарами категории."""
+    day = models.DateField("День")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_sales')
+    orders = models.IntegerField("Заказов", default=0)
+    units = models.IntegerField("Единиц товара", default=0)
+    revenue = models.DecimalField("Выручка", max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        verbose_name = "Продажи категории за день"
+        verbose_name_plural = "Продажи по категориям"
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category'], name='categorydailysales_unique'),
+        ]
+
+class ProductPair(models.Model):
+    """Сколько заказов содержат оба товара; хранится в обе стороны, см. main/recommendations.py."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    orders = models.IntegerField("Заказов вместе", default=0)
+    
+    class Meta:
+        verbose_name = "Пара товаров"
+        verbose_name_plural = "Пары товаров"
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'other'], name='productpair_unique'),
+        ]
+
+class Recommendation(models.Model):
+    """Топ-K товаров, которые покупают вместе с product (rank 1 - чаще всего)."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField("Место")
+    score = models.IntegerField("Заказов вместе")
+    
+    class Meta:
+        verbose_name = "Рекомендация"
+        verbose_name_plural = "Рекомендации"
+        constraints = [
+            # Заодно индекс для выборки рекомендаций товара по порядку
+            models.UniqueConstraint(fields=['product', 'rank'], name='recommendation_product_rank'),
+        ]
+
+class RecommendationRun(models.Model):
+    """Прогон пересчёта рекомендаций: заказы с id до last_order_id уже учтены."""
+    last_order_id = models.IntegerField("Последний учтённый заказ")
+    full = models.BooleanField("Полный пересчёт", default=False)
+    created_at = models.DateTimeField("Дата", auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Пересчёт рекомендаций"
+        verbose_name_plural = "Пересчёты рекомендаций"
+
+class ProductSales(models.Model):
+    """Затухающий счётчик продаж товара для рейтинга хитов, см. main/ranking.py."""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='sales')
+    # Единицы товара, взвешенные по времени заказа (вес растёт со временем)
+    score = models.FloatField("Вес продаж", default=0, db_index=True)
+    
+    class Meta:
+        verbose_name = "Продажи товара"
+        verbose_name_plural = "Продажи товаров"
+
+class Bestseller(models.Model):
+    """Готовый топ хитов категории (с товарами подкатегорий); category = NULL - весь каталог."""
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    rank = models.PositiveSmallIntegerField("Место")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    
+    class Meta:
+        verbose_name = "Хит продаж"
+        verbose_name_plural = "Хиты продаж"
+        indexes = [
+            models.Index(fields=['category', 'rank'], name='bestseller_category_rank'),
+        ]
+
 class Review(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
@@ -109,14 +331,49 @@ class Review(models.Model):
     comment = models.TextField("Комментарий")
     is_approved = models.BooleanField("Одобрен", default=False)
     created_at = models.DateTimeField("Дата создания", auto_now_add=True)
+    updated_at = models.DateTimeField("Дата изменения", auto_now=True)
     
     class Meta:
         verbose_name = "Отзыв"
         verbose_name_plural = "Отзывы"
+        indexes = [
+            # Лента одобренных отзывов товара, новые сверху
+            models.Index(fields=['product', 'is_approved', 'created_at'], name='review_product_approved'),
+            # Последнее изменение отзывов товара (валидатор страницы товара)
+            models.Index(fields=['product', 'updated_at'], name='review_product_updated'),
+        ]
     
     def __str__(self):
         return f"Отзыв от {self.user} на {self.product}"
 
+class Task(models.Model):
+    """Отложенная задача (outbox): пишется в транзакции, которая её породила; выполняет run_workers."""
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('dead', 'Не выполнена'),
+    ]
+    # Ещё не выполненные: взятая воркером задача (running) тоже пока не учтена
+    QUEUED_STATUSES = ('pending', 'running')
+    
+    name = models.CharField("Задача", max_length=100)
+    payload = models.JSONField("Параметры", default=dict)
+    status = models.CharField("Статус", max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField("Попыток", default=0)
+    run_after = models.DateTimeField("Не раньше", default=timezone.now)
+    # Аренда задачи воркером: после locked_until её может забрать другой
+    locked_by = models.CharField("Воркер", max_length=64, blank=True)
+    locked_until = models.DateTimeField("Занята до", null=True, blank=True)
+    last_error = models.TextField("Последняя ошибка", blank=True)
+    created_at = models.DateTimeField("Дата создания", auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Задача"
+        verbose_name_plural = "Очередь задач"
+        indexes = [
+            # Выборка готовых к запуску задач
+            models.Index(fields=['status', 'run_after'], name='task_status_run_after'),
+        ]
     
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return f"{self.name} #{self.pk}"
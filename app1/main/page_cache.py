@@ -0,0 +1,92 @@
+import asyncio
+import hashlib
+import time
+
+from django.core.cache import cache
+
+from . import cache_versions
+
+# Кэш страниц каталога (данные запросов и отрисованные фрагменты).
+# Все записи привязаны к версии каталога, которую сигналы Product,
+# Category и Review увеличивают при любом изменении.
+#
+# Защита от "стада": запись хранится дольше своего срока свежести. Когда
+# она устарела (истёк срок или сменилась версия), перестраивает её только
+# процесс, взявший блокировку через cache.add(); остальные в это время
+# отдают старое значение. Работает на locmem и file-based бэкендах.
+
+VERSION = 'catalog'
+DEFAULT_TIMEOUT = 60 * 15
+# Сколько ещё хранить запись после истечения свежести (для отдачи устаревшего)
+STALE_TTL = 60 * 60 * 24
+LOCK_TIMEOUT = 30
+# Сколько ждать чужой перестройки, если отдать пока нечего
+LOCK_WAIT = 2.0
+LOCK_POLL = 0.05
+
+
+def make_key(name, *parts):
+    raw = ':'.join(str(part) for part in parts)
+    digest = hashlib.md5(raw.encode()).hexdigest() if raw else 'all'
+    return f'page:{name}:{digest}'
+
+
+def invalidate():
+    cache_versions.bump(VERSION)
+
+
+def get_or_build(key, builder, timeout=DEFAULT_TIMEOUT):
+    version = cache_versions.get_version(VERSION)
+    entry = cache.get(key)
+    if entry is not None and entry[0] == version and time.time() < entry[1]:
+        return entry[2]
+
+    lock_key = key + ':lock'
+    if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        if entry is not None:
+            return entry[2]
+        # Отдать нечего - недолго ждём, пока значение построит другой процесс
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL)
+            entry = cache.get(key)
+            if entry is not None and entry[0] == version:
+                return entry[2]
+        return builder()
+
+    try:
+        value = builder()
+        cache.set(key, (version, time.time() + timeout, value), timeout + STALE_TTL)
+    finally:
+        cache.delete(lock_key)
+    return value
+
+
+async def aget_or_build(key, builder, timeout=DEFAULT_TIMEOUT):
+    """То же, что get_or_build, для async-представлений: builder - корутинная функция.
+
+    Обращения к кэшу остаются синхронными - они не ходят в БД.
+    """
+    version = cache_versions.get_version(VERSION)
+    entry = cache.get(key)
+    if entry is not None and entry[0] == version and time.time() < entry[1]:
+        return entry[2]
+
+    lock_key = key + ':lock'
+    if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        if entry is not None:
+            return entry[2]
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL)
+            entry = cache.get(key)
+            if entry is not None and entry[0] == version:
+                return entry[2]
+        return await builder()
+
+    try:
+        value = await builder()
+        cache.set(key, (version, time.time() + timeout, value), timeout + STALE_TTL)
+    finally:
+        cache.delete(lock_key)
+    return value
@@ -0,0 +1,126 @@
+import base64
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+# Keyset-пагинация (курсорная): вместо OFFSET запоминаем значения ключа
+# сортировки последней строки страницы и продолжаем "после" неё.
+# Поэтому страница N стоит столько же, сколько первая.
+
+# Порядки сортировки: поле и признак убывания
+SORT_ORDERS = {
+    'new': ('created_at', True),
+    'price': ('price', False),
+    '-price': ('price', True),
+}
+DEFAULT_SORT = 'new'
+
+
+def _dump_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def _load_value(field, raw):
+    if field == 'price':
+        value = Decimal(raw)
+        # NaN и Infinity - тоже Decimal, но сравнить с ними цену база не сможет
+        if not value.is_finite():
+            raise ValueError(raw)
+        return value
+    if field in ('created_at', 'updated_at'):
+        value = parse_datetime(raw)
+        if value is None:
+            raise ValueError(raw)
+        return value
+    return raw
+
+
+def encode_cursor(value, pk):
+    payload = json.dumps([_dump_value(value), pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(field, cursor):
+    """Возвращает (значение, pk) или None, если курсор битый."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw_value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value, pk = _load_value(field, raw_value), int(pk)
+    except (ValueError, TypeError, OverflowError, InvalidOperation, json.JSONDecodeError):
+        return None
+    # id за пределами 64 бит база не примет
+    if not 0 <= pk < 2 ** 63:
+        return None
+    return value, pk
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return bool(self.cursor)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _keyset_queryset(queryset, field, descending, cursor):
+    if descending:
+        ordering = ('-' + field, '-id')
+    else:
+        ordering = (field, 'id')
+    queryset = queryset.order_by(*ordering)
+
+    position = decode_cursor(field, cursor)
+    if position is None:
+        return queryset, None
+    value, pk = position
+    op = 'lt' if descending else 'gt'
+    queryset = queryset.filter(
+        Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'id__{op}': pk})
+    )
+    return queryset, cursor
+
+
+def _make_page(rows, field, cursor, per_page):
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.pk)
+    return KeysetPage(rows, next_cursor, cursor)
+
+
+def keyset_paginate(queryset, field, descending, cursor=None, per_page=24):
+    """Режет queryset по ключу (field, id) без OFFSET.
+
+    Берём на одну строку больше, чтобы узнать, есть ли следующая страница.
+    """
+    queryset, cursor = _keyset_queryset(queryset, field, descending, cursor)
+    return _make_page(list(queryset[:per_page + 1]), field, cursor, per_page)
+
+
+async def akeyset_paginate(queryset, field, descending, cursor=None, per_page=24):
+    """Асинхронный вариант keyset_paginate (async ORM)."""
+    queryset, cursor = _keyset_queryset(queryset, field, descending, cursor)
+    rows = [row async for row in queryset[:per_page + 1]]
+    return _make_page(rows, field, cursor, per_page)
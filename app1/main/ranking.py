@@ -0,0 +1,123 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import connection, transaction
+
+from . import category_tree, page_cache, rollups
+from .models import Bestseller, Order, OrderItem, Product, ProductSales, Task
+
+# Хиты продаж для главной и страниц категорий.
+#
+# ProductSales.score - продажи товара с затуханием: единица товара из
+# заказа в момент t весит 2^((t - EPOCH) / HALF_LIFE). Вес не уменьшается
+# со временем у старых продаж, а растёт у новых, поэтому порядок товаров
+# по score совпадает с порядком по "честно" затухающим продажам на любой
+# момент, и новый заказ - это только score = score + вес, без пересчёта
+# остальных. Счётчики пополняет воркер очереди задач (TASK ставится в
+# транзакции заказа). Отмены и удаления инкрементально не вычитаются -
+# их учтёт rebuild_counters(), его стоит запускать раз в сутки.
+#
+# rank() по расписанию раскладывает товары по убыванию score в топ-TOP_N
+# каждой категории (вместе с подкатегориями) и всего каталога и
+# переписывает таблицу Bestseller. Страницы читают готовый список через
+# top(): из кэша, а при промахе - одним запросом по индексу.
+
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+HALF_LIFE = timedelta(days=14)
+TOP_N = 8
+# Топ всё равно меняется только по расписанию rank()
+CACHE_TTL = 60 * 5
+BATCH_SIZE = 2000
+TASK = 'ranking.order_created'
+
+SALES = ProductSales._meta.db_table
+
+UPSERT_SQL = f'''
+    INSERT INTO {SALES} (product_id, score) VALUES (%s, %s)
+    ON CONFLICT (product_id) DO UPDATE SET score = {SALES}.score + excluded.score
+'''
+
+
+def weight(moment):
+    # Удвоение раз в HALF_LIFE: float хватит на десятилетия вперёд от EPOCH
+    return 2 ** ((moment - EPOCH) / HALF_LIFE)
+
+
+def add_sales(quantities, moment):
+    """Добавляет продажи {product_id: единиц} в момент moment - по запросу на товар в одном executemany."""
+    if not quantities:
+        return
+    w = weight(moment)
+    with connection.cursor() as cursor:
+        cursor.executemany(UPSERT_SQL, [(pk, quantity * w) for pk, quantity in quantities.items()])
+
+
+def order_created(order_id):
+    # Вызывается воркером после коммита заказа
+    order = Order.objects.filter(pk=order_id).only('pk', 'created_at', 'status').first()
+    if order is None or not rollups.is_counted(order.status):
+        return
+    quantities = defaultdict(int)
+    for product_id, quantity in OrderItem.objects.filter(order_id=order_id).values_list('product_id', 'quantity'):
+        quantities[product_id] += quantity
+    add_sales(quantities, order.created_at)
+
+
+def rebuild_counters(batch_size=BATCH_SIZE, progress=None):
+    """Пересчитывает ProductSales по всем неотменённым заказам; возвращает число товаров.
+
+    Ждущие в очереди задачи TASK снимаются - их заказы уже учтены.
+    """
+    scores = defaultdict(float)
+    with transaction.atomic():
+        items = (OrderItem.objects.exclude(order__status__in=rollups.EXCLUDED_STATUSES)
+                 .values_list('product_id', 'quantity', 'order__created_at'))
+        for n, (product_id, quantity, created_at) in enumerate(items.iterator(chunk_size=batch_size), 1):
+            scores[product_id] += quantity * weight(created_at)
+            if progress and not n % batch_size:
+                progress(n)
+        ProductSales.objects.all().delete()
+        ProductSales.objects.bulk_create(
+            [ProductSales(product_id=pk, score=score) for pk, score in scores.items()], batch_size=batch_size)
+        Task.objects.filter(name=TASK, status__in=Task.QUEUED_STATUSES).delete()
+    return len(scores)
+
+
+def rank(top_n=TOP_N):
+    """Переписывает Bestseller: топ-top_n всего каталога и каждой категории; возвращает число списков."""
+    ancestors = {
+        node['id']: [int(pk) for pk in node['path'].strip('/').split('/') if pk]
+        for node in category_tree.get_tree().nodes
+    }
+    lists = defaultdict(list)
+    sold = (ProductSales.objects.filter(score__gt=0, product__is_active=True)
+            .order_by('-score', 'product_id').values_list('product_id', 'product__category_id'))
+    for product_id, category_id in sold.iterator(chunk_size=BATCH_SIZE):
+        for key in [None] + ancestors.get(category_id, []):
+            if len(lists[key]) < top_n:
+                lists[key].append(product_id)
+    with transaction.atomic():
+        Bestseller.objects.all().delete()
+        Bestseller.objects.bulk_create([
+            Bestseller(category_id=category_id, rank=position, product_id=product_id)
+            for category_id, products in lists.items()
+            for position, product_id in enumerate(products, 1)
+        ], batch_size=BATCH_SIZE)
+    return len(lists)
+
+
+def top(category_id=None, limit=TOP_N):
+    """Хиты категории category_id (None - всего каталога, дополняются новинками)."""
+    def build():
+        products = [
+            bestseller.product for bestseller in
+            Bestseller.objects.filter(category_id=category_id, product__is_active=True)
+            .select_related('product').order_by('rank')[:TOP_N]
+        ]
+        if category_id is None and len(products) < TOP_N:
+            # Продаж ещё мало (новый магазин) - добираем главную новинками
+            products += Product.objects.filter(is_active=True).exclude(
+                pk__in=[product.pk for product in products]).order_by('-created_at')[:TOP_N - len(products)]
+        return products
+
+    return page_cache.get_or_build(page_cache.make_key('bestsellers', category_id), build, CACHE_TTL)[:limit]
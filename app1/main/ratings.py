@@ -0,0 +1,58 @@
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast, Now
+from django.utils import timezone
+
+from .models import Product, Review
+
+# Денормализованный рейтинг товара: rating_count и rating_sum меняются
+# инкрементально одним UPDATE, rating_avg пересчитывается в том же UPDATE
+# (в SQL правые части SET вычисляются по старым значениям строки).
+
+
+def apply_delta(product_id, count_delta, sum_delta):
+    if not count_delta and not sum_delta:
+        return
+    new_count = F('rating_count') + count_delta
+    Product.objects.filter(pk=product_id).update(
+        rating_count=new_count,
+        rating_sum=F('rating_sum') + sum_delta,
+        rating_avg=Case(
+            When(rating_count__gt=-count_delta,
+                 then=Cast(F('rating_sum') + sum_delta, FloatField()) / new_count),
+            default=Value(0.0),
+            output_field=FloatField(),
+        ),
+        # UPDATE не трогает auto_now, а рейтинг виден в каталоге
+        updated_at=Now(),
+    )
+
+
+def contribution(is_approved, rating):
+    """Вклад отзыва в (count, sum): учитываются только одобренные."""
+    return (1, rating) if is_approved else (0, 0)
+
+
+def recount(product_ids=None, batch_size=1000):
+    """Полный пересчёт по таблице отзывов; возвращает число исправленных товаров."""
+    reviews = Review.objects.filter(is_approved=True)
+    products = Product.objects.all()
+    if product_ids is not None:
+        reviews = reviews.filter(product_id__in=product_ids)
+        products = products.filter(pk__in=product_ids)
+    stats = {
+        row['product_id']: (row['n'], row['total'])
+        for row in reviews.order_by().values('product_id').annotate(n=Count('id'), total=Sum('rating'))
+    }
+
+    changed = []
+    now = timezone.now()
+    for product in products.only('id', 'rating_count', 'rating_sum', 'rating_avg').iterator(chunk_size=batch_size):
+        count, total = stats.get(product.pk, (0, 0))
+        if product.rating_count != count or product.rating_sum != total:
+            product.rating_count, product.rating_sum = count, total
+            product.rating_avg = round(total / count, 2) if count else 0
+            product.updated_at = now
+            changed.append(product)
+    Product.objects.bulk_update(changed, ['rating_count', 'rating_sum', 'rating_avg', 'updated_at'],
+                                batch_size=batch_size)
+    return len(changed)
@@ -0,0 +1,111 @@
+from django.db import connection, transaction
+from django.db.models import Max
+
+from .models import Order, OrderItem, ProductPair, Recommendation, RecommendationRun
+from .rollups import EXCLUDED_STATUSES
+
+# "С этим товаром покупают": разреженная матрица совместных покупок.
+# ProductPair хранит ненулевые клетки матрицы - (товар, другой товар,
+# число заказов с обоими), в обе стороны. Считает её сама база одним
+# INSERT ... SELECT на пачку заказов: самосоединение позиций по order_id и
+# GROUP BY по паре, новые пары добавляются, существующие увеличиваются
+# (ON CONFLICT DO UPDATE). По матрице в Recommendation пишется топ-TOP_K
+# соседей каждого товара (ROW_NUMBER() по убыванию числа заказов), и
+# страница товара читает их одним запросом по индексу (product, rank).
+#
+# refresh() учитывает только заказы новее прошлого прогона и
+# пересчитывает топ лишь для товаров из этих заказов. Отмены и удаления
+# уже учтённых заказов инкрементально не вычитаются - их уберёт
+# refresh(full=True), его стоит запускать реже (например, раз в сутки).
+
+TOP_K = 8
+BATCH_SIZE = 5000
+
+PAIRS = ProductPair._meta.db_table
+RECOMMENDATIONS = Recommendation._meta.db_table
+ITEMS = OrderItem._meta.db_table
+ORDERS = Order._meta.db_table
+
+PAIRS_SQL = f'''
+    INSERT INTO {PAIRS} (product_id, other_id, orders)
+    SELECT a.product_id, b.product_id, COUNT(DISTINCT a.order_id)
+    FROM {ITEMS} a
+    JOIN {ITEMS} b ON b.order_id = a.order_id AND b.product_id <> a.product_id
+    JOIN {ORDERS} o ON o.id = a.order_id
+    WHERE a.order_id > %s AND a.order_id <= %s
+      AND o.status NOT IN ({", ".join(["%s"] * len(EXCLUDED_STATUSES))})
+    GROUP BY a.product_id, b.product_id
+    ON CONFLICT (product_id, other_id) DO UPDATE SET orders = {PAIRS}.orders + excluded.orders
+'''
+
+# {where} - отбор товаров, для которых пересчитывается топ
+TOP_SQL = f'''
+    INSERT INTO {RECOMMENDATIONS} (product_id, related_id, rank, score)
+    SELECT product_id, other_id, position, orders FROM (
+        SELECT product_id, other_id, orders,
+               ROW_NUMBER() OVER (PARTITION BY product_id ORDER BY orders DESC, other_id) AS position
+        FROM {PAIRS} WHERE {{where}}
+    ) ranked
+    WHERE position <= %s
+'''
+
+# Товары из заказов с id в (%s, %s]
+CHANGED_SQL = f'SELECT product_id FROM {ITEMS} WHERE order_id > %s AND order_id <= %s'
+
+
+def last_order_id():
+    run = RecommendationRun.objects.order_by('-pk').first()
+    return run.last_order_id if run else 0
+
+
+def _count_pairs(start, end, batch_size, progress):
+    """Добавляет в матрицу заказы с id в (start, end] пачками по batch_size id."""
+    with connection.cursor() as cursor:
+        for low in range(start, end, batch_size):
+            high = min(low + batch_size, end)
+            cursor.execute(PAIRS_SQL, [low, high, *EXCLUDED_STATUSES])
+            if progress:
+                progress(high)
+
+
+def _rank(top_k, start=None, end=None):
+    """Пересчитывает топ соседей: всех товаров или только из заказов с id в (start, end]."""
+    with connection.cursor() as cursor:
+        if start is None:
+            cursor.execute(f'DELETE FROM {RECOMMENDATIONS}')
+            cursor.execute(TOP_SQL.format(where='1 = 1'), [top_k])
+        else:
+            changed = [start, end]
+            cursor.execute(f'DELETE FROM {RECOMMENDATIONS} WHERE product_id IN ({CHANGED_SQL})', changed)
+            cursor.execute(TOP_SQL.format(where=f'product_id IN ({CHANGED_SQL})'), changed + [top_k])
+
+
+def refresh(full=False, top_k=TOP_K, batch_size=BATCH_SIZE, progress=None):
+    """Добавляет в рекомендации новые заказы (full=True - пересчёт с нуля).
+
+    Возвращает диапазон учтённых id заказов (start, end]. Всё - одна
+    транзакция: читатели видят либо старые рекомендации, либо новые.
+    """
+    with transaction.atomic():
+        start = 0 if full else last_order_id()
+        end = Order.objects.aggregate(max_id=Max('pk'))['max_id'] or 0
+        if full:
+            ProductPair.objects.all().delete()
+        elif end <= start:
+            return start, start
+        _count_pairs(start, end, batch_size, progress)
+        if full:
+            _rank(top_k)
+        else:
+            _rank(top_k, start, end)
+        RecommendationRun.objects.create(last_order_id=end, full=full)
+    return start, end
+
+
+def for_product(product_id, limit=4):
+    """Товары, которые чаще всего покупают вместе с product_id: один запрос по индексу."""
+    return [
+        recommendation.related for recommendation in
+        Recommendation.objects.filter(product_id=product_id, related__is_active=True)
+        .select_related('related').order_by('rank')[:limit]
+    ]
@@ -0,0 +1,208 @@
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest, Now
+from django.utils import timezone
+
+from . import facets, tasks
+from .models import Product, StockHold
+
+# Резервы товара на время жизни корзины. Product.reserved - сумма всех
+# резервов товара, доступно к продаже stock_quantity - reserved.
+# Резерв берётся одним условным UPDATE ... SET reserved = reserved + n
+# WHERE stock_quantity - reserved >= n: проверка и захват атомарны,
+# блокировок строк и чтения перед записью нет, продать больше, чем есть,
+# нельзя. Пачка товаров - тот же один UPDATE с CASE по id.
+#
+# Оформление заказа превращает резерв в продажу (списывает склад и
+# резерв), просроченные резервы снимает release_expired пачками. Если
+# счётчик reserved разошёлся со строками StockHold (например, корзину
+# удалили мимо release_carts), его чинит recount().
+#
+# Резерв меняет доступный остаток, а от него зависит фасет "в наличии":
+# каждое изменение reserved ставит в той же транзакции задачу пересчёта
+# фасетов (facets.TASK) по затронутым товарам.
+
+HOLD_TTL = timedelta(minutes=15)
+BATCH_SIZE = 500
+
+
+class ReservationError(Exception):
+    pass
+
+
+def _by_product(values):
+    return Case(*[When(pk=pk, then=Value(value)) for pk, value in values.items()],
+                default=Value(0), output_field=IntegerField())
+
+
+def _claim(quantities):
+    """Резервирует {product_id: n} одним условным UPDATE; True - если хватило всем."""
+    claimed = Product.objects.filter(
+        pk__in=quantities, is_active=True, stock_quantity__gte=F('reserved') + _by_product(quantities),
+    ).update(reserved=F('reserved') + _by_product(quantities))
+    return claimed == len(quantities)
+
+
+def _release(quantities):
+    if quantities:
+        Product.objects.filter(pk__in=quantities).update(
+            reserved=Greatest(F('reserved') - _by_product(quantities), 0))
+
+
+def _recount_facets(product_ids):
+    if product_ids:
+        tasks.enqueue(facets.TASK, product_ids=sorted(product_ids))
+
+
+def _shortage(quantities, held):
+    """Сообщение о нехватке: сколько товара ещё может взять эта корзина."""
+    names = []
+    for pk, name, stock, reserved, is_active in Product.objects.filter(pk__in=quantities).values_list(
+            'pk', 'name', 'stock_quantity', 'reserved', 'is_active'):
+        available = max(stock - reserved, 0) + held.get(pk, 0)
+        if not is_active:
+            names.append(f'«{name}» больше не продаётся')
+        elif available < quantities[pk] + held.get(pk, 0):
+            names.append(f'«{name}»: доступно {available} шт.')
+    return 'Недостаточно товара: ' + '; '.join(names or ['товар не найден'])
+
+
+def hold(cart, quantities):
+    """Ставит резерв корзины cart ровно на {product_id: количество} (0 - снять).
+
+    Срок всех переданных резервов продлевается на HOLD_TTL. Если товара
+    не хватает хотя бы на одну позицию - ReservationError, ничего не меняется.
+    """
+    expires_at = timezone.now() + HOLD_TTL
+    # Без точки сохранения: ошибка откатывает и внешнюю транзакцию корзины
+    with transaction.atomic(savepoint=False):
+        holds = {h.product_id: h for h in
+                 StockHold.objects.select_for_update().filter(cart=cart, product_id__in=quantities)}
+        held = {pk: h.quantity for pk, h in holds.items()}
+        claim, release = {}, {}
+        for pk, quantity in quantities.items():
+            delta = quantity - held.get(pk, 0)
+            if delta > 0:
+                claim[pk] = delta
+            elif delta < 0:
+                release[pk] = -delta
+        if claim and not _claim(claim):
+            raise ReservationError(_shortage(claim, held))
+        _release(release)
+        _recount_facets([*claim, *release])
+
+        to_create, to_update, to_delete = [], [], []
+        for pk, quantity in quantities.items():
+            existing = holds.get(pk)
+            if not quantity:
+                if existing is not None:
+                    to_delete.append(existing.pk)
+            elif existing is None:
+                to_create.append(StockHold(cart=cart, product_id=pk, quantity=quantity, expires_at=expires_at))
+            else:
+                existing.quantity, existing.expires_at = quantity, expires_at
+                to_update.append(existing)
+        if to_delete:
+            StockHold.objects.filter(pk__in=to_delete).delete()
+        StockHold.objects.bulk_update(to_update, ['quantity', 'expires_at'])
+        StockHold.objects.bulk_create(to_create)
+
+
+def convert(cart, quantities):
+    """Продажа по заказу: списывает {product_id: количество} со склада и снимает резерв cart.
+
+    Вызывается в транзакции заказа. Недостающее сверх резерва (резерв
+    истёк или заказ не из корзины) захватывается тем же условным UPDATE.
+    """
+    held = {}
+    if cart is not None:
+        held = dict(StockHold.objects.select_for_update().filter(cart=cart).values_list('product_id', 'quantity'))
+    missing = {pk: quantity - held.get(pk, 0) for pk, quantity in quantities.items() if quantity > held.get(pk, 0)}
+    if missing and not _claim(missing):
+        raise ReservationError(_shortage(missing, held))
+
+    # Теперь на каждую позицию заказа в резерве не меньше её количества
+    release = {pk: max(held.get(pk, 0), quantity) for pk, quantity in quantities.items()}
+    sold = Product.objects.filter(pk__in=quantities, stock_quantity__gte=_by_product(quantities)).update(
+        stock_quantity=F('stock_quantity') - _by_product(quantities),
+        reserved=F('reserved') - _by_product(release),
+        # Остаток на складе виден в каталоге (фильтр "в наличии") - это изменение товара
+        updated_at=Now(),
+    )
+    if sold != len(quantities):
+        # Склад уменьшили вручную ниже уже выданных резервов
+        raise ReservationError(_shortage(quantities, {}))
+    _release({pk: quantity for pk, quantity in held.items() if pk not in quantities})
+    if held:
+        StockHold.objects.filter(cart=cart).delete()
+    _recount_facets(set(quantities) | set(held))
+
+
+def _release_rows(holds):
+    """Снимает резервы (пары id, product_id, quantity) и удаляет их строки."""
+    totals = defaultdict(int)
+    for _, product_id, quantity in holds:
+        totals[product_id] += quantity
+    _release(totals)
+    StockHold.objects.filter(pk__in=[pk for pk, _, _ in holds]).delete()
+    _recount_facets(totals)
+
+
+def release_carts(cart_ids):
+    """Снимает все резервы корзин перед их удалением."""
+    with transaction.atomic(savepoint=False):
+        _release_rows(list(StockHold.objects.select_for_update().filter(cart_id__in=cart_ids)
+                           .values_list('pk', 'product_id', 'quantity')))
+
+
+def transfer(source, target):
+    """Переносит резервы корзины source в target (слияние корзин при входе)."""
+    with transaction.atomic(savepoint=False):
+        target_holds = {h.product_id: h for h in StockHold.objects.select_for_update().filter(cart=target)}
+        merged = []
+        for source_hold in StockHold.objects.select_for_update().filter(cart=source, product_id__in=target_holds):
+            existing = target_holds[source_hold.product_id]
+            existing.quantity += source_hold.quantity
+            existing.expires_at = max(existing.expires_at, source_hold.expires_at)
+            merged.append(existing)
+        StockHold.objects.bulk_update(merged, ['quantity', 'expires_at'])
+        StockHold.objects.filter(cart=source, product_id__in=target_holds).delete()
+        StockHold.objects.filter(cart=source).update(cart=target)
+
+
+def release_expired(batch_size=BATCH_SIZE, pause=0, progress=None):
+    """Снимает просроченные резервы пачками; возвращает их число.
+
+    Каждая пачка - транзакция из трёх запросов: выбрать, вернуть резерв
+    товарам одним UPDATE, удалить строки.
+    """
+    released = 0
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            holds = list(
+                StockHold.objects.select_for_update().filter(expires_at__lte=now)
+                .order_by('expires_at').values_list('pk', 'product_id', 'quantity')[:batch_size]
+            )
+            if not holds:
+                break
+            _release_rows(holds)
+        released += len(holds)
+        if progress:
+            progress(released)
+        if len(holds) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return released
+
+
+def recount():
+    """Пересчитывает Product.reserved по строкам StockHold одним UPDATE."""
+    totals = (StockHold.objects.filter(product=OuterRef('pk')).order_by().values('product')
+              .annotate(total=Sum('quantity')).values('total'))
+    return Product.objects.update(reserved=Coalesce(Subquery(totals), 0))
@@ -0,0 +1,155 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from .models import CategoryDailySales, DailySales, Order, OrderItem, Task
+
+# Витрина продаж для дашборда: итоги по дням и по (день, категория).
+# Заказ попадает в итоги при создании и выходит из них при отмене или
+# удалении - каждое изменение это несколько UPDATE ... SET x = x + delta,
+# таблицы заказов дашборд не читает. Правки позиций уже созданного
+# заказа инкрементально не учитываются - их подхватит rebuild().
+#
+# Новый заказ добавляет в итоги воркер очереди задач (задача TASK пишется
+# в транзакции заказа). Пока задача ждёт в очереди, заказа в итогах ещё
+# нет: смена статуса его не трогает - воркер прочтёт актуальный статус.
+
+# Заказы в этих статусах в итоги не входят
+EXCLUDED_STATUSES = ('cancelled',)
+BATCH_SIZE = 1000
+TASK = 'rollups.order_created'
+
+
+def is_counted(status):
+    return status not in EXCLUDED_STATUSES
+
+
+def _day(created_at):
+    return timezone.localdate(created_at)
+
+
+def _increment(model, lookup, orders, units, revenue):
+    changes = {'orders': F('orders') + orders, 'units': F('units') + units,
+               'revenue': F('revenue') + revenue}
+    if model.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(orders=orders, units=units, revenue=revenue, **lookup)
+    except IntegrityError:
+        # Строку успел создать параллельный запрос
+        model.objects.filter(**lookup).update(**changes)
+
+
+def _totals():
+    # [заказов, единиц, выручка]
+    return defaultdict(lambda: [0, 0, Decimal('0')])
+
+
+def _accumulate(orders, days, categories):
+    """Складывает заказы (пары id, created_at) в итоги days и categories одним запросом позиций."""
+    order_days = {pk: _day(created_at) for pk, created_at in orders}
+    for day in order_days.values():
+        days[day][0] += 1
+    seen = set()
+    for order_id, category_id, quantity, unit_price in OrderItem.objects.filter(
+            order_id__in=order_days).values_list('order_id', 'product__category_id', 'quantity', 'unit_price'):
+        day = order_days[order_id]
+        revenue = quantity * unit_price
+        days[day][1] += quantity
+        days[day][2] += revenue
+        row = categories[day, category_id]
+        if (order_id, category_id) not in seen:
+            seen.add((order_id, category_id))
+            row[0] += 1
+        row[1] += quantity
+        row[2] += revenue
+    return len(order_days)
+
+
+def apply_orders(orders, sign=1):
+    """Добавляет заказы в итоги (sign=1) или вычитает (sign=-1).
+
+    orders - пары (id, created_at). На каждый затронутый день и
+    (день, категория) - один UPDATE.
+    """
+    days, categories = _totals(), _totals()
+    if not _accumulate(orders, days, categories):
+        return
+    with transaction.atomic():
+        for day, (orders, units, revenue) in days.items():
+            _increment(DailySales, {'day': day}, sign * orders, sign * units, sign * revenue)
+        for (day, category_id), (orders, units, revenue) in categories.items():
+            _increment(CategoryDailySales, {'day': day, 'category_id': category_id},
+                       sign * orders, sign * units, sign * revenue)
+
+
+def queued(order_ids):
+    """id заказов из order_ids, задачи которых ещё не выполнены (в итогах их нет).
+
+    Задачу, которую воркер уже взял, тоже считаем ждущей: обработчик сам
+    прочитает статус заказа, а при удалении задачи его результат откатится.
+    """
+    tasks = Task.objects.filter(name=TASK, status__in=Task.QUEUED_STATUSES, payload__order_id__in=list(order_ids))
+    return set(tasks.values_list('payload__order_id', flat=True))
+
+
+def apply_order(order, sign=1):
+    apply_orders([(order.pk, order.created_at)], sign)
+
+
+def order_created(order_id):
+    # Вызывается воркером после коммита: позиции заказа уже записаны
+    order = Order.objects.filter(pk=order_id).only('pk', 'created_at', 'status').first()
+    if order is not None and is_counted(order.status):
+        apply_order(order, 1)
+
+
+def status_changed(order, old_status):
+    was, now = is_counted(old_status), is_counted(order.status)
+    if was != now and not queued([order.pk]):
+        apply_order(order, 1 if now else -1)
+
+
+def rebuild(batch_size=BATCH_SIZE, progress=None):
+    """Пересчитывает витрину по Order/OrderItem пачками заказов; возвращает число заказов.
+
+    Итоги копятся в памяти (их размер - дни x категории, а не заказы) и
+    заменяют таблицы одной транзакцией. Заказы, созданные во время
+    пересчёта, добавляются в конце инкрементально, а ждущие в очереди
+    задачи TASK снимаются - пересчёт уже учёл их заказы.
+    """
+    max_id = Order.objects.aggregate(max_id=Max('pk'))['max_id'] or 0
+    days, categories = _totals(), _totals()
+    last_id = total = 0
+    while True:
+        orders = list(
+            Order.objects.filter(pk__gt=last_id, pk__lte=max_id)
+            .exclude(status__in=EXCLUDED_STATUSES)
+            .order_by('pk').values_list('pk', 'created_at')[:batch_size]
+        )
+        if not orders:
+            break
+        total += _accumulate(orders, days, categories)
+        last_id = orders[-1][0]
+        if progress:
+            progress(total)
+
+    with transaction.atomic():
+        DailySales.objects.all().delete()
+        CategoryDailySales.objects.all().delete()
+        DailySales.objects.bulk_create([
+            DailySales(day=day, orders=orders, units=units, revenue=revenue)
+            for day, (orders, units, revenue) in days.items()
+        ], batch_size=batch_size)
+        CategoryDailySales.objects.bulk_create([
+            CategoryDailySales(day=day, category_id=category_id, orders=orders, units=units, revenue=revenue)
+            for (day, category_id), (orders, units, revenue) in categories.items()
+        ], batch_size=batch_size)
+        apply_orders(Order.objects.filter(pk__gt=max_id).exclude(status__in=EXCLUDED_STATUSES)
+                     .values_list('pk', 'created_at'), 1)
+        Task.objects.filter(name=TASK, status__in=Task.QUEUED_STATUSES).delete()
+    return total
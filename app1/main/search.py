@@ -0,0 +1,104 @@
+from django.db import connection, transaction
+
+from .stemmer import tokenize
+
+# Полнотекстовый поиск по товарам на SQLite FTS5.
+# В индекс кладём уже стеммированный текст (см. stemmer.py), поэтому
+# "бамбуковая щётка" находит и "бамбуковые щетки". rowid строки индекса
+# совпадает с id товара. Ранжирование - BM25 с весами колонок.
+
+TABLE = 'main_product_search'
+# Веса колонок для bm25(): name, description, material
+WEIGHTS = (10.0, 1.0, 4.0)
+BATCH_SIZE = 1000
+
+INSERT_SQL = f'INSERT INTO {TABLE} (rowid, name, description, material) VALUES (%s, %s, %s, %s)'
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def _document(product):
+    return (
+        product.pk,
+        ' '.join(tokenize(product.name)),
+        ' '.join(tokenize(product.description)),
+        ' '.join(tokenize(product.material)),
+    )
+
+
+def index_product(product):
+    """Обновляет строку товара в индексе (неактивные товары из индекса убираем)."""
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [product.pk])
+        if product.is_active:
+            cursor.execute(INSERT_SQL, _document(product))
+
+
+def index_products(products):
+    """Пакетный вариант index_product: один DELETE и один executemany на пачку."""
+    if not is_available() or not products:
+        return
+    ids = [product.pk for product in products]
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid IN ({", ".join(["%s"] * len(ids))})', ids)
+        cursor.executemany(INSERT_SQL, [_document(product) for product in products if product.is_active])
+
+
+def remove_product(product_id):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [product_id])
+
+
+def rebuild(queryset, batch_size=BATCH_SIZE, progress=None):
+    """Полная перестройка индекса пачками; возвращает число проиндексированных товаров."""
+    total = 0
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE}')
+            batch = []
+            products = queryset.filter(is_active=True).only('id', 'name', 'description', 'material')
+            for product in products.iterator(chunk_size=batch_size):
+                batch.append(_document(product))
+                if len(batch) >= batch_size:
+                    cursor.executemany(INSERT_SQL, batch)
+                    total += len(batch)
+                    batch = []
+                    if progress:
+                        progress(total)
+            if batch:
+                cursor.executemany(INSERT_SQL, batch)
+                total += len(batch)
+            # Сливаем сегменты b-дерева FTS после массовой вставки
+            cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+    return total
+
+
+def build_match(query):
+    """Строит выражение MATCH: все слова запроса обязательны, каждое - как префикс."""
+    terms = [t.replace('"', '') for t in tokenize(query)]
+    terms = [t for t in terms if t]
+    if not terms:
+        return None
+    return ' AND '.join(f'"{term}"*' for term in terms)
+
+
+def search(query, limit=24, offset=0):
+    """Возвращает (id товаров по убыванию релевантности, есть ли ещё результаты)."""
+    match = build_match(query)
+    if match is None or not is_available():
+        return [], False
+    weights = ', '.join(str(w) for w in WEIGHTS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s '
+            f'ORDER BY bm25({TABLE}, {weights}) LIMIT %s OFFSET %s',
+            [match, limit + 1, offset],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+    return ids[:limit], len(ids) > limit
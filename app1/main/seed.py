@@ -0,0 +1,182 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from . import category_tree, facets, page_cache, ranking, ratings, rollups, search
+from .models import Category, CustomUser, Order, OrderItem, Product, Review
+
+# Генератор синтетических данных для нагрузочных тестов: дерево
+# категорий, товары, пользователи, отзывы и заказы заданного масштаба.
+# Случайность - только из random.Random(seed): один и тот же seed даёт
+# те же данные. Всё пишется через bulk_create пачками, поэтому сигналы не
+# срабатывают - производные данные (пути категорий, рейтинги, индекс
+# поиска, фасеты, витрина продаж, хиты) пересчитываются в конце.
+
+SCALES = {
+    'tiny': {'roots': 3, 'children': 2, 'grandchildren': 2, 'products': 60, 'users': 10,
+             'reviews': 120, 'orders': 40},
+    'small': {'roots': 5, 'children': 3, 'grandchildren': 3, 'products': 2000, 'users': 200,
+              'reviews': 5000, 'orders': 2000},
+    'medium': {'roots': 8, 'children': 4, 'grandchildren': 4, 'products': 20000, 'users': 2000,
+               'reviews': 50000, 'orders': 20000},
+    'large': {'roots': 10, 'children': 5, 'grandchildren': 5, 'products': 200000, 'users': 20000,
+              'reviews': 500000, 'orders': 200000},
+}
+BATCH_SIZE = 2000
+MAX_ORDER_ITEMS = 5
+# Заказы и отзывы размазываем по последним DAYS дням
+DAYS = 90
+PASSWORD = 'password'
+
+ADJECTIVES = ('Бамбуковая', 'Льняная', 'Стеклянная', 'Керамическая', 'Деревянная', 'Хлопковая',
+              'Многоразовая', 'Складная', 'Натуральная', 'Пробковая')
+NOUNS = ('щётка', 'сумка', 'бутылка', 'кружка', 'доска', 'салфетка', 'корзина', 'мочалка',
+         'ланчбокс', 'губка', 'трубочка', 'коробка')
+MATERIALS = ('бамбук', 'лён', 'стекло', 'керамика', 'дерево', 'хлопок', 'пробка', 'джут', '')
+CATEGORY_NAMES = ('Кухня', 'Ванная', 'Уборка', 'Хранение', 'Сад', 'Путешествия', 'Дети',
+                  'Уход', 'Подарки', 'Офис')
+COMMENTS = ('Отличное качество', 'Служит уже полгода', 'Немного дороговато', 'Как на фото',
+            'Рекомендую', 'Быстрая доставка', 'Могло быть и лучше')
+STATUS_WEIGHTS = (('delivered', 60), ('shipped', 15), ('processing', 10), ('pending', 10),
+                  ('cancelled', 5))
+
+
+def _chunks(total, size=BATCH_SIZE):
+    for start in range(0, total, size):
+        yield start, min(size, total - start)
+
+
+def _categories(rng, config, prefix):
+    levels = []
+    parents = [None]
+    n = 0
+    for per_parent in (config['roots'], config['children'], config['grandchildren']):
+        batch = []
+        for parent in parents:
+            for i in range(per_parent):
+                name = CATEGORY_NAMES[i % len(CATEGORY_NAMES)] if parent is None else f'Раздел {n}'
+                batch.append(Category(name=name, slug=f'{prefix}-c{n}', parent_id=parent))
+                n += 1
+        parents = [category.pk for category in Category.objects.bulk_create(batch)]
+        levels.append(parents)
+    # bulk_create не вызывает Category.save() - пути дерева строим разом
+    Category.rebuild_paths()
+    # Товары - в основном в листьях, немного - в промежуточных категориях
+    return levels[-1] * 4 + levels[-2]
+
+
+def _products(rng, config, prefix, category_ids, progress):
+    ids = []
+    for start, size in _chunks(config['products']):
+        batch = []
+        for i in range(start, start + size):
+            name = f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}'
+            batch.append(Product(
+                sku=f'{prefix}-{i}',
+                name=name,
+                description=f'{name}: экологичный товар для дома без пластика.',
+                price=Decimal(rng.randrange(50, 5000)) + Decimal('0.90'),
+                category_id=rng.choice(category_ids),
+                stock_quantity=rng.choice((0, 1, 5, 10, 50, 100)),
+                material=rng.choice(MATERIALS),
+                is_active=rng.random() > 0.05,
+            ))
+        ids += [product.pk for product in Product.objects.bulk_create(batch)]
+        if progress:
+            progress('products', len(ids))
+    return ids
+
+
+def _users(rng, config, prefix, progress):
+    password = make_password(PASSWORD)
+    batch = [
+        CustomUser(username=f'{prefix}-user{i}', email=f'{prefix}-user{i}@example.com', password=password)
+        for i in range(config['users'])
+    ]
+    ids = [user.pk for user in CustomUser.objects.bulk_create(batch, batch_size=BATCH_SIZE)]
+    if progress:
+        progress('users', len(ids))
+    return ids
+
+
+def _backdate(model, objects, rng, now):
+    for obj in objects:
+        obj.created_at = now - timedelta(seconds=rng.randrange(DAYS * 86400))
+    model.objects.bulk_update(objects, ['created_at'], batch_size=500)
+
+
+def _reviews(rng, config, product_ids, user_ids, progress):
+    now = timezone.now()
+    done = 0
+    for start, size in _chunks(config['reviews']):
+        batch = [
+            Review(product_id=rng.choice(product_ids), user_id=rng.choice(user_ids),
+                   rating=rng.choices((1, 2, 3, 4, 5), (1, 1, 3, 6, 9))[0],
+                   comment=rng.choice(COMMENTS), is_approved=rng.random() > 0.2)
+            for _ in range(size)
+        ]
+        _backdate(Review, Review.objects.bulk_create(batch), rng, now)
+        done += size
+        if progress:
+            progress('reviews', done)
+
+
+def _orders(rng, config, product_ids, user_ids, progress):
+    prices = dict(Product.objects.values_list('pk', 'price'))
+    statuses, weights = zip(*STATUS_WEIGHTS)
+    now = timezone.now()
+    done = 0
+    for start, size in _chunks(config['orders']):
+        orders, lines = [], []
+        for i in range(size):
+            picked = rng.sample(product_ids, rng.randint(1, MAX_ORDER_ITEMS))
+            quantities = [(pk, rng.randint(1, 3)) for pk in picked]
+            user_id = rng.choice(user_ids) if rng.random() > 0.3 else None
+            orders.append(Order(
+                user_id=user_id,
+                guest_email='' if user_id else f'guest{start + i}@example.com',
+                guest_name='' if user_id else 'Гость',
+                status=rng.choices(statuses, weights)[0],
+                total_amount=sum(prices[pk] * qty for pk, qty in quantities),
+                address='Ульяновск',
+                phone='+70000000000',
+            ))
+            lines.append(quantities)
+        orders = Order.objects.bulk_create(orders)
+        _backdate(Order, orders, rng, now)
+        OrderItem.objects.bulk_create([
+            OrderItem(order_id=order.pk, product_id=pk, quantity=qty, unit_price=prices[pk])
+            for order, quantities in zip(orders, lines) for pk, qty in quantities
+        ])
+        done += size
+        if progress:
+            progress('orders', done)
+
+
+def generate(scale='small', seed=42, prefix='seed', progress=None, **overrides):
+    """Создаёт данные масштаба scale (ключ SCALES); overrides меняют отдельные числа.
+
+    Возвращает итоговую конфигурацию.
+    """
+    config = dict(SCALES[scale], **{k: v for k, v in overrides.items() if v is not None})
+    rng = random.Random(seed)
+    with transaction.atomic():
+        category_ids = _categories(rng, config, prefix)
+        product_ids = _products(rng, config, prefix, category_ids, progress)
+        user_ids = _users(rng, config, prefix, progress)
+        _reviews(rng, config, product_ids, user_ids, progress)
+        _orders(rng, config, product_ids, user_ids, progress)
+
+    ratings.recount()
+    rollups.rebuild()
+    search.rebuild(Product.objects.all())
+    facets.recount_all()
+    category_tree.invalidate()
+    ranking.rebuild_counters()
+    ranking.rank()
+    page_cache.invalidate()
+    return config
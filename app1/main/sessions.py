@@ -0,0 +1,109 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils import timezone
+
+from . import reservations
+from .models import Cart
+
+# Сессии: чтение через кэш, в БД пишем только изменившиеся данные.
+# Стандартный cached_db пишет в django_session при каждом save(), даже
+# если в сессию положили то же самое (id гостевой корзины, прочитанные
+# сообщения). Здесь save() сравнивает данные со снимком, сделанным при
+# загрузке, и при совпадении не делает ничего.
+#
+# Кэш сессий должен быть общим для всех процессов: с LocMemCache у каждого
+# процесса своя копия, и сессия, сброшенная выходом в одном процессе,
+# жила бы в кэше остальных. Поэтому с локальным кэшем SessionStore
+# работает как обычный db-бэкенд - читает сессию прямо из БД.
+#
+# Истёкшие сессии удаляются пачками вместе с гостевыми корзинами,
+# каждая пачка - в своей короткой транзакции (SQLite блокирует всю базу
+# на время записи).
+
+BATCH_SIZE = 500
+
+
+def _is_process_local(cache):
+    return isinstance(cache, LocMemCache)
+
+
+class SessionStore(CachedDBStore):
+    _snapshot = None
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        if _is_process_local(self._cache):
+            # Операции cached_db с кэшем становятся пустыми - остаётся БД
+            self._cache = DummyCache('sessions', {})
+
+    def _dump(self, data):
+        return self.serializer().dumps(data)
+
+    def load(self):
+        data = super().load()
+        self._snapshot = self._dump(data)
+        return data
+
+    async def aload(self):
+        data = await super().aload()
+        self._snapshot = self._dump(data)
+        return data
+
+    def _unchanged(self, must_create):
+        return (not must_create and self.session_key is not None
+                and self._snapshot is not None
+                and self._dump(self._get_session()) == self._snapshot)
+
+    def save(self, must_create=False):
+        if self._unchanged(must_create):
+            return
+        super().save(must_create)
+        self._snapshot = self._dump(self._get_session())
+
+    async def asave(self, must_create=False):
+        if self._unchanged(must_create):
+            return
+        await super().asave(must_create)
+        self._snapshot = self._dump(await self._aget_session())
+
+    @classmethod
+    def clear_expired(cls, batch_size=BATCH_SIZE, pause=0, progress=None):
+        """Удаляет истёкшие сессии и их гостевые корзины пачками.
+
+        Возвращает (сессий, корзин). pause - пауза между пачками в секундах,
+        чтобы не держать базу занятой подряд.
+        """
+        session_model = cls.get_model_class()
+        cache = caches[settings.SESSION_CACHE_ALIAS]
+        now = timezone.now()
+        sessions = carts = 0
+        while True:
+            with transaction.atomic():
+                keys = list(
+                    session_model.objects.filter(expire_date__lt=now)
+                    .values_list('session_key', flat=True)[:batch_size]
+                )
+                if not keys:
+                    break
+                guest_carts = Cart.objects.filter(session_key__in=keys, user__isnull=True)
+                # Резервы товара возвращаем на склад до каскадного удаления
+                reservations.release_carts(list(guest_carts.values_list('pk', flat=True)))
+                # Позиции удаляются каскадом одним DELETE ... WHERE cart_id IN
+                _, deleted = guest_carts.delete()
+                carts += deleted.get(Cart._meta.label, 0)
+                session_model.objects.filter(session_key__in=keys).delete()
+            cache.delete_many([cls.cache_key_prefix + key for key in keys])
+            sessions += len(keys)
+            if progress:
+                progress(sessions, carts)
+            if len(keys) < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+        return sessions, carts
@@ -0,0 +1,132 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import cart, category_tree, db, facets, http_cache, images, page_cache, ranking, ratings, rollups, search, tasks
+from .models import Category, Order, Product, Review, Task
+
+
+@receiver(connection_created)
+def sqlite_connection_created(sender, connection, **kwargs):
+    db.configure_sqlite(connection)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    category_tree.invalidate()
+    page_cache.invalidate()
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    # Дети удалённой категории стали корневыми (SET_NULL) - чиним их пути
+    Category.rebuild_paths()
+    category_tree.invalidate()
+    page_cache.invalidate()
+    http_cache.touch_catalog(instance.parent_id)
+
+
+@receiver(pre_save, sender=Product)
+def product_pre_save(sender, instance, raw=False, **kwargs):
+    # Запоминаем прежние категорию (при переносе товара пересчитать нужно обе)
+    # и изображение (производные создаём только для нового файла)
+    instance._old_category_id = instance._old_image = None
+    if instance.pk and not raw:
+        old = Product.objects.filter(pk=instance.pk).values_list('category_id', 'image').first()
+        if old is not None:
+            instance._old_category_id, instance._old_image = old
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    search.index_product(instance)
+    facets.recount_category(instance.category_id)
+    old_category_id = getattr(instance, '_old_category_id', None)
+    if old_category_id and old_category_id != instance.category_id:
+        facets.recount_category(old_category_id)
+    facets.invalidate()
+    page_cache.invalidate()
+    if instance.image and instance.image.name != getattr(instance, '_old_image', None):
+        image_name = instance.image.name
+        transaction.on_commit(lambda: images.schedule(image_name))
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, origin=None, **kwargs):
+    search.remove_product(instance.pk)
+    # При каскадном удалении категории её счётчики удаляются вместе с ней
+    if isinstance(origin, Product) or getattr(origin, 'model', None) is Product:
+        facets.recount_category(instance.category_id)
+    facets.invalidate()
+    page_cache.invalidate()
+    http_cache.touch_catalog(instance.category_id)
+
+
+@receiver(pre_save, sender=Review)
+def review_pre_save(sender, instance, raw=False, **kwargs):
+    instance._old_state = None
+    if instance.pk and not raw:
+        instance._old_state = (
+            Review.objects.filter(pk=instance.pk).values_list('product_id', 'is_approved', 'rating').first()
+        )
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old_state = getattr(instance, '_old_state', None)
+    if old_state is not None:
+        old_product_id, was_approved, old_rating = old_state
+        count, total = ratings.contribution(was_approved, old_rating)
+        ratings.apply_delta(old_product_id, -count, -total)
+    count, total = ratings.contribution(instance.is_approved, instance.rating)
+    ratings.apply_delta(instance.product_id, count, total)
+    page_cache.invalidate()
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    count, total = ratings.contribution(instance.is_approved, instance.rating)
+    ratings.apply_delta(instance.product_id, -count, -total)
+    page_cache.invalidate()
+
+
+@receiver(pre_save, sender=Order)
+def order_pre_save(sender, instance, raw=False, **kwargs):
+    instance._old_status = None
+    if instance.pk and not raw:
+        instance._old_status = Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        # Позиции пишутся после самого заказа - витрину и счётчики хитов
+        # обновит воркер, задачи коммитятся вместе с заказом
+        tasks.enqueue(rollups.TASK, order_id=instance.pk)
+        tasks.enqueue(ranking.TASK, order_id=instance.pk)
+    elif getattr(instance, '_old_status', None) is not None:
+        rollups.status_changed(instance, instance._old_status)
+
+
+@receiver(pre_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    # Заказ ещё не попал в витрину - достаточно снять его задачу
+    queued, _ = Task.objects.filter(
+        name=rollups.TASK, status__in=Task.QUEUED_STATUSES, payload__order_id=instance.pk).delete()
+    # pre_delete: позиции заказа ещё на месте
+    if not queued and rollups.is_counted(instance.status):
+        rollups.apply_order(instance, -1)
+
+
+@receiver(user_logged_in)
+def merge_guest_cart(sender, request, user, **kwargs):
+    if request is not None:
+        cart.attach_guest_cart(request, user)
@@ -38,17 +38,15 @@ document.addEventListener('DOMContentLoaded', function() {
             e.preventDefault();
             const productId = this.getAttribute('data-product-id');
             
-            // Временный alert
-            alert('Товар добавлен в корзину!');
-            
-            // Можно добавить анимацию
-            this.innerHTML = '<i class="bi bi-check"></i> Добавлено';
-            this.style.backgroundColor = '#28a745';
-            
-            setTimeout(() => {
-                this.innerHTML = '<i class="bi bi-cart-plus me-2"></i>Добавить в корзину';
-                this.style.backgroundColor = '';
-            }, 2000);
+            cartApi('add', {product_id: productId, quantity: 1}).then(cart => {
+                this.innerHTML = '<i class="bi bi-check"></i> Добавлено';
+                this.style.backgroundColor = '#28a745';
+                
+                setTimeout(() => {
+                    this.innerHTML = '<i class="bi bi-cart-plus me-2"></i>Добавить в корзину';
+                    this.style.backgroundColor = '';
+                }, 2000);
+            }).catch(error => alert(error.message));
         });
     });
     
@@ -83,4 +81,40 @@ document.addEventListener('DOMContentLoaded', function() {
     };
     
     initSlider();
-});
\ No newline at end of file
+});
+
+// Корзина хранится на сервере, работаем с ней через JSON API
+function getCsrfToken() {
+    const input = document.querySelector('[name=csrfmiddlewaretoken]');
+    if (input) {
+        return input.value;
+    }
+    const match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+    return match ? decodeURIComponent(match[1]) : '';
+}
+
+function cartApi(action, payload) {
+    return fetch('/api/cart/' + action + '/', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': getCsrfToken()
+        },
+        body: JSON.stringify(payload)
+    }).then(response => response.json().then(data => {
+        if (!response.ok) {
+            throw new Error(data.error || 'Ошибка корзины');
+        }
+        updateCartBadge(data.total_quantity);
+        return data;
+    }));
+}
+
+// Обновление бейджа корзины в шапке
+function updateCartBadge(totalItems) {
+    const badge = document.getElementById('cart-badge');
+    if (badge) {
+        badge.textContent = totalItems;
+        badge.style.display = totalItems > 0 ? 'inline' : 'none';
+    }
+}
@@ -0,0 +1,137 @@
+import re
+from functools import lru_cache
+
+# Стеммер для русского языка по алгоритму Snowball (Russian). Если установлен
+# пакет snowballstemmer, используем его; иначе - компактную реализацию ниже.
+
+try:
+    import snowballstemmer
+except ImportError:  # pragma: no cover - зависит от окружения
+    snowballstemmer = None
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND_1 = ('вшись', 'вши', 'в')
+PERFECTIVE_GERUND_2 = ('ившись', 'ывшись', 'ивши', 'ывши', 'ив', 'ыв')
+REFLEXIVE = ('ся', 'сь')
+ADJECTIVE = (
+    'ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое', 'ей', 'ий',
+    'ый', 'ой', 'ем', 'им', 'ым', 'ом', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+)
+PARTICIPLE_1 = ('ем', 'нн', 'вш', 'ющ', 'щ')
+PARTICIPLE_2 = ('ивш', 'ывш', 'ующ')
+VERB_1 = (
+    'ете', 'йте', 'ешь', 'нно', 'ла', 'на', 'ли', 'ем', 'ло', 'но', 'ет', 'ют',
+    'ны', 'ть', 'й', 'л', 'н',
+)
+VERB_2 = (
+    'ейте', 'уйте', 'ила', 'ыла', 'ена', 'ите', 'или', 'ыли', 'ило', 'ыло', 'ено',
+    'ует', 'уют', 'ены', 'ить', 'ыть', 'ишь', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым',
+    'ен', 'ят', 'ит', 'ыт', 'ую', 'ю',
+)
+NOUN = (
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ев', 'ов', 'ие', 'ье', 'еи',
+    'ии', 'ей', 'ой', 'ий', 'ям', 'ем', 'ам', 'ом', 'ах', 'ях', 'ию', 'ью', 'ия',
+    'ья', 'а', 'е', 'и', 'й', 'о', 'у', 'ы', 'ь', 'ю', 'я',
+)
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _regions(word):
+    """Начала областей RV и R2 (индексы в слове)."""
+    rv = r1 = r2 = len(word)
+    for i, ch in enumerate(word):
+        if ch in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def _strip(word, start, endings, after_a=False):
+    """Отрезает самое длинное окончание из endings, лежащее в word[start:].
+
+    after_a - окончание должно идти после "а" или "я" (сама буква остаётся).
+    """
+    for ending in sorted(endings, key=len, reverse=True):
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            if after_a:
+                pos = len(word) - len(ending) - 1
+                if pos < start or word[pos] not in 'ая':
+                    continue
+            return word[:-len(ending)], True
+    return word, False
+
+
+def _strip_group(word, start, group_1, group_2):
+    # Из двух групп выигрывает более длинное окончание
+    w1, found_1 = _strip(word, start, group_1, after_a=True)
+    w2, found_2 = _strip(word, start, group_2)
+    if found_1 and found_2:
+        return (w1, True) if len(w1) < len(w2) else (w2, True)
+    if found_1:
+        return w1, True
+    return w2, found_2
+
+
+def _stem_fallback(word):
+    rv, r2 = _regions(word)
+    if rv >= len(word):
+        return word
+
+    # Шаг 1
+    word, found = _strip_group(word, rv, PERFECTIVE_GERUND_1, PERFECTIVE_GERUND_2)
+    if not found:
+        word, _ = _strip(word, rv, REFLEXIVE)
+        stripped, found = _strip(word, rv, ADJECTIVE)
+        if found:
+            word, _ = _strip_group(stripped, rv, PARTICIPLE_1, PARTICIPLE_2)
+        else:
+            word, found = _strip_group(word, rv, VERB_1, VERB_2)
+            if not found:
+                word, _ = _strip(word, rv, NOUN)
+
+    # Шаг 2
+    word, _ = _strip(word, rv, ('и',))
+
+    # Шаг 3
+    word, _ = _strip(word, r2, DERIVATIONAL)
+
+    # Шаг 4
+    word, found = _strip(word, rv, SUPERLATIVE)
+    if word.endswith('нн') and len(word) - 1 > rv:
+        word = word[:-1]
+    elif not found:
+        word, _ = _strip(word, rv, ('ь',))
+    return word
+
+
+if snowballstemmer is not None:
+    _russian = snowballstemmer.stemmer('russian')
+    _stem = _russian.stemWord
+else:
+    _stem = _stem_fallback
+
+# Словарь каталога невелик и слова повторяются из товара в товар -
+# при массовой индексации почти все основы берутся из кэша
+stem = lru_cache(maxsize=65536)(_stem)
+
+
+def tokenize(text):
+    """Разбивает текст на слова в нижнем регистре и стеммирует русские."""
+    tokens = []
+    for word in WORD_RE.findall((text or '').lower().replace('ё', 'е')):
+        if any('а' <= ch <= 'я' for ch in word):
+            word = stem(word)
+        tokens.append(word)
+    return tokens
@@ -0,0 +1,224 @@
+import logging
+import os
+import random
+import time
+import traceback
+from datetime import timedelta
+
+from django.core.mail import send_mail
+from django.db import DatabaseError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import facets, ranking, rollups
+from .models import CustomUser, Order, Task
+
+logger = logging.getLogger(__name__)
+
+# Локальная очередь задач без брокера: таблица Task (transactional outbox).
+# enqueue() пишет задачу в ту же транзакцию, что и заказ или пользователя:
+# откатилась транзакция - нет и задачи, закоммитилась - задача не потеряется
+# даже при падении процесса. Выполняют задачи процессы run_workers: берут
+# пачку, арендуя её на LEASE (упавший воркер не держит задачи вечно),
+# при ошибке откладывают с экспоненциальной паузой, после MAX_ATTEMPTS
+# попыток задача остаётся в таблице со статусом dead и текстом ошибки.
+#
+# Изменения обработчика в базе коммитятся вместе с удалением задачи,
+# поэтому в базе задача учитывается ровно один раз. Внешние действия
+# (письма) - "хотя бы один раз": воркер может упасть после отправки, но до
+# коммита, и обработчик выполнится повторно - это обработчики должны
+# переносить.
+
+BATCH_SIZE = 10
+MAX_ATTEMPTS = 5
+# Пауза перед повтором: BACKOFF_BASE * 2^(попытка-1), не больше BACKOFF_MAX
+BACKOFF_BASE = 10
+BACKOFF_MAX = 60 * 60
+LEASE = timedelta(minutes=5)
+
+HANDLERS = {}
+# Задачи, которые только отправляют что-то наружу (письма): выполняются вне
+# транзакции - при transaction_mode IMMEDIATE транзакция с первого запроса
+# держит блокировку записи SQLite, и вся запись сайта ждала бы SMTP
+OUTSIDE_TRANSACTION = set()
+
+
+def handler(name, atomic=True):
+    """Регистрирует функцию как обработчик задачи name; параметры - из payload.
+
+    atomic=False - обработчик без записи в базу, выполняется вне транзакции.
+    """
+    def register(func):
+        HANDLERS[name] = func
+        if not atomic:
+            OUTSIDE_TRANSACTION.add(name)
+        return func
+    return register
+
+
+def enqueue(name, **payload):
+    """Ставит задачу в очередь в текущей транзакции вызывающего кода."""
+    if name not in HANDLERS:
+        raise KeyError(f'Неизвестная задача: {name}')
+    return Task.objects.create(name=name, payload=payload)
+
+
+def worker_name():
+    return f'{os.uname().nodename}:{os.getpid()}'
+
+
+def backoff(attempts):
+    delay = min(BACKOFF_BASE * 2 ** max(attempts - 1, 0), BACKOFF_MAX)
+    # Разброс - чтобы упавшие разом задачи не повторялись тоже разом
+    return timedelta(seconds=delay * random.uniform(0.75, 1.0))
+
+
+def claim(worker, batch_size=BATCH_SIZE, lease=LEASE):
+    """Забирает до batch_size готовых задач под аренду воркера worker."""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            Task.objects.select_for_update(skip_locked=True)
+            .filter(Q(status='pending', run_after__lte=now) | Q(status='running', locked_until__lt=now))
+            .order_by('run_after').values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        Task.objects.filter(pk__in=ids).update(
+            status='running', locked_by=worker, locked_until=now + lease, attempts=F('attempts') + 1)
+    return list(Task.objects.filter(pk__in=ids, locked_by=worker).order_by('run_after'))
+
+
+def execute(task):
+    """Выполняет одну задачу; True - успех (задача удаляется из очереди)."""
+    func = HANDLERS.get(task.name)
+    try:
+        if func is None:
+            raise LookupError(f'Неизвестная задача: {task.name}')
+        if task.name in OUTSIDE_TRANSACTION:
+            func(**task.payload)
+            # Отдельным коротким запросом; аренду потеряли - отправленное
+            # уже не вернуть, задачу снимет другой воркер
+            Task.objects.filter(pk=task.pk, locked_by=task.locked_by).delete()
+            return True
+        # Изменения обработчика в базе и удаление задачи - одна транзакция:
+        # либо задача выполнена и снята, либо ни того, ни другого
+        with transaction.atomic():
+            func(**task.payload)
+            deleted, _ = Task.objects.filter(pk=task.pk, locked_by=task.locked_by).delete()
+            if not deleted:
+                # Аренда истекла, задачу забрал другой воркер - его результат и останется
+                transaction.set_rollback(True)
+                logger.warning('Задача %s #%s: аренда потеряна, результат отменён', task.name, task.pk)
+                return False
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Задача %s #%s, попытка %s: ошибка', task.name, task.pk, task.attempts, exc_info=True)
+        if func is None or task.attempts >= MAX_ATTEMPTS:
+            changes = {'status': 'dead'}
+        else:
+            changes = {'status': 'pending', 'run_after': timezone.now() + backoff(task.attempts)}
+        Task.objects.filter(pk=task.pk, locked_by=task.locked_by).update(
+            locked_by='', locked_until=None, last_error=error, **changes)
+        return False
+    return True
+
+
+def work(worker=None, batch_size=BATCH_SIZE, poll=1.0, stop=None, once=False, progress=None):
+    """Цикл воркера: забрать пачку, выполнить, повторить.
+
+    once=True - выйти, когда готовых задач не осталось; stop - threading/
+    multiprocessing Event для остановки. Возвращает (успешно, с ошибкой).
+    """
+    worker = worker or worker_name()
+    done = failed = 0
+
+    def pause():
+        if stop is not None:
+            stop.wait(poll)
+        else:
+            time.sleep(poll)
+
+    while not (stop is not None and stop.is_set()):
+        try:
+            tasks = claim(worker, batch_size)
+            if not tasks:
+                if once:
+                    break
+                # Без паузы пустая очередь опрашивалась бы непрерывно
+                pause()
+                continue
+            for task in tasks:
+                if execute(task):
+                    done += 1
+                else:
+                    failed += 1
+        except DatabaseError:
+            # "database is locked" и т.п. не должны останавливать воркер:
+            # недоделанные задачи вернутся в очередь по истечении аренды
+            if once:
+                raise
+            logger.warning('Воркер %s: ошибка базы, пауза %s с', worker, poll, exc_info=True)
+            pause()
+            continue
+        if progress:
+            progress(done, failed)
+    return done, failed
+
+
+def run_pending():
+    """Выполняет все готовые задачи в текущем процессе (тесты, отладка)."""
+    return work('inline', once=True)
+
+
+def requeue(queryset):
+    """Возвращает задачи (обычно dead) в очередь с нуля попыток."""
+    return queryset.update(status='pending', attempts=0, run_after=timezone.now(),
+                           locked_by='', locked_until=None)
+
+
+# Обработчики
+
+@handler('order_confirmation', atomic=False)
+def send_order_confirmation(order_id):
+    order = Order.objects.select_related('user').filter(pk=order_id).first()
+    if order is None:
+        return
+    email = order.user.email if order.user else order.guest_email
+    if not email:
+        return
+    lines = [
+        f'{item.product.name} x {item.quantity} - {item.unit_price * item.quantity} руб.'
+        for item in order.items.select_related('product').order_by('pk')
+    ]
+    send_mail(
+        f'EcoHome: заказ №{order.pk} оформлен',
+        '\n'.join(['Спасибо за заказ!', ''] + lines + ['', f'Итого: {order.total_amount} руб.',
+                                                        f'Адрес доставки: {order.address}']),
+        None,
+        [email],
+    )
+
+
+@handler('welcome_email', atomic=False)
+def send_welcome_email(user_id):
+    user = CustomUser.objects.filter(pk=user_id).first()
+    if user is None or not user.email:
+        return
+    send_mail('Добро пожаловать в EcoHome',
+              f'{user.username}, спасибо за регистрацию в EcoHome!', None, [user.email])
+
+
+@handler(rollups.TASK)
+def add_order_to_rollups(order_id):
+    rollups.order_created(order_id)
+
+
+@handler(ranking.TASK)
+def add_order_to_ranking(order_id):
+    ranking.order_created(order_id)
+
+
+@handler(facets.TASK)
+def recount_facets(product_ids):
+    facets.recount_products(product_ids)
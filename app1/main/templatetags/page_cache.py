@@ -0,0 +1,37 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from main import page_cache
+
+register = template.Library()
+
+
+class CachedFragmentNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        vary = [var.resolve(context) for var in self.vary_on]
+        key = page_cache.make_key('fragment:' + name, *vary)
+        return mark_safe(page_cache.get_or_build(key, lambda: self.nodelist.render(context)))
+
+
+@register.tag('cachedfragment')
+def do_cachedfragment(parser, token):
+    """Кэширует отрисованный фрагмент до следующего изменения каталога.
+
+    {% cachedfragment "product_card" product.id %} ... {% endcachedfragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' требует имя фрагмента")
+    nodelist = parser.parse(('endcachedfragment',))
+    parser.delete_first_token()
+    return CachedFragmentNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        [parser.compile_filter(bit) for bit in bits[2:]],
+    )
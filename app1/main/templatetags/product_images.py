@@ -0,0 +1,41 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from main import images
+
+register = template.Library()
+
+PLACEHOLDER = 'main/images/placeholder.svg'
+
+
+@register.simple_tag
+def product_image(product, size='card', css_class='', alt=None):
+    """<picture> с WebP и JPEG производными в 1x/2x через srcset.
+
+    Пока производные не созданы, отдаём оригинал; без изображения -
+    локальную заглушку из static.
+    """
+    alt = product.name if alt is None else alt
+    width, height, _ = images.SIZES[size]
+    if not product.image:
+        return format_html(
+            '<img src="{}" class="{}" alt="{}" width="{}" height="{}">',
+            static(PLACEHOLDER), css_class, alt, width, height,
+        )
+
+    name = product.image.name
+    if not images.has_derivatives(name, size):
+        return format_html('<img src="{}" class="{}" alt="{}" loading="lazy">',
+                           product.image.url, css_class, alt)
+
+    def srcset(ext):
+        return ', '.join(f'{images.derivative_url(name, size, scale, ext)} {scale}x'
+                         for scale in images.SCALES)
+
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}">'
+        '<img src="{}" srcset="{}" class="{}" alt="{}" width="{}" height="{}" loading="lazy"></picture>',
+        srcset('webp'), images.derivative_url(name, size, 1, 'jpg'), srcset('jpg'),
+        css_class, alt, width, height,
+    )
@@ -1,3 +1,1493 @@
-from django.test import TestCase
+import base64
+import gzip
+import json
+import shutil
+import tempfile
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest.mock import MagicMock, patch
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.cache import SessionStore
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles import finders
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import Http404
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import admin as shop_admin, async_views, benchmark, cart as cart_service, category_tree, checkout as checkout_service, db, facets, feed, http_cache, images, instrumentation, middleware, page_cache, ranking, recommendations, reservations, rollups, search, seed, sessions, tasks, views
+from .models import (
+    Cart, CartItem, Category, CategoryDailySales, CustomUser, DailySales, Order, OrderItem, Product, Review,
+    Bestseller, ProductPair, ProductSales, Recommendation, StockHold, Task,
+)
+from .pagination import decode_cursor, keyset_paginate
+
+TEST_MEDIA_ROOT = tempfile.mkdtemp(prefix='ecohome-media-')
+
+
+def make_product(category, **kwargs):
+    kwargs.setdefault('name', 'Товар')
+    kwargs.setdefault('description', 'Описание')
+    kwargs.setdefault('price', Decimal('100.00'))
+    return Product.objects.create(category=category, **kwargs)
+
+
+class CatalogPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Кухня', slug='kitchen')
+        cls.other = Category.objects.create(name='Ванная', slug='bath')
+        for i in range(30):
+            make_product(cls.category, name=f'Товар {i}', price=Decimal(100 + i % 7))
+        make_product(cls.other, name='Мыло')
+
+    def test_pages_cover_every_product_once(self):
+        qs = Product.objects.filter(is_active=True)
+        for field, descending in (('created_at', True), ('price', False), ('price', True)):
+            seen, cursor = [], None
+            while True:
+                page = keyset_paginate(qs, field, descending, cursor=cursor, per_page=7)
+                seen += [p.id for p in page]
+                if not page.has_next:
+                    break
+                cursor = page.next_cursor
+            self.assertEqual(sorted(seen), sorted(qs.values_list('id', flat=True)))
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        page = keyset_paginate(Product.objects.all(), 'price', False, cursor='garbage', per_page=5)
+        self.assertEqual(len(page), 5)
+        self.assertFalse(page.has_previous)
+        for raw in ('["NaN",1]', '["Infinity",1]', '["100",1e400]', '["100",%d]' % 2 ** 64):
+            cursor = base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+            self.assertIsNone(decode_cursor('price', cursor), raw)
+            response = self.client.get(reverse('catalog'), {'sort': 'price', 'after': cursor})
+            self.assertEqual(len(response.context['page']), 24)
+
+    def test_catalog_keeps_category_filter(self):
+        response = self.client.get(reverse('catalog'), {'category': self.other.id})
+        self.assertEqual([p.name for p in response.context['products']], ['Мыло'])
+
+    def test_catalog_next_page(self):
+        response = self.client.get(reverse('catalog'), {'sort': 'price'})
+        page = response.context['page']
+        self.assertEqual(len(page), 24)
+        self.assertContains(response, f'after={page.next_cursor}')
+        response = self.client.get(reverse('catalog'), {'sort': 'price', 'after': page.next_cursor})
+        self.assertEqual(len(response.context['page']), 7)
+
+
+class CategoryTreeTests(TestCase):
+    def setUp(self):
+        self.root = Category.objects.create(name='Дом', slug='home')
+        self.kitchen = Category.objects.create(name='Кухня', slug='kitchen', parent=self.root)
+        self.knives = Category.objects.create(name='Ножи', slug='knives', parent=self.kitchen)
+        self.garden = Category.objects.create(name='Сад', slug='garden')
+
+    def test_paths(self):
+        self.assertEqual(self.knives.path, f'/{self.root.pk}/{self.kitchen.pk}/{self.knives.pk}/')
+        self.assertEqual(self.knives.depth, 2)
+        self.assertEqual(set(self.root.get_descendants()), {self.root, self.kitchen, self.knives})
+
+    def test_move_rewrites_subtree(self):
+        self.kitchen.parent = self.garden
+        self.kitchen.save()
+        self.knives.refresh_from_db()
+        self.assertEqual(self.knives.path, f'/{self.garden.pk}/{self.kitchen.pk}/{self.knives.pk}/')
+        self.assertEqual(category_tree.get_tree().descendant_ids(self.garden.pk),
+                         [self.garden.pk, self.kitchen.pk, self.knives.pk])
+
+    def test_cannot_move_into_own_subtree(self):
+        self.root.parent = self.knives
+        with self.assertRaises(ValueError):
+            self.root.save()
+
+    def test_delete_reroots_children(self):
+        self.kitchen.delete()
+        self.knives.refresh_from_db()
+        self.assertEqual(self.knives.path, f'/{self.knives.pk}/')
+        self.assertEqual(self.knives.depth, 0)
+
+    def test_parent_category_lists_subtree_products(self):
+        make_product(self.knives, name='Нож')
+        make_product(self.garden, name='Лейка')
+        facets.get_counts(self.root.id)
+        ranking.top(self.root.id)
+        # Валидатор условного GET и сама страница товаров
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('catalog'), {'category': self.root.id})
+        self.assertEqual([p.name for p in response.context['products']], ['Нож'])
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Ванная', slug='bath')
+        cls.brush = make_product(cls.category, name='Бамбуковая зубная щётка',
+                                 description='Мягкая щетина', material='Бамбук')
+        cls.soap = make_product(cls.category, name='Мыло ручной работы',
+                                description='Подходит для бамбуковых полок', material='Оливковое масло')
+
+    def test_stemmed_match_and_ranking(self):
+        ids, has_next = search.search('бамбуковые щетки')
+        self.assertEqual(ids, [self.brush.id])
+        ids, _ = search.search('бамбук')
+        self.assertEqual(ids[0], self.brush.id)
+        self.assertEqual(set(ids), {self.brush.id, self.soap.id})
+        self.assertFalse(has_next)
+
+    def test_index_follows_saves_and_deletes(self):
+        self.soap.is_active = False
+        self.soap.save()
+        self.assertEqual(search.search('мыло')[0], [])
+        self.brush.delete()
+        self.assertEqual(search.search('щётка')[0], [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.TABLE}')
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(search.search('масло')[0], [self.soap.id])
+
+    def test_search_view(self):
+        response = self.client.get(reverse('search'), {'q': 'Щетка "'})
+        self.assertEqual(response.context['products'], [self.brush])
+        response = self.client.get(reverse('search'), {'q': ''})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('search'), {'q': 'щетка', 'page': '9' * 30})
+        self.assertEqual(response.context['page_number'], views.SEARCH_MAX_PAGE)
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        self.root = Category.objects.create(name='Дом', slug='home')
+        self.kitchen = Category.objects.create(name='Кухня', slug='kitchen', parent=self.root)
+        self.garden = Category.objects.create(name='Сад', slug='garden')
+        make_product(self.root, material='Бамбук', price=Decimal('300'), stock_quantity=5)
+        make_product(self.kitchen, material='Бамбук', price=Decimal('700'))
+        make_product(self.kitchen, material='Стекло', price=Decimal('700'), stock_quantity=1)
+        self.hose = make_product(self.garden, material='Резина', price=Decimal('5000'), stock_quantity=2)
+
+    def test_subtree_counts(self):
+        counts = facets.get_counts(self.root.id)
+        self.assertEqual(counts['material'], [('Бамбук', 2), ('Стекло', 1)])
+        self.assertEqual(counts['price'], {'0-500': 1, '500-1000': 2})
+        self.assertEqual(counts['stock'], 2)
+        self.assertEqual(facets.get_counts()['stock'], 3)
+
+    def test_counts_follow_product_moves(self):
+        facets.get_counts(self.root.id)
+        self.hose.category = self.kitchen
+        self.hose.save()
+        counts = facets.get_counts(self.root.id)
+        self.assertIn(('Резина', 1), counts['material'])
+        self.assertEqual(facets.get_counts(self.garden.id)['stock'], 0)
+
+    def test_counts_served_from_cache(self):
+        facets.get_counts(self.root.id)
+        with self.assertNumQueries(0):
+            facets.get_counts(self.root.id)
+
+    def test_catalog_filters(self):
+        response = self.client.get(reverse('catalog'), {
+            'category': self.root.id, 'material': 'Бамбук', 'price': '500-1000'})
+        self.assertEqual(len(response.context['products']), 1)
+        response = self.client.get(reverse('catalog'), {'in_stock': '1'})
+        self.assertEqual(len(response.context['products']), 3)
+        # Повторный запрос обслуживается из кэша, в БД - только валидатор условного GET
+        with self.assertNumQueries(1):
+            self.client.get(reverse('catalog'), {'in_stock': '1'})
+
+    def test_non_finite_price_ignored(self):
+        for raw in ('nan-', 'Infinity-', '-sNaN', '1-inf'):
+            self.assertIsNone(facets.parse_price_range(raw))
+        response = self.client.get(reverse('catalog'), {'price': 'nan-'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_stock_counts_available_and_follow_checkout(self):
+        Product.objects.filter(pk=self.hose.pk).update(reserved=2)
+        facets.recount_all()
+        self.assertEqual(facets.get_counts(self.garden.id)['stock'], 0)
+        response = self.client.get(reverse('catalog'), {'category': self.garden.id, 'in_stock': '1'})
+        self.assertEqual(len(response.context['products']), 0)
+
+        glass = Product.objects.get(material='Стекло')
+        self.assertEqual(facets.get_counts(self.kitchen.id)['stock'], 1)
+        checkout_service.place_order([(glass.pk, 1)], email='a@example.com', address='Ульяновск')
+        tasks.run_pending()
+        self.assertEqual(facets.get_counts(self.kitchen.id)['stock'], 0)
+
+    def test_stock_counts_follow_reservations(self):
+        root = Product.objects.get(category=self.root)
+        self.assertEqual(facets.get_counts(self.root.id)['stock'], 2)
+        cart = Cart.objects.create(session_key='guest')
+        reservations.hold(cart, {root.pk: 5})
+        tasks.run_pending()
+        self.assertEqual(facets.get_counts(self.root.id)['stock'], 1)
+
+        reservations.hold(cart, {root.pk: 4})
+        tasks.run_pending()
+        self.assertEqual(facets.get_counts(self.root.id)['stock'], 2)
+
+        StockHold.objects.filter(cart=cart).update(expires_at=timezone.now())
+        reservations.hold(Cart.objects.create(session_key='other'), {root.pk: 1})
+        tasks.run_pending()
+        self.assertEqual(facets.get_counts(self.root.id)['stock'], 1)
+        reservations.release_expired()
+        tasks.run_pending()
+        self.assertEqual(facets.get_counts(self.root.id)['stock'], 2)
+
+
+class CartApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Кухня', slug='kitchen')
+        cls.cup = make_product(category, name='Кружка', price=Decimal('250.00'), stock_quantity=100)
+        cls.jar = make_product(category, name='Банка', price=Decimal('400.00'), stock_quantity=100)
+        cls.hidden = make_product(category, name='Снят с продажи', is_active=False)
+        cls.user = CustomUser.objects.create_user('buyer', password='secret-pass-123')
+
+    def post(self, action, payload):
+        return self.client.post(f'/api/cart/{action}/', payload, content_type='application/json')
+
+    def test_add_update_remove(self):
+        self.post('add', {'product_id': self.cup.id, 'quantity': 2})
+        data = self.post('add', {'product_id': self.cup.id}).json()
+        self.assertEqual(data['items'][0]['quantity'], 3)
+        self.assertEqual(data['total_price'], '750.00')
+        data = self.post('update', {'product_id': self.cup.id, 'quantity': 1}).json()
+        self.assertEqual(data['total_quantity'], 1)
+        data = self.post('remove', {'product_id': self.cup.id}).json()
+        self.assertEqual(data['items'], [])
+
+    def test_rejects_bad_input(self):
+        self.assertEqual(self.post('add', {'product_id': self.hidden.id}).status_code, 400)
+        self.assertEqual(self.post('update', {'product_id': 'abc', 'quantity': 1}).status_code, 400)
+        self.assertEqual(self.client.get('/api/cart/add/').status_code, 405)
+        huge = 2 ** 64
+        self.assertEqual(self.post('add', {'product_id': huge}).status_code, 400)
+        self.assertEqual(self.post('update', {'product_id': huge, 'quantity': 1}).status_code, 400)
+        self.assertEqual(self.post('sync', {'items': [{'product_id': huge}]}).status_code, 400)
+        self.assertEqual(self.post('add', {'product_id': self.cup.id, 'quantity': 0}).status_code, 400)
+        self.assertEqual(self.post('add', {'product_id': self.cup.id, 'quantity': -5}).status_code, 400)
+        self.assertFalse(CartItem.objects.exists())
+        for body in ('{"product_id": 1e400}', '{"product_id": %d, "quantity": 1e400}' % self.cup.id,
+                     '{"product_id": %d.5}' % self.cup.id, '{"product_id": true}',
+                     '{"items": [{"product_id": 1e400}]}'):
+            action = 'sync' if 'items' in body else 'add'
+            response = self.client.post(f'/api/cart/{action}/', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(self.post('add', {'product_id': str(self.cup.id), 'quantity': '2'}).status_code, 200)
+
+    def test_sync_replaces_contents(self):
+        self.post('add', {'product_id': self.jar.id})
+        items = [{'product_id': self.cup.id, 'quantity': 2}, {'product_id': self.hidden.id, 'quantity': 1}]
+        data = self.post('sync', {'items': items, 'replace': True}).json()
+        self.assertEqual([i['product_id'] for i in data['items']], [self.cup.id])
+
+    def test_guest_cart_merges_on_login(self):
+        self.client.force_login(self.user)
+        self.post('add', {'product_id': self.cup.id})
+        self.client.logout()
+        self.post('add', {'product_id': self.cup.id, 'quantity': 2})
+        self.post('add', {'product_id': self.jar.id})
+        self.client.post(reverse('login'), {'username': 'buyer', 'password': 'secret-pass-123'})
+        self.assertEqual(Cart.objects.count(), 1)
+        quantities = dict(CartItem.objects.values_list('product__name', 'quantity'))
+        self.assertEqual(quantities, {'Кружка': 3, 'Банка': 1})
+
+    def test_cart_page_totals(self):
+        self.post('add', {'product_id': self.cup.id, 'quantity': 2})
+        self.post('add', {'product_id': self.jar.id})
+        response = self.client.get(reverse('cart'))
+        self.assertEqual(response.context['total_price'], Decimal('900.00'))
+        self.assertContains(response, 'Кружка')
+
+
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Кухня', slug='kitchen')
+        cls.products = [make_product(category, name=f'Товар {i}', price=Decimal(10 + i), stock_quantity=100) for i in range(20)]
+
+    def fill_cart(self, products):
+        items = [{'product_id': p.id, 'quantity': 2} for p in products]
+        self.client.post('/api/cart/sync/', {'items': items}, content_type='application/json')
+
+    def checkout(self, key='key-1'):
+        return self.client.post(reverse('checkout'), {
+            'name': 'Иван', 'email': 'ivan@example.com', 'address': 'Ульяновск', 'checkout_key': key})
+
+    def test_creates_order_with_server_prices(self):
+        self.fill_cart(self.products[:3])
+        self.checkout()
+        order = Order.objects.get()
+        self.assertEqual(order.total_amount, Decimal('66.00'))
+        self.assertEqual(order.items.count(), 3)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_double_submit_returns_same_order(self):
+        self.fill_cart(self.products[:2])
+        self.checkout()
+        self.fill_cart(self.products[:2])
+        self.checkout()
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        counts = []
+        for n, key in ((1, 'small'), (20, 'large')):
+            self.fill_cart(self.products[:n])
+            with CaptureQueriesContext(connection) as ctx:
+                self.checkout(key)
+            counts.append(len(ctx))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(OrderItem.objects.count(), 21)
+
+    def test_legacy_cart_data(self):
+        cart_data = '[{"id": %d, "quantity": 3}]' % self.products[0].id
+        self.client.post(reverse('checkout'), {
+            'email': 'a@b.ru', 'address': 'Ульяновск', 'cart_data': cart_data})
+        self.assertEqual(Order.objects.get().total_amount, Decimal('30.00'))
+
+    def test_legacy_cart_data_out_of_range(self):
+        for cart_data in ('[{"id": %d, "quantity": 1}]' % 2 ** 64,
+                          '[{"id": %d, "quantity": %d}]' % (self.products[0].id, 2 ** 64),
+                          '[{"id": %d, "quantity": 1e400}]' % self.products[0].id,
+                          '[{"id": 1e400, "quantity": 1}]', '[{"id": true, "quantity": 1}]'):
+            with self.assertRaises(checkout_service.CheckoutError):
+                checkout_service.parse_cart_data(cart_data)
+            response = self.client.post(reverse('checkout'), {
+                'email': 'a@b.ru', 'address': 'Ульяновск', 'cart_data': cart_data})
+            self.assertRedirects(response, reverse('cart'))
+        self.assertFalse(Order.objects.exists())
+
+    def test_empty_cart(self):
+        response = self.checkout()
+        self.assertRedirects(response, reverse('cart'))
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Кухня', slug='kitchen')
+        cls.products = [make_product(category, name=f'Товар {i}', price=Decimal(10 + i)) for i in range(3)]
+        cls.user = CustomUser.objects.create_user('buyer', 'buyer@example.com', 'password')
+
+    def make_orders(self, n):
+        orders = Order.objects.bulk_create([
+            Order(user=self.user, total_amount=Decimal('33.00'), address='Ульяновск', phone='1') for _ in range(n)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=2, unit_price=product.price)
+            for order in orders for product in self.products[:2]
+        ])
+
+    def test_page_shows_totals_and_items(self):
+        self.make_orders(1)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('profile'))
+        order = response.context['orders'].object_list[0]
+        self.assertEqual((order.item_count, order.items_total), (4, Decimal('42.00')))
+        self.assertContains(response, '33.00 руб.')
+        self.assertContains(response, 'Товар 1')
+
+    def test_paginated_with_constant_queries(self):
+        self.client.force_login(self.user)
+        counts = []
+        for n in (2, 30):
+            self.make_orders(n)
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse('profile'))
+            counts.append(len(ctx))
+        self.assertEqual(counts[0], counts[1])
+        page = response.context['orders']
+        self.assertEqual(len(page), 10)
+        self.assertTrue(page.has_next)
+        second = self.client.get(reverse('profile'), {'orders_after': page.next_cursor}).context['orders']
+        self.assertFalse({o.pk for o in page} & {o.pk for o in second})
+
+    def test_history_uses_user_index(self):
+        plan = Order.objects.filter(user=self.user).order_by('-created_at', '-id').explain()
+        self.assertIn('order_user_created', plan)
+
+
+class ReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Кухня', slug='kitchen')
+        cls.cup = make_product(category, name='Кружка', stock_quantity=3)
+        cls.jar = make_product(category, name='Банка', stock_quantity=10)
+
+    def add(self, product, quantity):
+        return self.client.post('/api/cart/add/', {'product_id': product.id, 'quantity': quantity},
+                                content_type='application/json')
+
+    def checkout(self, key='key-1'):
+        return self.client.post(reverse('checkout'), {
+            'email': 'ivan@example.com', 'address': 'Ульяновск', 'checkout_key': key})
+
+    def test_add_holds_stock_and_refuses_oversell(self):
+        self.assertEqual(self.add(self.cup, 2).status_code, 200)
+        self.cup.refresh_from_db()
+        self.assertEqual((self.cup.reserved, self.cup.available), (2, 1))
+        response = self.add(self.cup, 2)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('доступно 3 шт.', response.json()['error'])
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+    def test_other_carts_see_reduced_availability(self):
+        self.add(self.cup, 3)
+        other = Cart.objects.create(session_key='other')
+        with self.assertRaises(reservations.ReservationError):
+            reservations.hold(other, {self.cup.id: 1})
+
+    def test_update_and_remove_adjust_hold(self):
+        self.add(self.jar, 5)
+        self.client.post('/api/cart/update/', {'product_id': self.jar.id, 'quantity': 2},
+                         content_type='application/json')
+        self.jar.refresh_from_db()
+        self.assertEqual(self.jar.reserved, 2)
+        self.client.post('/api/cart/remove/', {'product_id': self.jar.id}, content_type='application/json')
+        self.jar.refresh_from_db()
+        self.assertEqual(self.jar.reserved, 0)
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_checkout_converts_hold_into_sale(self):
+        self.add(self.cup, 2)
+        self.add(self.jar, 1)
+        self.checkout()
+        self.cup.refresh_from_db()
+        self.jar.refresh_from_db()
+        self.assertEqual((self.cup.stock_quantity, self.cup.reserved), (1, 0))
+        self.assertEqual((self.jar.stock_quantity, self.jar.reserved), (9, 0))
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_checkout_without_hold_claims_stock(self):
+        self.add(self.cup, 2)
+        # Резерв корзины истёк и снят
+        StockHold.objects.all().delete()
+        reservations.recount()
+        other = Cart.objects.create(session_key='other')
+        reservations.hold(other, {self.cup.id: 2})
+        # Свободна одна единица - заказ на две не проходит
+        self.checkout()
+        self.assertFalse(Order.objects.exists())
+        self.cup.refresh_from_db()
+        self.assertEqual((self.cup.stock_quantity, self.cup.reserved), (3, 2))
+
+    def test_sweeper_releases_expired_holds_in_batches(self):
+        carts = Cart.objects.bulk_create([Cart(session_key=f's{i}') for i in range(5)])
+        for cart in carts:
+            reservations.hold(cart, {self.jar.id: 2})
+        StockHold.objects.filter(cart__in=carts[:4]).update(expires_at=timezone.now())
+        self.assertEqual(reservations.release_expired(batch_size=3), 4)
+        self.jar.refresh_from_db()
+        self.assertEqual(self.jar.reserved, 2)
+
+    def test_merge_and_session_cleanup_keep_counter_consistent(self):
+        guest = Cart.objects.create(session_key='guest')
+        user_cart = Cart.objects.create(user=CustomUser.objects.create_user('buyer'))
+        reservations.hold(guest, {self.jar.id: 2, self.cup.id: 1})
+        reservations.hold(user_cart, {self.jar.id: 1})
+        cart_service.merge(guest, user_cart)
+        self.assertEqual(dict(user_cart.holds.values_list('product_id', 'quantity')), {self.jar.id: 3, self.cup.id: 1})
+        reservations.release_carts([user_cart.pk])
+        self.assertEqual(list(Product.objects.values_list('reserved', flat=True).distinct()), [0])
+
+
+class SalesRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.kitchen = Category.objects.create(name='Кухня', slug='kitchen')
+        cls.bath = Category.objects.create(name='Ванная', slug='bath')
+        cls.cup = make_product(cls.kitchen, name='Кружка', price=Decimal('100.00'), stock_quantity=100)
+        cls.brush = make_product(cls.bath, name='Щётка', price=Decimal('50.00'), stock_quantity=100)
+
+    def place(self, lines):
+        order, _ = checkout_service.place_order(lines, email='a@b.ru', address='Ульяновск')
+        tasks.run_pending()
+        return order
+
+    def snapshot(self):
+        return (
+            sorted(DailySales.objects.values_list('day', 'orders', 'units', 'revenue')),
+            sorted(CategoryDailySales.objects.values_list('day', 'category_id', 'orders', 'units', 'revenue')),
+        )
+
+    def test_order_created_and_cancelled(self):
+        self.place([(self.cup.id, 2), (self.brush.id, 1)])
+        order = self.place([(self.cup.id, 1)])
+        day = DailySales.objects.get()
+        self.assertEqual((day.orders, day.units, day.revenue), (2, 4, Decimal('350.00')))
+        kitchen = CategoryDailySales.objects.get(category=self.kitchen)
+        self.assertEqual((kitchen.orders, kitchen.units, kitchen.revenue), (2, 3, Decimal('300.00')))
+
+        order.status = 'cancelled'
+        order.save()
+        day.refresh_from_db()
+        self.assertEqual((day.orders, day.units, day.revenue), (1, 3, Decimal('250.00')))
+        order.status = 'processing'
+        order.save()
+        day.refresh_from_db()
+        self.assertEqual(day.orders, 2)
+
+    def test_backfill_matches_incremental(self):
+        self.place([(self.cup.id, 2), (self.brush.id, 1)])
+        self.place([(self.brush.id, 3)]).delete()
+        cancelled = self.place([(self.cup.id, 1)])
+        cancelled.status = 'cancelled'
+        cancelled.save()
+        self.place([(self.cup.id, 5)])
+        incremental = self.snapshot()
+
+        DailySales.objects.all().delete()
+        call_command('rebuild_sales_rollups', batch_size=1, stdout=StringIO())
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_dashboard_reads_only_rollups(self):
+        self.place([(self.cup.id, 2)])
+        staff = CustomUser.objects.create_user('staff', password='x', is_staff=True)
+        self.client.force_login(staff)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin_panel'), {'days': 7})
+        self.assertContains(response, 'Кухня')
+        self.assertContains(response, '200.00')
+        self.assertFalse(any('"main_order' in q['sql'] for q in ctx.captured_queries))
+
+
+class TaskQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Кухня', slug='kitchen')
+        cls.cup = make_product(category, name='Кружка', price=Decimal('100.00'), stock_quantity=100)
+
+    def place(self, quantity=1):
+        order, _ = checkout_service.place_order([(self.cup.id, quantity)], email='a@b.ru', address='Ульяновск')
+        return order
+
+    def test_order_writes_tasks_in_its_transaction(self):
+        order = self.place(2)
+        self.assertEqual(set(Task.objects.values_list('name', 'payload__order_id')),
+                         {('order_confirmation', order.pk), (rollups.TASK, order.pk), (ranking.TASK, order.pk),
+                          (facets.TASK, None)})
+        self.assertEqual(len(mail.outbox), 0)
+        # Заказ не прошёл - задач нет
+        with self.assertRaises(checkout_service.CheckoutError):
+            checkout_service.place_order([(self.cup.id, 1000)], email='a@b.ru', address='Ульяновск')
+        self.assertEqual(Task.objects.count(), 4)
+
+        self.assertEqual(tasks.run_pending(), (4, 0))
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual(mail.outbox[0].to, ['a@b.ru'])
+        self.assertIn('Кружка x 2', mail.outbox[0].body)
+        self.assertEqual(DailySales.objects.get().orders, 1)
+
+    def test_register_sends_welcome_email(self):
+        self.client.post(reverse('register'), {
+            'username': 'ivan', 'email': 'ivan@example.com', 'password1': 'Slozhnyi-parol-123',
+            'password2': 'Slozhnyi-parol-123'})
+        tasks.run_pending()
+        self.assertEqual(mail.outbox[0].to, ['ivan@example.com'])
+
+    def test_failure_backs_off_then_goes_dead(self):
+        order = self.place()
+        Task.objects.exclude(name='order_confirmation').delete()
+        with patch('main.tasks.send_mail', side_effect=ConnectionError('smtp down')), \
+                self.assertLogs('main.tasks', 'WARNING'):
+            self.assertEqual(tasks.run_pending(), (0, 1))
+            task = Task.objects.get()
+            self.assertEqual((task.status, task.attempts), ('pending', 1))
+            self.assertGreater(task.run_after, timezone.now())
+            self.assertIn('smtp down', task.last_error)
+            # Пауза ещё не прошла - задачу никто не берёт
+            self.assertEqual(tasks.run_pending(), (0, 0))
+            for attempt in range(2, tasks.MAX_ATTEMPTS + 1):
+                Task.objects.update(run_after=timezone.now())
+                tasks.run_pending()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ('dead', tasks.MAX_ATTEMPTS))
+        self.assertEqual(tasks.run_pending(), (0, 0))
+
+        tasks.requeue(Task.objects.filter(status='dead'))
+        self.assertEqual(tasks.run_pending(), (1, 0))
+        self.assertIn(f'№{order.pk}', mail.outbox[0].subject)
+
+    def test_expired_lease_is_reclaimed(self):
+        self.place()
+        claimed = tasks.claim('dead-worker', batch_size=10)
+        self.assertEqual(len(claimed), 4)
+        self.assertEqual(tasks.claim('other', batch_size=10), [])
+        Task.objects.update(locked_until=timezone.now())
+        self.assertEqual(len(tasks.claim('other', batch_size=10)), 4)
+
+    def test_handler_changes_commit_with_task_removal(self):
+        def create_category(slug, fail=False):
+            Category.objects.create(name=slug, slug=slug)
+            if fail:
+                raise RuntimeError('после записи')
+
+        with patch.dict(tasks.HANDLERS, {'create_category': create_category}):
+            tasks.enqueue('create_category', slug='broken', fail=True)
+            with self.assertLogs('main.tasks', 'WARNING'):
+                self.assertEqual(tasks.run_pending(), (0, 1))
+            self.assertFalse(Category.objects.filter(slug='broken').exists())
+            self.assertEqual(Task.objects.get().status, 'pending')
+            Task.objects.all().delete()
+
+            # Аренду перехватил другой воркер - результат опоздавшего отменяется
+            tasks.enqueue('create_category', slug='late')
+            stale = tasks.claim('slow-worker')[0]
+            Task.objects.update(locked_until=timezone.now())
+            tasks.claim('other')
+            with self.assertLogs('main.tasks', 'WARNING'):
+                self.assertFalse(tasks.execute(stale))
+            self.assertFalse(Category.objects.filter(slug='late').exists())
+            self.assertEqual(Task.objects.get().locked_by, 'other')
+
+    def test_idle_worker_sleeps_between_polls(self):
+        class Stop(Exception):
+            pass
+
+        with patch('main.tasks.time.sleep', side_effect=Stop) as sleep, self.assertRaises(Stop):
+            tasks.work('idle', poll=2.5)
+        sleep.assert_called_once_with(2.5)
+
+    def test_worker_survives_locked_database(self):
+        class Stop(Exception):
+            pass
+
+        with patch('main.tasks.claim', side_effect=[OperationalError('database is locked'), Stop]), \
+                patch('main.tasks.time.sleep') as sleep, self.assertLogs('main.tasks', 'WARNING'), \
+                self.assertRaises(Stop):
+            tasks.work('busy', poll=2.5)
+        sleep.assert_called_once_with(2.5)
+
+    def test_mail_is_sent_outside_transaction(self):
+        self.place()
+        Task.objects.exclude(name='order_confirmation').delete()
+        depth = len(connection.savepoint_ids)
+        depths = []
+        with patch('main.tasks.send_mail', side_effect=lambda *args: depths.append(len(connection.savepoint_ids))):
+            self.assertEqual(tasks.run_pending(), (1, 0))
+        # Письмо - без своей транзакции (блокировка записи SQLite не держится на время SMTP)
+        self.assertEqual(depths, [depth])
+        self.assertFalse(Task.objects.exists())
+
+    def test_cancel_and_delete_before_worker_keep_rollups_consistent(self):
+        cancelled = self.place()
+        cancelled.status = 'cancelled'
+        cancelled.save()
+        self.place(3).delete()
+        kept = self.place(2)
+        call_command('run_workers', once=True, stdout=StringIO())
+        day = DailySales.objects.get()
+        self.assertEqual((day.orders, day.units), (1, 2))
+        kept.status = 'cancelled'
+        kept.save()
+        day.refresh_from_db()
+        self.assertEqual(day.orders, 0)
+
+    def test_order_changes_while_worker_holds_task(self):
+        day_orders = lambda: DailySales.objects.values_list('orders', flat=True).first() or 0
+        cancelled, deleted = self.place(), self.place(3)
+        claimed = tasks.claim('busy-worker', batch_size=20)
+        # Задачи уже running: заказ ещё не в итогах, вычитать нечего
+        cancelled.status = 'cancelled'
+        cancelled.save()
+        deleted.delete()
+        self.assertEqual(day_orders(), 0)
+        with self.assertLogs('main.tasks', 'WARNING'):
+            for task in claimed:
+                tasks.execute(task)
+        self.assertEqual(day_orders(), 0)
+
+
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Кухня', slug='kitchen')
+        cls.a, cls.b, cls.c, cls.d = [make_product(category, name=name, stock_quantity=100)
+                                      for name in ('Кружка', 'Блюдце', 'Ложка', 'Чайник')]
+
+    def place(self, *products, status=None):
+        order, _ = checkout_service.place_order([(p.id, 1) for p in products], email='a@b.ru', address='Ульяновск')
+        if status:
+            Order.objects.filter(pk=order.pk).update(status=status)
+        return order
+
+    def snapshot(self):
+        return sorted(Recommendation.objects.values_list('product_id', 'rank', 'related_id', 'score'))
+
+    def test_full_build_counts_pairs_both_ways(self):
+        self.place(self.a, self.b)
+        self.place(self.a, self.b, self.c)
+        self.place(self.a, self.c)
+        self.place(self.b, self.c, status='cancelled')
+        recommendations.refresh(full=True)
+        self.assertEqual(recommendations.for_product(self.a.id), [self.b, self.c])
+        self.assertEqual(recommendations.for_product(self.c.id), [self.a, self.b])
+        self.assertEqual(ProductPair.objects.get(product=self.b, other=self.c).orders, 1)
+        self.assertEqual(recommendations.for_product(self.d.id), [])
+
+    def test_incremental_refresh_matches_full(self):
+        self.place(self.a, self.b)
+        self.place(self.a, self.b, self.c)
+        recommendations.refresh()
+        self.place(self.a, self.c, self.d)
+        self.place(self.a, self.c)
+        start, end = recommendations.refresh(top_k=2, batch_size=1)
+        self.assertEqual(end - start, 2)
+        self.assertEqual(recommendations.refresh(), (end, end))
+        self.assertEqual(recommendations.for_product(self.a.id), [self.c, self.b])
+        incremental = self.snapshot()
+        recommendations.refresh(full=True, top_k=2)
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_product_page_uses_one_indexed_lookup(self):
+        self.place(self.a, self.b)
+        self.place(self.a, self.c)
+        call_command('build_recommendations', stdout=StringIO())
+        Product.objects.filter(pk=self.c.pk).update(is_active=False)
+        response = self.client.get(reverse('product_detail', args=[self.a.id]))
+        self.assertEqual(response.context['related_products'], [self.b])
+        self.assertContains(response, 'С этим товаром покупают')
+        plan = Recommendation.objects.filter(product=self.a).order_by('rank').explain()
+        # Индекс уникального ограничения (product, rank), без сортировки
+        self.assertIn('USING INDEX', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class RankingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.home = Category.objects.create(name='Дом', slug='home')
+        cls.kitchen = Category.objects.create(name='Кухня', slug='kitchen', parent=cls.home)
+        cls.garden = Category.objects.create(name='Сад', slug='garden')
+        cls.cup = make_product(cls.kitchen, name='Кружка', stock_quantity=100)
+        cls.towel = make_product(cls.home, name='Полотенце', stock_quantity=100)
+        cls.can = make_product(cls.garden, name='Лейка', stock_quantity=100)
+
+    def setUp(self):
+        cache.clear()
+
+    def place(self, product, quantity, days_ago=0):
+        order, _ = checkout_service.place_order([(product.id, quantity)], email='a@b.ru', address='Ульяновск')
+        if days_ago:
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timezone.timedelta(days=days_ago))
+        tasks.run_pending()
+        return order
+
+    def test_old_sales_decay(self):
+        # 3 шт. два периода полураспада назад весят 0.75 шт. сегодня
+        self.place(self.cup, 3, days_ago=28)
+        self.place(self.towel, 1)
+        self.place(self.can, 2, days_ago=14)
+        ranking.rank()
+        self.assertEqual(ranking.top(limit=3), [self.can, self.towel, self.cup])
+        # Подкатегории входят в топ родителя
+        self.assertEqual(ranking.top(self.home.id), [self.towel, self.cup])
+        self.assertEqual(ranking.top(self.kitchen.id), [self.cup])
+
+    def test_rebuild_matches_incremental_and_drops_cancelled(self):
+        self.place(self.cup, 2, days_ago=3)
+        cancelled = self.place(self.can, 5)
+        incremental = dict(ProductSales.objects.values_list('product_id', 'score'))
+        Order.objects.filter(pk=cancelled.pk).update(status='cancelled')
+        call_command('rank_products', rebuild_counters=True, stdout=StringIO())
+        rebuilt = dict(ProductSales.objects.values_list('product_id', 'score'))
+        self.assertEqual(set(rebuilt), {self.cup.id})
+        self.assertAlmostEqual(rebuilt[self.cup.id], incremental[self.cup.id])
+        self.assertEqual(list(Bestseller.objects.filter(category=None).values_list('product_id', flat=True)),
+                         [self.cup.id])
+
+    def test_pages_read_ready_lists(self):
+        self.place(self.can, 1)
+        self.place(self.towel, 2)
+        call_command('rank_products', stdout=StringIO())
+        response = self.client.get(reverse('home'))
+        # Продаж меньше TOP_N - главную добирают новинки
+        self.assertEqual(response.context['products'], [self.towel, self.can, self.cup])
+        with self.assertNumQueries(0):
+            ranking.top()
+        response = self.client.get(reverse('catalog'), {'category': self.home.id})
+        self.assertEqual(response.context['bestsellers'], [self.towel])
+        self.assertContains(response, 'Хиты продаж')
+        response = self.client.get(reverse('catalog'), {'category': self.kitchen.id})
+        self.assertEqual(response.context['bestsellers'], [])
+
+
+class AdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_superuser('boss', 'boss@example.com', 'x')
+        category = Category.objects.create(name='Кухня', slug='kitchen')
+        cls.product = make_product(category, name='Кружка', price=Decimal('100.00'), stock_quantity=100)
+        cls.orders = []
+        for i in range(3):
+            order, _ = checkout_service.place_order([(cls.product.id, 1)], email=f'g{i}@b.ru', address='Ульяновск')
+            cls.orders.append(order)
+        cls.review = Review.objects.create(product=cls.product, user=cls.staff, comment='Ок', rating=4)
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def test_changelists_query_count_independent_of_rows(self):
+        counts = []
+        for url in ('admin:main_order_changelist', 'admin:main_order_changelist'):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.client.get(reverse(url)).status_code, 200)
+            counts.append(len(ctx))
+            for i in range(5):
+                checkout_service.place_order([(self.product.id, 2)], email='x@b.ru', address='Ульяновск')
+        self.assertEqual(counts[0], counts[1])
+        # Без date_hierarchy: нет SELECT DISTINCT по датам всей таблицы заказов
+        self.assertFalse(any('DISTINCT' in q['sql'] for q in ctx.captured_queries))
+        for url in ('admin:main_product_changelist', 'admin:main_review_changelist',
+                    'admin:main_orderitem_changelist'):
+            self.assertEqual(self.client.get(reverse(url)).status_code, 200)
+        response = self.client.get(reverse('admin:main_order_change', args=[self.orders[0].id]))
+        self.assertContains(response, 'Кружка')
+
+    def test_search_by_id(self):
+        response = self.client.get(reverse('admin:main_order_changelist'), {'q': str(self.orders[1].id)})
+        self.assertEqual(list(response.context['cl'].result_list), [self.orders[1]])
+        response = self.client.get(reverse('admin:main_product_changelist'), {'q': str(self.product.id)})
+        self.assertEqual(list(response.context['cl'].result_list), [self.product])
+        # '²' и числа больше 64 бит - не id, а обычный поиск
+        for term in ('²', '9' * 25):
+            for url in ('admin:main_order_changelist', 'admin:main_product_changelist'):
+                response = self.client.get(reverse(url), {'q': term})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(list(response.context['cl'].result_list), [])
+
+    def test_status_action_is_one_update_and_keeps_rollups(self):
+        rollups_count = lambda: DailySales.objects.get().orders
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse('admin:main_order_changelist'), {
+                'action': 'set_status_cancelled', '_selected_action': [o.id for o in self.orders[:2]]})
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "main_order"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Order.objects.filter(status='cancelled').count(), 2)
+        self.assertEqual(rollups_count(), 1)
+
+    def test_approve_reviews_updates_rating(self):
+        self.client.post(reverse('admin:main_review_changelist'), {
+            'action': 'approve', '_selected_action': [self.review.id]})
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_avg), (1, Decimal('4.00')))
+
+    def test_csv_export_uses_changelist_filters(self):
+        Order.objects.filter(pk=self.orders[0].pk).update(status='shipped')
+        response = self.client.get(reverse('admin:main_order_export'), {'status__exact': 'shipped'})
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('g0@b.ru', lines[1])
+
+    def test_estimated_count_for_unfiltered_list(self):
+        with patch.object(shop_admin, 'ESTIMATE_THRESHOLD', 1):
+            self.orders[0].delete()
+            orders = Order.objects.order_by('pk')
+            # Без фильтра - оценка по MAX(rowid) (удаление первого заказа её не меняет),
+            # с фильтром - точный COUNT
+            self.assertEqual(shop_admin.EstimatedCountPaginator(orders, 10).count, self.orders[-1].pk)
+            self.assertEqual(shop_admin.EstimatedCountPaginator(orders.filter(status='pending'), 10).count, 2)
+
+
+class CatalogImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.kitchen = Category.objects.create(name='Кухня', slug='kitchen')
+        cls.bath = Category.objects.create(name='Ванная', slug='bath')
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def write(self, name, text):
+        path = f'{self.dir}/{name}'
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def test_csv_upsert_in_batches_with_rejects(self):
+        path = self.write('catalog.csv', (
+            'sku,name,description,price,category,material,stock_quantity,is_active\n'
+            'A1,Бамбуковая щётка,,120,bath,бамбук,5,1\n'
+            'A2,Кружка,,300.5,kitchen,керамика,0,да\n'
+            'A3,Без категории,,10,garden,,0,1\n'
+            'A4,Плохая цена,,дорого,kitchen,,0,1\n'
+            'A5,Доска,,450,kitchen,дерево,2,0\n'
+            'A6,Много,,10,kitchen,,99999999999,1\n'
+            'A7,Долг,,10,kitchen,,-1,1\n'
+            'A8,Без цены,,NaN,kitchen,,0,1\n'
+        ))
+        out = StringIO()
+        call_command('import_products', path, batch_size=2, stdout=out)
+        self.assertEqual(Product.objects.count(), 3)
+        self.assertIn('строк/с', out.getvalue())
+        with open(path + '.rejects.csv', encoding='utf-8') as f:
+            rejects = f.read()
+        self.assertIn('garden', rejects)
+        self.assertIn('price: ожидается число', rejects)
+        self.assertEqual(rejects.count('stock_quantity: вне допустимого диапазона'), 2)
+        self.assertIn('A8', rejects)
+        # Побочные эффекты сигналов выполнены пакетно
+        self.assertEqual(search.search('щетка')[0], [Product.objects.get(sku='A1').id])
+        self.assertEqual(facets.get_counts(self.kitchen.id)['stock'], 0)
+
+        path = self.write('update.jsonl', (
+            '{"sku": "A1", "name": "Щётка", "price": "99", "category": "kitchen", "stock_quantity": 3}\n'
+            'не json\n'
+            '{"sku": "A9", "name": "Бездна", "price": "1", "category": "kitchen", "stock_quantity": 1e400}\n'
+            '{"sku": "A10", "name": "Дробь", "price": "1", "category": "kitchen", "stock_quantity": 2.7}\n'
+            '{"sku": "A11", "name": "Ровно", "price": "1", "category": "kitchen", "stock_quantity": 2.0}\n'
+        ))
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('import_products', path, stdout=StringIO())
+        product = Product.objects.get(sku='A1')
+        self.assertEqual((product.name, product.price, product.category_id), ('Щётка', Decimal('99.00'), self.kitchen.id))
+        self.assertEqual(facets.get_counts(self.kitchen.id)['stock'], 2)
+        # Одна плохая строка не обрывает импорт - она уходит в отказы
+        self.assertEqual(Product.objects.count(), 4)
+        self.assertEqual(Product.objects.get(sku='A11').stock_quantity, 2)
+        self.assertLess(len(ctx), 40)
+
+    def test_export_round_trip(self):
+        make_product(self.kitchen, name='Кружка', sku='K1', material='керамика')
+        make_product(self.bath, name='Мыло', sku='B1')
+        path = f'{self.dir}/export.jsonl'
+        call_command('export_products', path, category='kitchen', stdout=StringIO())
+        with open(path, encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(rows, [{'sku': 'K1', 'name': 'Кружка', 'description': 'Описание', 'price': '100.00',
+                                 'category': 'kitchen', 'material': 'керамика', 'stock_quantity': 0,
+                                 'is_active': True}])
+        call_command('import_products', path, stdout=StringIO())
+        self.assertEqual(Product.objects.count(), 2)
+
+
+class ReviewAggregateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Кухня', slug='kitchen')
+        cls.product = make_product(category)
+        cls.users = [CustomUser.objects.create_user(f'user{i}') for i in range(15)]
+
+    def review(self, user, rating, approved=True):
+        return Review.objects.create(product=self.product, user=user, rating=rating,
+                                     comment='Отлично', is_approved=approved)
+
+    def assertRating(self, count, avg):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, count)
+        self.assertEqual(self.product.rating_avg, Decimal(avg))
+
+    def test_incremental_updates(self):
+        first = self.review(self.users[0], 5)
+        pending = self.review(self.users[1], 1, approved=False)
+        self.assertRating(1, '5.00')
+        pending.is_approved = True
+        pending.save()
+        self.assertRating(2, '3.00')
+        first.rating = 4
+        first.save()
+        self.assertRating(2, '2.50')
+        first.delete()
+        pending.delete()
+        self.assertRating(0, '0.00')
+
+    def test_repair_command(self):
+        self.review(self.users[0], 4)
+        Product.objects.update(rating_count=0, rating_sum=0, rating_avg=0)
+        call_command('repair_review_stats', stdout=StringIO())
+        self.assertRating(1, '4.00')
+
+    def test_review_pages_without_n_plus_one(self):
+        for user in self.users:
+            self.review(user, 5)
+        url = reverse('product_detail', args=[self.product.id])
+        # Валидатор условного GET, товар, страница отзывов, рекомендации
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        page = response.context['reviews']
+        self.assertEqual(len(page), 10)
+        response = self.client.get(url, {'reviews_after': page.next_cursor})
+        self.assertEqual(len(response.context['reviews']), 5)
+
+
+class ProductFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.root = Category.objects.create(name='Дом', slug='home')
+        cls.kitchen = Category.objects.create(name='Кухня', slug='kitchen', parent=cls.root)
+        cls.garden = Category.objects.create(name='Сад', slug='garden')
+        cls.products = [make_product(cls.kitchen, name=f'Товар {i}') for i in range(5)]
+        make_product(cls.garden, name='Лейка')
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_with_fields_and_resume(self):
+        response = self.client.get('/api/products/', {
+            'fields': 'id,name', 'category': self.root.id, 'after': self.products[1].id})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([r['id'] for r in rows], [p.id for p in self.products[2:]])
+        self.assertEqual(set(rows[0]), {'id', 'name'})
+
+    def test_json_array_and_updated_since(self):
+        Product.objects.filter(pk=self.products[0].pk).update(updated_at='2020-01-01T00:00:00Z')
+        response = self.client.get('/api/products/', {'format': 'json', 'updated_since': '2021-01-01'})
+        rows = json.loads(self.read(response))
+        self.assertEqual(len(rows), 5)
+        self.assertIsNone(rows[0]['image'])
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get('/api/products/', {'fields': 'password'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/products/', {'updated_since': 'вчера'}).status_code, 400)
+        for params in ({'updated_since': '2024-13-45'}, {'updated_since': '2024-01-01T00:00:00+99:00'},
+                       {'category': 'kitchen'}, {'after': '9' * 30},
+                       {'updated_since': '9999-12-31T23:59:59-12:00'}, {'updated_since': '0001-01-01T00:00:00+12:00'},
+                       {'fields': ','}):
+            self.assertEqual(self.client.get('/api/products/', params).status_code, 400, params)
+        # Несуществующая категория - пустой фид, не ошибка
+        self.assertEqual(self.read(self.client.get('/api/products/', {'category': 999999})), '')
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Кухня', slug='kitchen')
+        cls.products = [make_product(cls.category, name=f'Товар {i}') for i in range(5)]
+        cls.user = CustomUser.objects.create_user('reviewer', password='x')
+        Review.objects.create(product=cls.products[0], user=cls.user, comment='Отлично',
+                              rating=5, is_approved=True)
+
+    def setUp(self):
+        page_cache.invalidate()
+
+    def get(self, path, data=None):
+        request = AsyncRequestFactory().get(path, data)
+        request.session = SessionStore()
+
+        async def auser():
+            return AnonymousUser()
+
+        request.auser = auser
+        return request
+
+    async def test_catalog_matches_sync_view(self):
+        response = await async_views.catalog(self.get('/catalog/', {'sort': 'price'}))
+        self.assertEqual(response.status_code, 200)
+        sync_response = await self.async_client.get('/catalog/', {'sort': 'price'})
+        for product in self.products:
+            self.assertContains(response, product.name)
+        self.assertEqual(response.content, sync_response.content)
+
+    async def test_product_detail_with_reviews_and_404(self):
+        response = await async_views.product_detail(self.get('/'), self.products[0].id)
+        self.assertContains(response, 'Отлично')
+        with self.assertRaises(Http404):
+            await async_views.product_detail(self.get('/'), 999999)
+
+    async def test_feed_streams_in_batches(self):
+        products = await sync_to_async(feed.build_queryset)({})
+        chunks = [chunk async for chunk in feed.astream_json(products, ('id', 'name'), chunk_size=2)]
+        rows = json.loads(''.join(chunks))
+        self.assertEqual([row['id'] for row in rows], [p.id for p in self.products])
+
+
+class SessionStoreTests(TestCase):
+    def test_unchanged_session_is_not_written(self):
+        store = sessions.SessionStore()
+        store['guest_cart_id'] = 1
+        store.save()
+
+        store = sessions.SessionStore(store.session_key)
+        store['guest_cart_id'] = 1
+        with self.assertNumQueries(0):
+            store.save()
+
+        store['guest_cart_id'] = 2
+        with CaptureQueriesContext(connection) as queries:
+            store.save()
+        self.assertTrue(any('UPDATE' in q['sql'] for q in queries.captured_queries))
+        # Данные в БД актуальны и без кэша
+        cache.clear()
+        self.assertEqual(sessions.SessionStore(store.session_key)['guest_cart_id'], 2)
+
+    def test_process_local_cache_is_not_trusted(self):
+        store = sessions.SessionStore()
+        store['guest_cart_id'] = 1
+        store.save()
+        # Выход обработал другой процесс: в БД сессии уже нет, а LocMemCache
+        # этого процесса об этом не знает
+        Session.objects.filter(session_key=store.session_key).delete()
+        self.assertNotIn('guest_cart_id', sessions.SessionStore(store.session_key))
+        self.assertFalse(sessions.SessionStore().exists(store.session_key))
+
+    def test_cleanup_removes_expired_sessions_and_guest_carts(self):
+        past = timezone.now() - timezone.timedelta(days=1)
+        future = timezone.now() + timezone.timedelta(days=1)
+        category = Category.objects.create(name='Кухня', slug='kitchen')
+        product = make_product(category)
+        for i in range(5):
+            Session.objects.create(session_key=f'old{i}', session_data='', expire_date=past)
+            cart = Cart.objects.create(session_key=f'old{i}')
+            CartItem.objects.create(cart=cart, product=product)
+        Session.objects.create(session_key='live', session_data='', expire_date=future)
+        live_cart = Cart.objects.create(session_key='live')
+        user_cart = Cart.objects.create(user=CustomUser.objects.create_user('buyer'), session_key='old0')
+
+        call_command('cleanup_sessions', batch_size=2, pause=0, stdout=StringIO())
+
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+        self.assertEqual(set(Cart.objects.values_list('pk', flat=True)), {live_cart.pk, user_cart.pk})
+        self.assertFalse(CartItem.objects.exists())
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Кухня', slug='kitchen')
+        cls.product = make_product(cls.category, name='Кружка', stock_quantity=10)
+        cls.user = CustomUser.objects.create_user('reviewer', password='x')
+
+    def revalidate(self, url, response, **data):
+        return self.client.get(url, data, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_catalog_304_skips_rendering(self):
+        url = reverse('catalog')
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('Last-Modified'))
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('s-maxage=60', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+        with self.assertNumQueries(1):
+            again = self.revalidate(url, response)
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.templates, [])
+        self.assertEqual(again['ETag'], response['ETag'])
+
+        self.category.name = 'Кухня и столовая'
+        self.category.save()
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_validators_follow_deletes(self):
+        old = '2020-01-01T00:00:00Z'
+        older = make_product(self.category, name='Старая кружка')
+        leaf = Category.objects.create(name='Пустая', slug='empty')
+        first = Review.objects.create(product=self.product, user=self.user, comment='Ок', rating=4, is_approved=True)
+        Review.objects.create(product=self.product, user=self.user, comment='Хорошо', rating=5, is_approved=True)
+        Product.objects.filter(pk=older.pk).update(updated_at=old)
+        Review.objects.filter(pk=first.pk).update(updated_at=old)
+        catalog_url = reverse('catalog')
+        product_url = reverse('product_detail', args=[self.product.id])
+        # Удаляются не самые свежие строки - без touch_catalog MAX(updated_at) остался бы прежним
+        for delete in (lambda: Product.objects.filter(pk=older.pk).delete(),
+                       lambda: Category.objects.filter(pk=leaf.pk).delete()):
+            Category.objects.filter(pk=leaf.pk).update(updated_at=old)
+            catalog = self.client.get(catalog_url)
+            delete()
+            self.assertEqual(self.revalidate(catalog_url, catalog).status_code, 200)
+        product = self.client.get(product_url)
+        Review.objects.filter(pk=first.pk).delete()
+        self.assertEqual(self.revalidate(product_url, product).status_code, 200)
+        # Валидатор каталога - по-прежнему один запрос
+        with self.assertNumQueries(1):
+            http_cache.catalog_stamp(RequestFactory().get(catalog_url))
+
+    def test_product_validator_follows_reviews_and_stock(self):
+        url = reverse('product_detail', args=[self.product.id])
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+        review = Review.objects.create(product=self.product, user=self.user, comment='Ок', rating=4)
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+        # Одобрение в админке - UPDATE без save(), но updated_at меняется
+        shop_admin.ReviewAdmin(Review, shop_admin.admin.site)._set_approved(
+            None, Review.objects.filter(pk=review.pk), True)
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+        response = self.client.get(url)
+        reservations.hold(Cart.objects.create(session_key='other'), {self.product.id: 3})
+        response = self.revalidate(url, response)
+        self.assertEqual(response.status_code, 200)
+        # Товар - из кэша страниц, остатки - свежие, вместе с валидатором
+        self.assertEqual(response.context['product'].available, 7)
+        self.assertContains(response, 'В наличии (7 шт.)')
+        reservations.hold(Cart.objects.create(session_key='all'), {self.product.id: 7})
+        self.assertNotContains(self.client.get(url), 'В наличии')
+        self.assertEqual(self.client.get(reverse('product_detail', args=[999999])).status_code, 404)
+
+    def test_logged_in_pages_are_private(self):
+        url = reverse('catalog')
+        anonymous = self.client.get(url)
+        self.client.force_login(self.user)
+        response = self.client.get(url)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotEqual(response['ETag'], anonymous['ETag'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=anonymous['ETag']).status_code, 200)
+
+    def test_pages_with_csrf_token_are_private(self):
+        # Страница товара содержит форму с {% csrf_token %} и ставит cookie csrftoken
+        response = self.client.get(reverse('product_detail', args=[self.product.id]))
+        self.assertIn('csrftoken', response.cookies)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotIn('public', response['Cache-Control'])
+        # Повторно, уже с cookie: токен в странице всё равно личный
+        response = self.client.get(reverse('product_detail', args=[self.product.id]))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('public', self.client.get(reverse('catalog'))['Cache-Control'])
+
+    async def test_async_views_answer_304(self):
+        request = AsyncRequestFactory().get('/')
+        request.session = SessionStore()
+        request.auser = sync_to_async(AnonymousUser)
+        response = await async_views.product_detail(request, self.product.id)
+        self.assertEqual(response.status_code, 200)
+        request = AsyncRequestFactory().get('/', headers={'If-None-Match': response['ETag']})
+        self.assertEqual((await async_views.product_detail(request, self.product.id)).status_code, 304)
+
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Кухня', slug='kitchen')
+        cls.product = make_product(cls.category, name='Кружка')
+
+    def test_pages_served_from_cache_until_catalog_changes(self):
+        url = reverse('product_detail', args=[self.product.id])
+        self.client.get(url)
+        self.client.get(reverse('home'))
+        # Только валидатор условного GET страницы товара
+        with self.assertNumQueries(1):
+            self.client.get(url)
+            self.client.get(reverse('home'))
+        self.product.name = 'Чашка'
+        self.product.save()
+        self.assertContains(self.client.get(url), 'Чашка')
+        self.assertContains(self.client.get(reverse('home')), 'Чашка')
+
+    def test_stale_value_served_while_rebuilding(self):
+        key = page_cache.make_key('test', 'stale')
+        page_cache.get_or_build(key, lambda: 'old')
+        page_cache.invalidate()
+        cache.add(key + ':lock', 1)
+        try:
+            self.assertEqual(page_cache.get_or_build(key, lambda: 'new'), 'old')
+        finally:
+            cache.delete(key + ':lock')
+        self.assertEqual(page_cache.get_or_build(key, lambda: 'new'), 'new')
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class ImageDerivativeTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def make_upload(self):
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 900), '#2E8B57').save(buffer, 'JPEG')
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_placeholder_is_local(self):
+        category = Category.objects.create(name='Кухня', slug='kitchen')
+        make_product(category)
+        response = self.client.get(reverse('catalog'))
+        self.assertNotContains(response, 'via.placeholder.com')
+        self.assertContains(response, 'placeholder.svg')
+
+    def test_derivatives_generated_after_upload(self):
+        category = Category.objects.create(name='Кухня', slug='kitchen')
+        with self.captureOnCommitCallbacks() as callbacks:
+            product = make_product(category, image=self.make_upload())
+        with patch('main.images.schedule') as schedule:
+            for callback in callbacks:
+                callback()
+        schedule.assert_called_once_with(product.image.name)
+
+        images.generate(product.image.name)
+        with Image.open(images.derivative_path(product.image.name, 'card', 2, 'webp')) as card:
+            self.assertEqual(card.size, (600, 400))
+        with Image.open(images.derivative_path(product.image.name, 'detail', 1, 'jpg')) as detail:
+            self.assertEqual(detail.size, (600, 450))
+        response = self.client.get(reverse('product_detail', args=[product.id]))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, '@2x.webp 2x')
+
+
+class StaticPipelineTests(TestCase):
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp(prefix='ecohome-static-')
+        self.addCleanup(shutil.rmtree, self.static_root, ignore_errors=True)
+        storages = {
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'main.storage.CompressedManifestStaticFilesStorage'},
+        }
+        override = override_settings(STATIC_ROOT=self.static_root, STORAGES=storages)
+        override.enable()
+        self.addCleanup(override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_hashed_and_precompressed(self):
+        url = static('main/css/style.css')
+        self.assertRegex(url, r'style\.[0-9a-f]{12}\.css$')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        body = gzip.decompress(b''.join(response.streaming_content))
+        with open(finders.find('main/css/style.css'), 'rb') as f:
+            self.assertEqual(body, f.read())
+
+    def test_unhashed_name_and_identity_encoding(self):
+        response = self.client.get('/static/main/js/main.js')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=300')
+        self.assertEqual(self.client.get('/static/../manage.py').status_code, 404)
+
+    def test_accept_encoding_q_values(self):
+        self.assertEqual(middleware.accepted_encodings('gzip;q=0, deflate'), {'deflate'})
+        self.assertEqual(middleware.accepted_encodings('*;q=0.5, br;q=0'), {'*', 'gzip'})
+        self.assertEqual(middleware.accepted_encodings('GZIP; q=0.8'), {'gzip'})
+        url = static('main/css/style.css')
+        for header in ('gzip;q=0', 'gzip;q=0.0, br;q=0', 'identity'):
+            self.assertNotIn('Content-Encoding', self.client.get(url, HTTP_ACCEPT_ENCODING=header), header)
+
+
+class PerformanceRegressionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed.generate('tiny', seed=1, prefix='t')
+
+    def test_every_route_has_budget_and_case(self):
+        from .urls import urlpatterns
+
+        names = {pattern.name for pattern in urlpatterns if pattern.name}
+        cases = benchmark.route_cases(*benchmark.sample_ids())
+        self.assertEqual(names - set(benchmark.QUERY_BUDGETS), set())
+        self.assertEqual(names - set(cases), set())
+
+    @override_settings(ALLOWED_HOSTS=['localhost'])
+    def test_query_budgets(self):
+        cases = benchmark.route_cases(*benchmark.sample_ids())
+        results = benchmark.run_routes(cases, benchmark.bench_users(), 1, cold=True)
+        for name, result in results.items():
+            with self.subTest(route=name):
+                self.assertEqual(result['errors'], 0)
+                self.assertLessEqual(result['max_queries'], benchmark.QUERY_BUDGETS[name])
+
+    def test_seed_is_deterministic(self):
+        self.assertEqual(Product.objects.filter(sku__startswith='t-').count(), 60)
+        first = list(Product.objects.filter(sku__startswith='t-').order_by('sku').values_list('name', 'price')[:10])
+        Product.objects.filter(sku__startswith='t-').delete()
+        Category.objects.filter(slug__startswith='t-').delete()
+        CustomUser.objects.filter(username__startswith='t-').delete()
+        seed.generate('tiny', seed=1, prefix='t')
+        again = list(Product.objects.filter(sku__startswith='t-').order_by('sku').values_list('name', 'price')[:10])
+        self.assertEqual(first, again)
+
+    def test_compare_flags_regressions(self):
+        previous = {'home': {'p95_ms': 10.0, 'max_queries': 2}, 'cart': {'p95_ms': 10.0, 'max_queries': 3}}
+        current = {'home': {'p95_ms': 13.0, 'max_queries': 2}, 'cart': {'p95_ms': 10.5, 'max_queries': 4},
+                   'about': {'p95_ms': 1.0, 'max_queries': 0}}
+        flags = {row[0]: row[-1] for row in benchmark.compare(previous, current)}
+        self.assertEqual(flags, {'home': True, 'cart': True, 'about': False})
+
+    def test_bench_routes_fails_on_regression(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = f'{directory}/previous.json'
+        with open(path, 'w') as f:
+            json.dump({'routes': {'home': {'p95_ms': 1e-6, 'max_queries': -1}}}, f)
+        with self.assertRaisesMessage(CommandError, 'home'):
+            call_command('bench_routes', routes=['home'], iterations=2, compare=path,
+                         fail_on_regression=True, stdout=StringIO())
+
+
+class InstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Кухня', slug='kitchen')
+        Product.objects.create(name='Кружка', price=Decimal('100'), category=category)
+
+    def setUp(self):
+        # Страница каталога не должна прийти из кэша без запросов к БД
+        cache.clear()
+
+    @override_settings(PERF_SAMPLE_RATE=1)
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('catalog'))
+        metrics = dict(part.split(';', 1)[0:2] for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(metrics), {'db', 'tpl', 'view', 'total'})
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertNotEqual(metrics['tpl'], 'dur=0.0')
+
+    @override_settings(PERF_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_untouched(self):
+        response = self.client.get(reverse('catalog'))
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(PERF_SAMPLE_RATE=1, PERF_SLOW_QUERY_MS=0)
+    def test_slow_queries_logged_with_route(self):
+        with self.assertLogs('main.performance', 'WARNING') as logs:
+            self.client.get(reverse('catalog'))
+        self.assertIn('маршрут catalog', logs.output[0])
+
+    def test_route_percentiles_flushed(self):
+        routes = instrumentation.RouteAggregates(interval=3600, max_samples=10)
+        stats = instrumentation.RequestStats(100)
+        stats.queries, stats.db = 3, 0.002
+        for i in range(1, 101):
+            routes.add('catalog', i / 1000, stats)
+        with self.assertLogs('main.performance.routes', 'INFO') as logs:
+            routes.flush()
+        row = json.loads(logs.records[0].getMessage())
+        self.assertEqual((row['route'], row['requests'], row['queries_max']), ('catalog', 100, 3))
+        self.assertLessEqual(row['p50_ms'], row['p95_ms'])
+        self.assertEqual(routes.samples, {})
+
+
+class DatabaseProfileTests(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_only_with_tuning_enabled(self):
+        # По умолчанию (разработка, тесты) - режим SQLite без изменений;
+        # ожидание блокировки даёт OPTIONS['timeout']
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('synchronous'), 2)
+        # Внутри транзакции теста PRAGMA не поменять - смотрим, что выполнилось бы
+        for tuning, executed in ((False, []), (True, [f'PRAGMA {n} = {v}' for n, v in db.PRAGMAS])):
+            fake = MagicMock(vendor='sqlite', alias='default')
+            with override_settings(SQLITE_TUNING=tuning):
+                db.configure_sqlite(fake)
+            cursor = fake.cursor.return_value.__enter__.return_value
+            self.assertEqual([c.args[0] for c in cursor.execute.call_args_list], executed)
+
+    def test_catalog_reads_routed_to_read_connection(self):
+        router = db.CatalogReadRouter()
+        # Внутри транзакции (TestCase) всё читается из основной базы
+        self.assertEqual(router.db_for_read(Product), 'default')
+        with patch.object(connections['default'], 'in_atomic_block', False):
+            self.assertEqual(router.db_for_read(Product), db.READ_ALIAS)
+            self.assertEqual(router.db_for_read(Review), db.READ_ALIAS)
+            self.assertIsNone(router.db_for_read(Order))
+        self.assertEqual(router.db_for_write(Product), 'default')
+        self.assertFalse(router.allow_migrate(db.READ_ALIAS, 'main'))
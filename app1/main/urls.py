@@ -1,16 +1,31 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# Под ASGI страницы каталога обслуживают асинхронные версии
+if settings.ASYNC_VIEWS:
+    from . import async_views as read_views
+else:
+    read_views = views
+
 urlpatterns = [
-    path('', views.home, name='home'),
-    path('catalog/', views.catalog, name='catalog'),
-    path('product/<int:product_id>/', views.product_detail, name='product_detail'),
+    path('', read_views.home, name='home'),
+    path('catalog/', read_views.catalog, name='catalog'),
+    path('product/<int:product_id>/', read_views.product_detail, name='product_detail'),
+    path('search/', views.search_view, name='search'),
     path('register/', views.register, name='register'),
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
     path('cart/', views.cart, name='cart'),
+    path('api/products/', read_views.api_products, name='api_products'),
+    path('api/cart/', views.api_cart, name='api_cart'),
+    path('api/cart/add/', views.api_cart_add, name='api_cart_add'),
+    path('api/cart/update/', views.api_cart_update, name='api_cart_update'),
+    path('api/cart/remove/', views.api_cart_remove, name='api_cart_remove'),
+    path('api/cart/sync/', views.api_cart_sync, name='api_cart_sync'),
     path('profile/', views.profile, name='profile'),
     path('about/', views.about, name='about'),
     path('contacts/', views.contacts, name='contacts'),
     path('checkout/', views.checkout, name='checkout'),
+    path('dashboard/', views.admin_panel, name='admin_panel'),
 ]
\ No newline at end of file
@@ -4,9 +4,20 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
 from django.contrib import messages
 from django import forms
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+from django.urls import reverse
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Prefetch, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
 import json
-from .models import Product, Category, Review, Order, OrderItem
+import uuid
+from . import cart as cart_service, category_tree, checkout as checkout_service, facets, feed, http_cache, page_cache, ranking, recommendations, search, tasks
+from .models import Product, Category, Review, Order, OrderItem, DailySales, CategoryDailySales
+from .pagination import DEFAULT_SORT, SORT_ORDERS, keyset_paginate
 
 # Получаем модель пользователя
 User = get_user_model()
@@ -33,29 +44,127 @@ class RussianAuthForm(AuthenticationForm):
 
 # Основные view
 def home(request):
-    products = Product.objects.filter(is_active=True)[:8]
-    return render(request, 'home.html', {'products': products})
+    # Готовый топ продаж (main/ranking.py), без сортировки по заказам на лету
+    return render(request, 'home.html', {'products': ranking.top()})
 
+CATALOG_PAGE_SIZE = 24
+BESTSELLERS_COUNT = 3
+SORT_LABELS = {'new': 'Новинки', 'price': 'Дешевле', '-price': 'Дороже'}
+
+def _catalog_url(request, **changes):
+    """Ссылка на каталог с текущими параметрами, кроме изменённых (None - убрать)."""
+    params = request.GET.copy()
+    params.pop('after', None)
+    for key, value in changes.items():
+        if value is None:
+            params.pop(key, None)
+        else:
+            params[key] = value
+    query = params.urlencode()
+    return '?' + query if query else reverse('catalog')
+
+def _facet_links(request, filters, counts):
+    materials = [
+        {'label': value, 'count': n, 'active': filters['material'] == value,
+         'url': _catalog_url(request, material=None if filters['material'] == value else value)}
+        for value, n in counts['material']
+    ]
+    prices = [
+        {'label': label, 'count': counts['price'].get(key, 0), 'active': filters['price'] == key,
+         'url': _catalog_url(request, price=None if filters['price'] == key else key)}
+        for key, label, _, _ in facets.PRICE_BUCKETS
+    ]
+    in_stock = {'count': counts['stock'], 'active': filters['in_stock'],
+                'url': _catalog_url(request, in_stock=None if filters['in_stock'] else '1')}
+    return {'materials': materials, 'prices': prices, 'in_stock': in_stock}
+
+@http_cache.conditional(http_cache.catalog_stamp)
 def catalog(request):
     category_id = request.GET.get('category')
+    sort = request.GET.get('sort', DEFAULT_SORT)
+    if sort not in SORT_ORDERS:
+        sort = DEFAULT_SORT
+    filters = facets.parse_filters(request.GET)
     
+    tree = category_tree.get_tree()
+    category = tree.get(category_id)
     if category_id:
-        products = Product.objects.filter(category_id=category_id, is_active=True)
+        # Товары всей ветки: id потомков берём из закэшированного дерева
+        products = Product.objects.filter(category_id__in=tree.descendant_ids(category_id), is_active=True)
     else:
         products = Product.objects.filter(is_active=True)
+    products = facets.apply_filters(products, filters)
+    
+    field, descending = SORT_ORDERS[sort]
+    cursor = request.GET.get('after')
+    page = page_cache.get_or_build(
+        page_cache.make_key('catalog', category_id, sort, filters['price'], filters['material'],
+                            filters['in_stock'], cursor),
+        lambda: keyset_paginate(products, field, descending, cursor=cursor, per_page=CATALOG_PAGE_SIZE),
+    )
     
-    categories = Category.objects.all()
     return render(request, 'catalog.html', {
-        'products': products,
-        'categories': categories
+        'products': page,
+        'page': page,
+        'sort': sort,
+        'sort_links': [
+            {'label': SORT_LABELS[key], 'url': _catalog_url(request, sort=key), 'active': key == sort}
+            for key in SORT_ORDERS
+        ],
+        'first_page_url': _catalog_url(request),
+        'next_page_url': _catalog_url(request, after=page.next_cursor) if page.has_next else None,
+        'filters': filters,
+        'facets': _facet_links(request, filters, facets.get_counts(category_id)),
+        'categories': tree.ordered(),
+        # Хиты ветки - только над первой страницей категории
+        'bestsellers': ranking.top(category['id'], BESTSELLERS_COUNT) if category and not cursor else [],
     })
 
+REVIEWS_PAGE_SIZE = 10
+
+@http_cache.conditional(http_cache.product_stamp)
 def product_detail(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
-    reviews = Review.objects.filter(product=product, is_approved=True)
+    cursor = request.GET.get('reviews_after')
+    
+    def build():
+        product = get_object_or_404(Product.objects.select_related('category'), id=product_id)
+        reviews = keyset_paginate(
+            Review.objects.filter(product=product, is_approved=True).select_related('user'),
+            'created_at', True, cursor=cursor, per_page=REVIEWS_PAGE_SIZE,
+        )
+        # Рекомендации пересчитывает build_recommendations по расписанию -
+        # отставание кэша страницы на DEFAULT_TIMEOUT им не страшно
+        return product, reviews, recommendations.for_product(product.id)
+    
+    product, reviews, related = page_cache.get_or_build(page_cache.make_key('product', product_id, cursor), build)
+    product.stock_quantity, product.reserved = http_cache.product_stock(request, product.pk) or (0, 0)
     return render(request, 'product.html', {
         'product': product,
-        'reviews': reviews
+        'reviews': reviews,
+        'related_products': related,
+    })
+
+SEARCH_PAGE_SIZE = 24
+# Дальше результаты поиска не листаются (и OFFSET не переполняется)
+SEARCH_MAX_PAGE = 100
+
+def search_view(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        page = min(max(int(request.GET.get('page', 1)), 1), SEARCH_MAX_PAGE)
+    except ValueError:
+        page = 1
+    
+    # Ранжирование и отбор - в индексе FTS5, из таблицы товаров берём только найденные id
+    ids, has_next = search.search(query, limit=SEARCH_PAGE_SIZE, offset=(page - 1) * SEARCH_PAGE_SIZE)
+    found = Product.objects.filter(is_active=True).in_bulk(ids)
+    products = [found[pk] for pk in ids if pk in found]
+    
+    return render(request, 'search.html', {
+        'query': query,
+        'products': products,
+        'page_number': page,
+        'has_next': has_next,
     })
 
 def about(request):
@@ -65,41 +174,129 @@ def contacts(request):
     return render(request, 'contacts.html')
 
 def cart(request):
-    cart_items = []
-    total_price = 0
+    user_cart = cart_service.get_cart(request)
     return render(request, 'cart.html', {
-        'cart_items': cart_items,
-        'total_price': total_price
+        'cart_items': cart_service.get_items(user_cart),
+        'total_price': cart_service.get_totals(user_cart)['total_price'],
+        # Ключ защищает от двойной отправки формы заказа
+        'checkout_key': uuid.uuid4().hex
     })
 
-# Оформление заказа (упрощённая версия)
-def checkout(request):
-    if request.method == 'POST':
+# JSON API корзины
+def _read_json(request):
+    if request.content_type == 'application/json':
         try:
-            name = request.POST.get('name', '')
-            email = request.POST.get('email', '')
-            address = request.POST.get('address', '')
-            
-            order_number = str(abs(hash(name + email + str(request.user.id if request.user.is_authenticated else ''))))[-6:]
-            
-            messages.success(request, 
-                f'✅ Заказ оформлен! {name}, мы свяжемся с вами по email {email}. ' +
-                f'Номер заказа: #{order_number}'
-            )
-            
-            return redirect('home')
-            
-        except Exception as e:
-            messages.error(request, f'Ошибка при оформлении заказа: {str(e)}')
-            return redirect('cart')
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            raise cart_service.CartError('Некорректный JSON')
+        if not isinstance(data, dict):
+            raise cart_service.CartError('Ожидается JSON-объект')
+        return data
+    return request.POST
+
+def _cart_api(handler):
+    """Общая обвязка для POST-методов корзины: разбор тела, ошибки, ответ с корзиной."""
+    @require_POST
+    def view(request):
+        try:
+            data = _read_json(request)
+            user_cart = cart_service.get_cart(request, create=True)
+            handler(user_cart, data)
+        except cart_service.CartError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse(cart_service.serialize(user_cart))
+    view.__name__ = handler.__name__
+    return view
+
+def api_cart(request):
+    return JsonResponse(cart_service.serialize(cart_service.get_cart(request)))
+
+@_cart_api
+def api_cart_add(user_cart, data):
+    cart_service.add(user_cart, data.get('product_id'), data.get('quantity', 1))
+
+@_cart_api
+def api_cart_update(user_cart, data):
+    cart_service.set_quantity(user_cart, data.get('product_id'), data.get('quantity'))
+
+@_cart_api
+def api_cart_remove(user_cart, data):
+    cart_service.remove(user_cart, data.get('product_id'))
+
+@_cart_api
+def api_cart_sync(user_cart, data):
+    items = data.get('items')
+    if not isinstance(items, list):
+        raise cart_service.CartError('Ожидается список items')
+    try:
+        pairs = [(item['product_id'], item.get('quantity', 1)) for item in items]
+    except (TypeError, KeyError, AttributeError):
+        raise cart_service.CartError('Каждая позиция должна содержать product_id')
+    cart_service.sync(user_cart, pairs, replace=bool(data.get('replace')))
+
+# Оформление заказа
+@require_POST
+def checkout(request):
+    name = request.POST.get('name', '').strip()
+    email = request.POST.get('email', '').strip()
+    address = request.POST.get('address', '').strip()
+    phone = request.POST.get('phone', '').strip()[:20]
+    
+    if not address or (not request.user.is_authenticated and not email):
+        messages.error(request, 'Укажите email и адрес доставки')
+        return redirect('cart')
     
-    return redirect('cart')
+    user_cart = cart_service.get_cart(request)
+    try:
+        lines = checkout_service.cart_lines(user_cart)
+        if not lines and request.POST.get('cart_data'):
+            # Старые клиенты присылают корзину из localStorage в скрытом поле
+            lines = checkout_service.parse_cart_data(request.POST['cart_data'])
+        order, created = checkout_service.place_order(
+            lines,
+            user=request.user if request.user.is_authenticated else None,
+            name=name,
+            email=email,
+            address=address,
+            phone=phone,
+            idempotency_key=request.POST.get('checkout_key'),
+            cart=user_cart,
+        )
+    except checkout_service.CheckoutError as e:
+        messages.error(request, f'Ошибка при оформлении заказа: {e}')
+        return redirect('cart')
+    
+    if created:
+        messages.success(request, 
+            f'✅ Заказ оформлен! {name}, мы свяжемся с вами по email {email}. ' +
+            f'Номер заказа: #{order.id}'
+        )
+    else:
+        messages.info(request, f'Заказ #{order.id} уже оформлен')
+    return redirect('home')
 
 # Личный кабинет
+ORDERS_PAGE_SIZE = 10
+
+def _order_history(user, cursor):
+    """Страница заказов пользователя: итоги - подзапросами в том же запросе, позиции - одним prefetch."""
+    items = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+    orders = (
+        Order.objects.filter(user=user)
+        .annotate(
+            item_count=Coalesce(Subquery(items.annotate(n=Sum('quantity')).values('n')), 0),
+            items_total=Coalesce(
+                Subquery(items.annotate(total=Sum(F('quantity') * F('unit_price'))).values('total'),
+                         output_field=DecimalField(max_digits=12, decimal_places=2)),
+                Decimal('0'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+        )
+        .prefetch_related(Prefetch('items', queryset=OrderItem.objects.select_related('product').order_by('pk')))
+    )
+    # Индекс (user_id, created_at) отдаёт заказы уже в нужном порядке - без сортировки всей истории
+    return keyset_paginate(orders, 'created_at', True, cursor=cursor, per_page=ORDERS_PAGE_SIZE)
+
 @login_required
 def profile(request):
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
-    
     if request.method == 'POST':
         user = request.user
         user.first_name = request.POST.get('first_name', '')
@@ -109,7 +306,7 @@ def profile(request):
         return redirect('profile')
     
     return render(request, 'profile.html', {
-        'orders': orders,
+        'orders': _order_history(request.user, request.GET.get('orders_after')),
         'user': request.user
     })
 
@@ -138,7 +335,9 @@ def register(request):
     if request.method == 'POST':
         form = CustomUserCreationForm(request.POST)  # Используем кастомную форму
         if form.is_valid():
-            user = form.save()
+            with transaction.atomic():
+                user = form.save()
+                tasks.enqueue('welcome_email', user_id=user.pk)
             login(request, user)
             messages.success(request, 'Регистрация прошла успешно!')
             return redirect('home')
@@ -152,21 +351,53 @@ def logout_view(request):
     messages.info(request, 'Вы успешно вышли из системы')
     return redirect('home')
 
+DASHBOARD_PERIODS = (7, 30, 90)
+
 @login_required
 def admin_panel(request):
     if not request.user.is_staff:
         return redirect('home')
     
-    total_products = Product.objects.count()
-    total_orders = Order.objects.count()
-    total_users = User.objects.count()  # Используем User, полученный в начале
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        days = 30
+    if days not in DASHBOARD_PERIODS:
+        days = 30
+    since = timezone.localdate() - timedelta(days=days - 1)
+    
+    # Только витрина продаж (main/rollups.py) - таблицы заказов не читаем
+    daily = list(DailySales.objects.filter(day__gte=since).order_by('-day'))
+    by_category = (
+        CategoryDailySales.objects.filter(day__gte=since)
+        .values('category_id', 'category__name')
+        .annotate(orders=Sum('orders'), units=Sum('units'), revenue=Sum('revenue'))
+        .order_by('-revenue')
+    )
     
     return render(request, 'admin.html', {
-        'total_products': total_products,
-        'total_orders': total_orders,
-        'total_users': total_users
+        'days': days,
+        'periods': DASHBOARD_PERIODS,
+        'daily': daily,
+        'by_category': by_category,
+        'total_orders': sum(row.orders for row in daily),
+        'total_units': sum(row.units for row in daily),
+        'total_revenue': sum((row.revenue for row in daily), Decimal('0')),
     })
 
+# Фид товаров: потоковая выгрузка NDJSON/JSON
 def api_products(request):
-    products = Product.objects.filter(is_active=True).values('id', 'name', 'price', 'image')
-    return JsonResponse(list(products), safe=False)
\ No newline at end of file
+    output = request.GET.get('format', 'ndjson')
+    if output not in ('ndjson', 'json'):
+        return JsonResponse({'error': 'format: ndjson или json'}, status=400)
+    try:
+        fields = feed.parse_fields(request.GET.get('fields'))
+        products = feed.build_queryset(request.GET)
+    except feed.FeedError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    if output == 'json':
+        return StreamingHttpResponse(feed.stream_json(products, fields),
+                                     content_type='application/json; charset=utf-8')
+    return StreamingHttpResponse(feed.stream_ndjson(products, fields),
+                                 content_type='application/x-ndjson; charset=utf-8')
\ No newline at end of file